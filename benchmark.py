@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""Banco de pruebas de rendimiento de la capa Database de in02.
+
+Genera una base SQLite temporal con datos sintéticos (equipos, repuestos,
+movimientos y recargas de toner, auditoría) en los volúmenes indicados,
+mide cada método obtener_*, las escrituras y los exportadores de
+ExportManager, e informa p50/p95 y RSS pico en JSON.
+
+Los datos dependen solo de la semilla y de la fecha final, así que dos
+corridas con los mismos parámetros son comparables:
+
+    python benchmark.py --equipos 20000 --salida base.json
+    python benchmark.py --equipos 20000 --salida actual.json --comparar base.json
+
+Con --comparar el proceso termina con código 1 si algún caso empeoró su
+p95 más allá de la tolerancia.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+# Distribuciones aproximadas del inventario real (nombre -> peso)
+TIPOS = {"CPU": 45, "Impresora": 25, "Monitor": 18, "Switch": 4, "Router": 3, "Otro": 5}
+MARCAS = {"HP": 35, "Lenovo": 25, "Dell": 20, "Epson": 8, "Brother": 7, "Otro": 5}
+ESTADOS = {"Reparado": 70, "En reparación": 20, "Irreparable": 10}
+FALLAS = ["No enciende", "Pantalla azul", "Atasco de papel", "Sin imagen", "Disco dañado",
+          "Lentitud", "No imprime", "Ruido en ventilador", "Fuente quemada", "Sin red"]
+REPUESTOS = {"Memoria RAM": 8500.0, "Disco SSD": 22000.0, "Fuente": 15000.0, "Cable SATA": 900.0,
+             "Fusor": 38000.0, "Rodillo": 6000.0, "Teclado": 7000.0, "Pasta térmica": 1500.0}
+UBICACIONES = [f"{dependencia} N° {n}" for dependencia in
+               ("Juzgado Civil", "Juzgado Penal", "Fiscalía", "Defensoría", "Mesa de Entradas")
+               for n in range(1, 9)]
+SECTORES = ["Administración", "Despacho", "Secretaría", "Archivo", "Mesa de Entradas"]
+MARCAS_TONER = {"HP": ["CF258A", "CF226A", "CE285A", "CF283A", "W1105A"],
+                "Brother": ["TN-1060", "TN-2370", "TN-660"],
+                "Samsung": ["MLT-D111S", "MLT-D101S"],
+                "Lexmark": ["50F4H00", "56F4H00"]}
+ACCIONES = ["ALTA_EQUIPO", "ACTUALIZAR_EQUIPO", "ACTUALIZAR_ESTADO", "ALTA_REPUESTO",
+            "MOVIMIENTO_TONER", "LOGIN"]
+
+
+def elegir(rng, pesos):
+    """Elige una clave de un diccionario nombre -> peso"""
+    return rng.choices(list(pesos), weights=list(pesos.values()))[0]
+
+
+def rss_pico_kb():
+    """RSS máximo del proceso en KB, o None si la plataforma no lo informa"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset // 1024
+        except (ImportError, AttributeError):
+            return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico // 1024 if sys.platform == "darwin" else pico
+
+
+def percentil(valores_ordenados, q):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    indice = max(0, math.ceil(q * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+class GeneradorDatos:
+    """Carga datos sintéticos reproducibles en la base de in02.
+
+    Inserta directamente con executemany dentro de db.transaction() (sin
+    auditoría por fila) para que generar volúmenes grandes no domine el
+    tiempo de la corrida.
+    """
+
+    def __init__(self, db, semilla, fecha_fin, años):
+        self.db = db
+        self.rng = random.Random(semilla)
+        self.fecha_fin = fecha_fin
+        self.fecha_inicio = fecha_fin - timedelta(days=365 * años)
+        self.dias = (fecha_fin - self.fecha_inicio).days
+        self.usuario_id = db.conn.execute(
+            "SELECT id FROM usuarios WHERE username='admin'").fetchone()[0]
+
+    def _fecha(self):
+        return self.fecha_inicio + timedelta(days=self.rng.randrange(self.dias))
+
+    def _marcas_y_modelos(self):
+        """Asegura las marcas y crea entre 3 y 12 modelos por marca"""
+        modelos = {}
+        with self.db.transaction():
+            for marca in MARCAS:
+                self.db.cursor.execute("INSERT OR IGNORE INTO marcas (nombre) VALUES (?)", (marca,))
+                id_marca = self.db.conn.execute(
+                    "SELECT id FROM marcas WHERE nombre=?", (marca,)).fetchone()[0]
+                ids = []
+                for n in range(self.rng.randint(3, 12)):
+                    self.db.cursor.execute(
+                        "INSERT OR IGNORE INTO modelos (id_marca, nombre) VALUES (?, ?)",
+                        (id_marca, f"{marca} {1000 + n * 10}"))
+                    ids.append(self.db.conn.execute(
+                        "SELECT id FROM modelos WHERE id_marca=? AND nombre=?",
+                        (id_marca, f"{marca} {1000 + n * 10}")).fetchone()[0])
+                modelos[marca] = (id_marca, ids)
+        self.db.invalidar_catalogos()
+        return modelos
+
+    def equipos(self, cantidad, repuestos_por_equipo):
+        modelos = self._marcas_y_modelos()
+        tipos = dict(self.db.conn.execute("SELECT nombre, id FROM tipos_equipo").fetchall())
+        filas, repuestos = [], []
+        for i in range(cantidad):
+            marca = elegir(self.rng, MARCAS)
+            id_marca, ids_modelo = modelos[marca]
+            # Pocos modelos concentran la mayoría de los equipos (tipo Zipf)
+            id_modelo = self.rng.choices(ids_modelo, weights=[1 / (k + 1) for k in range(len(ids_modelo))])[0]
+            ingreso = self._fecha()
+            estado = elegir(self.rng, ESTADOS)
+            salida = (ingreso + timedelta(days=self.rng.randint(1, 30))).isoformat() if estado == "Reparado" else None
+            filas.append((f"PJ-{i:06d}", tipos[elegir(self.rng, TIPOS)], f"{marca[:2].upper()}{i:07d}",
+                          id_marca, id_modelo, self.rng.choice(UBICACIONES), ingreso.isoformat(), salida,
+                          self.rng.choice(FALLAS), estado, None))
+        with self.db.transaction():
+            self.db.cursor.executemany("""
+                INSERT INTO equipos (pj, id_tipo_equipo, serie, id_marca, id_modelo, ubicacion,
+                                     fecha_ingreso, fecha_salida, falla, estado, observaciones)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, filas)
+            ids = [fila[0] for fila in self.db.conn.execute("SELECT id FROM equipos")]
+            for id_equipo in ids:
+                # Cantidad de repuestos con media repuestos_por_equipo (geométrica)
+                while self.rng.random() < repuestos_por_equipo / (repuestos_por_equipo + 1):
+                    nombre = self.rng.choice(list(REPUESTOS))
+                    repuestos.append((id_equipo, nombre, self.rng.randint(1, 3), REPUESTOS[nombre]))
+            self.db.cursor.executemany(
+                "INSERT INTO repuestos (id_equipo, nombre, cantidad, costo) VALUES (?, ?, ?, ?)", repuestos)
+        return len(filas), len(repuestos)
+
+    def toner(self, movimientos_por_dia):
+        """Simula el día a día del depósito: compras semanales, retiros,
+        envíos a recarga y recepciones, sin dejar stock negativo"""
+        modelos = []
+        with self.db.transaction():
+            for marca, nombres in MARCAS_TONER.items():
+                self.db.cursor.execute("INSERT OR IGNORE INTO marcas_toner (nombre) VALUES (?)", (marca,))
+                id_marca = self.db.conn.execute(
+                    "SELECT id FROM marcas_toner WHERE nombre=?", (marca,)).fetchone()[0]
+                for nombre in nombres:
+                    self.db.cursor.execute(
+                        "INSERT OR IGNORE INTO modelos_toner (id_marca, nombre) VALUES (?, ?)", (id_marca, nombre))
+            modelos = [fila[0] for fila in self.db.conn.execute("SELECT id FROM modelos_toner")]
+        self.db.invalidar_catalogos()
+        empresas = ["Recargas Norte", "Toner Express"]
+
+        stock = dict.fromkeys(modelos, 0)
+        vacios = dict.fromkeys(modelos, 0)
+        movimientos, recargas, pendientes = [], [], []
+        for dia in range(self.dias):
+            fecha = self.fecha_inicio + timedelta(days=dia)
+            momento = lambda: f"{fecha.isoformat()} {self.rng.randint(8, 17):02d}:{self.rng.randint(0, 59):02d}:00"
+            if fecha.weekday() == 0:
+                for id_modelo in modelos:
+                    if stock[id_modelo] < 10:
+                        cantidad = self.rng.randint(10, 30)
+                        movimientos.append((id_modelo, 'ingreso', cantidad, None, None, None, momento()))
+                        stock[id_modelo] += cantidad
+                    if vacios[id_modelo] >= 5:
+                        movimientos.append((id_modelo, 'envio_recarga', vacios[id_modelo], None, None,
+                                            self.rng.choice(empresas), momento()))
+                        pendientes.append((len(movimientos), id_modelo, vacios[id_modelo],
+                                           fecha + timedelta(days=self.rng.randint(7, 20))))
+                        vacios[id_modelo] = 0
+            for _ in range(self.rng.randint(0, 2 * movimientos_por_dia)):
+                id_modelo = self.rng.choice(modelos)
+                if stock[id_modelo] > 0:
+                    movimientos.append((id_modelo, 'retiro', 1, f"Agente {self.rng.randint(1, 300)}",
+                                        self.rng.choice(SECTORES), None, momento()))
+                    stock[id_modelo] -= 1
+                    vacios[id_modelo] += 1
+            for pendiente in [p for p in pendientes if p[3] == fecha]:
+                envio, id_modelo, cantidad, _ = pendiente
+                movimientos.append((id_modelo, 'recepcion_recarga', cantidad, None, None, None, momento()))
+                recargas.append((envio, len(movimientos), 'Recibido', fecha.isoformat()))
+                stock[id_modelo] += cantidad
+                pendientes.remove(pendiente)
+        recargas += [(envio, None, 'Enviado', None) for envio, _, _, _ in pendientes]
+
+        with self.db.transaction():
+            base = self.db.conn.execute("SELECT COALESCE(MAX(id), 0) FROM movimientos_toner").fetchone()[0]
+            self.db.cursor.executemany(f"""
+                INSERT INTO movimientos_toner (id_modelo, tipo, cantidad, responsable, sector,
+                                               empresa_recarga, fecha, usuario_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, {int(self.usuario_id)})
+            """, movimientos)
+            # Los números de movimiento de la simulación son 1..N en orden de inserción
+            self.db.cursor.executemany("""
+                INSERT INTO recargas_toner (id_movimiento_envio, id_movimiento_recepcion, estado,
+                                            fecha_envio, fecha_recepcion)
+                SELECT ?, ?, ?, mt.fecha, ? FROM movimientos_toner mt WHERE mt.id = ?
+            """, [(base + envio, base + recepcion if recepcion else None, estado, fecha, base + envio)
+                  for envio, recepcion, estado, fecha in recargas])
+            self.db.cursor.executemany("""
+                INSERT INTO stock_toner (id_modelo, cantidad) VALUES (?, ?)
+                ON CONFLICT (id_modelo) DO UPDATE SET cantidad = excluded.cantidad
+            """, stock.items())
+        self.db.generar_cierres_stock_toner()
+        return len(movimientos), len(recargas)
+
+    def auditoria(self, cantidad):
+        filas = [(self.usuario_id, self.rng.choice(ACCIONES), "equipos", self.rng.randint(1, 10 ** 6),
+                  f"{self._fecha().isoformat()} {self.rng.randint(0, 23):02d}:00:00", "Registro sintético")
+                 for _ in range(cantidad)]
+        with self.db.transaction():
+            self.db.cursor.executemany(
+                "INSERT INTO auditoria (usuario_id, accion, tabla_afectada, registro_id, fecha, detalles) "
+                "VALUES (?, ?, ?, ?, ?, ?)", filas)
+        return len(filas)
+
+
+class Benchmark:
+    """Mide los casos y arma el informe JSON"""
+
+    def __init__(self, in02, db, directorio, repeticiones, semilla, fecha_fin, filas_export):
+        self.in02 = in02
+        self.db = db
+        self.directorio = directorio
+        self.repeticiones = repeticiones
+        self.rng = random.Random(semilla + 1)
+        self.fecha_fin = fecha_fin
+        self.filas_export = filas_export
+        self.resultados = {}
+        self._contador = 0
+
+    def medir(self, nombre, funcion, repeticiones=None):
+        """Ejecuta funcion() una vez de calentamiento y luego N veces midiendo"""
+        tiempos = []
+        try:
+            funcion()
+            for _ in range(repeticiones or self.repeticiones):
+                inicio = time.perf_counter()
+                resultado = funcion()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                if resultado is False:
+                    raise RuntimeError("la función devolvió False")
+        except Exception as e:
+            self.resultados[nombre] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"  {nombre}: ERROR {e}", file=sys.stderr)
+            return
+        tiempos.sort()
+        self.resultados[nombre] = {
+            "n": len(tiempos),
+            "p50_ms": round(percentil(tiempos, 0.50), 3),
+            "p95_ms": round(percentil(tiempos, 0.95), 3),
+            "min_ms": round(tiempos[0], 3),
+            "max_ms": round(tiempos[-1], 3),
+            "rss_pico_kb": rss_pico_kb()
+        }
+        print(f"  {nombre}: p50 {self.resultados[nombre]['p50_ms']} ms, "
+              f"p95 {self.resultados[nombre]['p95_ms']} ms", file=sys.stderr)
+
+    def _id_al_azar(self, tabla, condicion="1"):
+        total = self.db.conn.execute(f"SELECT COUNT(*) FROM {tabla} WHERE {condicion}").fetchone()[0]
+        return self.db.conn.execute(
+            f"SELECT id FROM {tabla} WHERE {condicion} LIMIT 1 OFFSET ?",
+            (self.rng.randrange(total),)).fetchone()[0]
+
+    def casos_lectura(self):
+        """Devuelve nombre -> función sin argumentos para cada lectura"""
+        db, FiltroEquipos = self.db, self.in02.FiltroEquipos
+        año = self.fecha_fin.year - 1
+        desde, hasta = f"{año}-01-01", f"{año}-12-31 23:59:59"
+        id_marca = db.conn.execute("SELECT id FROM marcas WHERE nombre='HP'").fetchone()[0]
+        id_marca_toner = db.conn.execute("SELECT id FROM marcas_toner WHERE nombre='HP'").fetchone()[0]
+        return {
+            "obtener_tipos_equipo": db.obtener_tipos_equipo,
+            "obtener_marcas": db.obtener_marcas,
+            "obtener_modelos": lambda: db.obtener_modelos(id_marca),
+            "obtener_equipos": db.obtener_equipos,
+            "obtener_equipos[pagina]": lambda: db.obtener_equipos(despues_de_id=None, limite=200),
+            "obtener_equipos[filtro]": lambda: db.obtener_equipos(
+                FiltroEquipos(estado="En reparación", marca="HP", fecha_desde=desde)),
+            "contar_equipos": db.contar_equipos,
+            "obtener_tablero": db.obtener_tablero,
+            "buscar_equipos": lambda: db.buscar_equipos(self.rng.choice(["juzgado", "HP00", "pantalla", "12"])),
+            "obtener_equipo_por_id": lambda: db.obtener_equipo_por_id(self._id_al_azar("equipos")),
+            "obtener_repuestos_por_equipo": lambda: db.obtener_repuestos_por_equipo(self._id_al_azar("equipos")),
+            "obtener_repuestos_por_periodo": lambda: db.obtener_repuestos_por_periodo(desde, hasta),
+            "obtener_resumen_repuestos": lambda: db.obtener_resumen_repuestos(año),
+            "obtener_marcas_toner": db.obtener_marcas_toner,
+            "obtener_modelos_toner": lambda: db.obtener_modelos_toner(id_marca_toner),
+            "obtener_stock_toner": db.obtener_stock_toner,
+            "obtener_stock_toner_por_modelo": lambda: db.obtener_stock_toner_por_modelo(
+                self._id_al_azar("modelos_toner")),
+            "obtener_movimientos_toner": lambda: db.obtener_movimientos_toner(desde, hasta),
+            "obtener_recargas_toner": lambda: db.obtener_recargas_toner(año),
+            "obtener_empresas_recarga": db.obtener_empresas_recarga,
+            "obtener_anios_movimientos_toner": db.obtener_anios_movimientos_toner,
+            "obtener_movimientos_toner_para_informe": lambda: db.obtener_movimientos_toner_para_informe(año),
+            "obtener_recargas_toner_para_informe": lambda: db.obtener_recargas_toner_para_informe(año),
+            "stock_toner_a_fecha": lambda: db.stock_toner_a_fecha(f"{año}-06-15"),
+            "obtener_consumos_diarios_toner": lambda: db.obtener_consumos_diarios_toner(desde),
+            "obtener_modelos_para_pedido": db.obtener_modelos_para_pedido,
+            "PronosticoToner.calcular": lambda: self.in02.PronosticoToner(db).calcular(self.fecha_fin),
+            "iterar_auditoria": lambda: sum(1 for _ in db.iterar_auditoria(año)),
+        }
+
+    def casos_escritura(self):
+        db = self.db
+        usuario_id = db.conn.execute("SELECT id FROM usuarios WHERE username='admin'").fetchone()[0]
+        id_tipo = db.conn.execute("SELECT MIN(id) FROM tipos_equipo").fetchone()[0]
+        id_marca, id_modelo = db.conn.execute("SELECT id_marca, id FROM modelos LIMIT 1").fetchone()
+        id_modelo_toner = db.conn.execute("SELECT MIN(id) FROM modelos_toner").fetchone()[0]
+
+        def agregar_equipo():
+            self._contador += 1
+            return db.agregar_equipo(
+                (f"BENCH-{self._contador}", id_tipo, f"BENCH{self._contador:08d}", id_marca, id_modelo,
+                 "Banco de pruebas", self.fecha_fin.isoformat(), None, "Sin falla", "En reparación", None),
+                usuario_id)
+
+        def recarga_toner():
+            """Ingresa una unidad, la envía a recarga y la recibe: recorre
+            movimientos_toner y recargas_toner completos"""
+            db.registrar_movimiento_toner(id_modelo_toner, 'ingreso', 1, None, None, None, None, usuario_id)
+            recarga_id = db.registrar_recarga_toner(id_modelo_toner, 1, "Banco de pruebas", None, usuario_id)
+            db.recibir_recarga_toner(recarga_id, None, usuario_id)
+
+        return {
+            "agregar_equipo": agregar_equipo,
+            "agregar_repuesto": lambda: db.agregar_repuesto(
+                self._id_al_azar("equipos", "estado = 'En reparación'"), "Memoria RAM", 1, 8500.0, usuario_id),
+            "actualizar_estado_equipo": lambda: db.actualizar_estado_equipo(
+                self._id_al_azar("equipos"), "En reparación", None, usuario_id),
+            "registrar_movimiento_toner": lambda: db.registrar_movimiento_toner(
+                id_modelo_toner, 'ingreso', 1, None, None, None, None, usuario_id),
+            "registrar_recarga_toner+recibir": recarga_toner,
+            "generar_cierres_stock_toner": db.generar_cierres_stock_toner,
+            "conciliar_stock_toner": db.conciliar_stock_toner,
+        }
+
+    def casos_exportacion(self):
+        ExportManager = self.in02.ExportManager
+        encabezados = ["ID", "PJ", "Tipo", "Serie", "Marca", "Modelo", "Ubicación", "Ingreso", "Estado"]
+        filas = [list(fila[:9]) for fila in self.db.obtener_equipos(limite=self.filas_export, despues_de_id=2 ** 62)]
+        datos = [encabezados] + filas
+        archivo = lambda extension: os.path.join(self.directorio, f"export.{extension}")
+        return {
+            "export_to_excel": lambda: ExportManager.export_to_excel(datos, archivo("xlsx")),
+            "export_to_excel_stream": lambda: ExportManager.export_to_excel_stream(
+                self.db.iterar_equipos(), encabezados, archivo("xlsx")),
+            "export_to_pdf": lambda: ExportManager.export_to_pdf(datos, archivo("pdf"), horizontal=True),
+            "export_to_word": lambda: ExportManager.export_to_word(datos, archivo("docx")),
+        }
+
+    def sin_caso(self, cubiertos):
+        """Métodos obtener_* de Database que todavía no tienen caso en el banco"""
+        return sorted(nombre for nombre in dir(self.in02.Database)
+                      if nombre.startswith("obtener_") and nombre not in cubiertos)
+
+
+def comparar(actual, base, tolerancia, umbral_ms):
+    """Casos cuyo p95 empeoró más que la tolerancia (y más que umbral_ms)"""
+    regresiones = []
+    for nombre, resultado in actual["resultados"].items():
+        anterior = base.get("resultados", {}).get(nombre)
+        if not anterior or "p95_ms" not in anterior or "p95_ms" not in resultado:
+            continue
+        antes, ahora = anterior["p95_ms"], resultado["p95_ms"]
+        if ahora - antes > umbral_ms and ahora > antes * (1 + tolerancia):
+            regresiones.append({"caso": nombre, "p95_base_ms": antes, "p95_ms": ahora,
+                                "factor": round(ahora / antes, 2) if antes else None})
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento de in02.Database")
+    parser.add_argument("--equipos", type=int, default=10000)
+    parser.add_argument("--repuestos-por-equipo", type=float, default=2.0)
+    parser.add_argument("--años", type=int, default=3, help="años de historia a generar")
+    parser.add_argument("--movimientos-por-dia", type=int, default=15, help="retiros de toner promedio por día")
+    parser.add_argument("--auditoria", type=int, default=50000)
+    parser.add_argument("--filas-export", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--fecha-fin", default="2025-12-31", help="último día de datos (AAAA-MM-DD)")
+    parser.add_argument("--salida", default="benchmark.json")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="aumento de p95 tolerado (0.2 = 20%%)")
+    parser.add_argument("--umbral-ms", type=float, default=1.0, help="diferencias menores se ignoran")
+    parser.add_argument("--conservar", action="store_true", help="no borrar la base temporal")
+    args = parser.parse_args(argv)
+
+    salida = os.path.abspath(args.salida)
+    base = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+    fecha_fin = datetime.strptime(args.fecha_fin, "%Y-%m-%d").date()
+
+    # in02 crea su log y su base en el directorio actual: trabajar en uno temporal
+    directorio = tempfile.mkdtemp(prefix="bench_in02_")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(directorio)
+    import logging
+    import in02
+    logging.getLogger().setLevel(logging.ERROR)
+    in02.Config.DB_NAME = os.path.join(directorio, "benchmark.db")
+    db = in02.Database()
+
+    try:
+        print(f"Generando datos en {directorio}...", file=sys.stderr)
+        inicio = time.perf_counter()
+        generador = GeneradorDatos(db, args.semilla, fecha_fin, args.años)
+        equipos, repuestos = generador.equipos(args.equipos, args.repuestos_por_equipo)
+        movimientos, recargas = generador.toner(args.movimientos_por_dia)
+        auditoria = generador.auditoria(args.auditoria)
+        db.conn.execute("ANALYZE")
+        db.conn.commit()
+        generacion_s = time.perf_counter() - inicio
+
+        bench = Benchmark(in02, db, directorio, args.repeticiones, args.semilla, fecha_fin, args.filas_export)
+        lecturas = bench.casos_lectura()
+        for grupo, casos in (("lectura", lecturas), ("escritura", bench.casos_escritura()),
+                             ("exportación", bench.casos_exportacion())):
+            print(f"Casos de {grupo}:", file=sys.stderr)
+            for nombre, funcion in casos.items():
+                # Las exportaciones son lentas: menos repeticiones
+                bench.medir(nombre, funcion, max(3, args.repeticiones // 5) if grupo == "exportación" else None)
+
+        informe = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "entorno": {
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "plataforma": platform.platform(),
+                "esquema": db.conn.execute("PRAGMA user_version").fetchone()[0]
+            },
+            "parametros": {k: v for k, v in vars(args).items()
+                           if k not in ("salida", "comparar", "conservar")},
+            "volumenes": {"equipos": equipos, "repuestos": repuestos, "movimientos_toner": movimientos,
+                          "recargas_toner": recargas, "auditoria": auditoria,
+                          "tamaño_bd_kb": os.path.getsize(in02.Config.DB_NAME) // 1024},
+            "generacion_s": round(generacion_s, 2),
+            "rss_pico_kb": rss_pico_kb(),
+            "sin_caso": bench.sin_caso(lecturas),
+            "resultados": bench.resultados
+        }
+        if informe["sin_caso"]:
+            print(f"Métodos obtener_* sin caso: {', '.join(informe['sin_caso'])}", file=sys.stderr)
+        if base is not None:
+            informe["regresiones"] = comparar(informe, base, args.tolerancia, args.umbral_ms)
+
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {salida}", file=sys.stderr)
+
+        for regresion in informe.get("regresiones", []):
+            print(f"REGRESIÓN {regresion['caso']}: p95 {regresion['p95_base_ms']} -> "
+                  f"{regresion['p95_ms']} ms", file=sys.stderr)
+        return 1 if informe.get("regresiones") else 0
+    finally:
+        db.cerrar()
+        os.chdir(os.path.dirname(salida))
+        if not args.conservar:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
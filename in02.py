@@ -1,30 +1,38 @@
 # -*- coding: utf-8 -*-
+import time
+INICIO_PROCESO = time.perf_counter()  # para medir el tiempo de arranque
+
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
-from tkcalendar import DateEntry
+import atexit
 import hashlib
+import importlib
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.enum.table import WD_TABLE_ALIGNMENT
-import pandas as pd
+# pandas, reportlab, python-docx, PIL y tkcalendar se importan al primer uso
+# (o se precargan en segundo plano tras mostrar el login) para acelerar el arranque
 import webbrowser
-import os
-from PIL import Image, ImageTk
 import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+import functools
+import gzip
+import inspect
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+import csv
+import queue
 import re
+import shutil
+import socket
 import sys
+import unicodedata
 
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+FIN_IMPORTS = time.perf_counter()
 
 # Configuración inicial
 class Config:
@@ -34,8 +42,12 @@ class Config:
     BACKUP_COUNT = 5
     UI_THEME = "clam"
     PDF_OPTIONS = {
-        'pagesize': letter,
-        'margins': (20, 20, 20, 20)
+        'pagesize': (612.0, 792.0),   # carta (reportlab.lib.pagesizes.letter)
+        'margins': (20, 20, 20, 20),  # izquierda, derecha, arriba, abajo
+        'chunk_rows': 40,             # filas por tabla (cada tabla repite encabezado)
+        'font_size': 8,
+        'header_font_size': 9,
+        'sample_rows': 200            # filas usadas para estimar anchos de columna
     }
     # Nueva paleta de colores profesional
     PRIMARY_COLOR = "#2c3e50"      # Azul oscuro (barra superior)
@@ -48,29 +60,981 @@ class Config:
     HIGHLIGHT_COLOR = "#e9ecef"    # Gris claro (resaltado)
     HEADER_COLOR = "#343a40"       # Gris oscuro (encabezados)
     BORDER_COLOR = "#dee2e6"       # Gris bordes
+    # Listados virtuales: filas por página y fracción restante que dispara la carga
+    PAGINA_TREEVIEW = 200
+    MARGEN_PREFETCH = 0.2
+    # Búsqueda de equipos: espera tras la última tecla y máximo de resultados
+    BUSQUEDA_DEBOUNCE_MS = 250
+    BUSQUEDA_LIMITE = 200
+    # Módulos pesados que se precargan en segundo plano después del login
+    PRELOAD_MODULES = ["tkcalendar", "reportlab.platypus", "docx", "pandas", "xlsxwriter"]
+    PRELOAD_DELAY_MS = 1500
+    # Vistas: se construyen al primer uso; tras el login se preconstruyen las
+    # más probables y se destruyen las menos usadas por encima del máximo
+    # (nunca las fijas: los formularios no pierden lo que se está cargando)
+    VISTAS_PRECONSTRUIR = ["EquipmentView", "TonerView"]
+    MAX_VISTAS_VIVAS = 10
+    VISTAS_FIJAS = ["LoginView", "MainView", "EquipmentView", "EditarEquipoView",
+                    "ReparacionView", "RetiroTonerView", "RecargaTonerView"]
+    # Ejecución en segundo plano (consultas y exportaciones)
+    TASK_WORKERS = 4      # hilos para trabajo de E/S (SQLite, escritura de archivos)
+    TASK_PROCESSES = 2    # procesos para renderizado intensivo en CPU (opcional)
+    # Auditoría: False = cada registro viaja en la transacción de la operación;
+    # True = se encola al confirmar la transacción y un hilo lo escribe en lotes
+    # (se vacía al cerrar la app)
+    AUDITORIA_DIFERIDA = False
+    AUDITORIA_LOTE = 200
+    AUDITORIA_INTERVALO = 1.0     # segundos máximos que un registro espera en cola
+    AUDITORIA_COLA_MAX = 10000
+    AUDITORIA_REINTENTOS = 5      # intentos por lote antes de volcarlo al log
+    AUDITORIA_PAUSA_REINTENTO = 0.2  # segundos; se duplica en cada reintento
+    # Importación masiva: filas validadas e insertadas por transacción
+    IMPORT_BATCH_SIZE = 500
+    # Libro de stock de toner: cada cuánto se generan los cierres mensuales y
+    # se controla el contador contra los movimientos (ms)
+    LIBRO_TONER_INTERVALO_MS = 6 * 60 * 60 * 1000
+    # Pronóstico de consumo de toner y pedido sugerido (días)
+    PRONOSTICO_VENTANA_DIAS = 90       # media móvil y tendencia sobre los últimos N días
+    PRONOSTICO_DEMORA_DIAS = 15        # demora de una compra o recarga
+    PRONOSTICO_COBERTURA_DIAS = 60     # stock objetivo por encima del punto de pedido
+    PRONOSTICO_NIVEL_SERVICIO_Z = 1.65 # stock de seguridad (~95% sin faltantes)
+    # Exportación por streaming: filas leídas por lote y ancho máximo de columna
+    EXPORT_BATCH_SIZE = 1000
+    EXCEL_MAX_COL_WIDTH = 50
+    # Instrumentación de consultas: latencia por método de Database y por forma
+    # de SQL; las sentencias que superan el umbral se registran con su plan
+    INSTRUMENTAR_CONSULTAS = True
+    UMBRAL_CONSULTA_LENTA_MS = 200
+    SLOW_QUERY_LOG = "consultas_lentas.log"
+    # Logging: los registros pasan por una cola y un hilo los escribe.
+    # Formato "json" (una línea JSON por registro) o "texto"; niveles por
+    # subsistema (in02.db, in02.export, in02.ui); LOG_CONSOLA duplica en stdout
+    LOG_FORMATO = "json"
+    LOG_NIVELES = {"in02.db": "INFO", "in02.export": "INFO", "in02.ui": "INFO"}
+    LOG_CONSOLA = False
+    # Avisos y errores repetidos desde la misma línea: máximo por ventana (s)
+    LOG_LIMITE_REPETIDOS = 5
+    LOG_VENTANA_REPETIDOS = 60
+    # Copias de seguridad en caliente con la API de backup de SQLite
+    BACKUP_DIR = "backups"
+    BACKUP_PAGINAS_POR_PASO = 512
+    BACKUP_PAUSA = 0.01             # segundos entre pasos para dejar pasar a los escritores
+    BACKUP_MAX_REINICIOS = 3        # luego la copia se completa en un solo paso
+    # Archivo histórico: equipos cerrados, sus repuestos y la auditoría de años
+    # anteriores al corte pasan a ARCHIVO_DIR/archivo_AAAA.db (uno por año)
+    ARCHIVO_DIR = "archivo"
+    ARCHIVO_AÑOS_ABIERTOS = 2       # corte sugerido: años que quedan en la base viva
+    ARCHIVO_MAX_ADJUNTOS = 8        # SQLite admite 10 bases adjuntas por conexión
+    BACKUP_INTERVALO_HORAS = 24     # copia automática si la última es más vieja
+    BACKUP_RETENER_DIARIAS = 7      # última copia de cada uno de los N días más recientes
+    BACKUP_RETENER_SEMANALES = 4    # última copia de cada una de las N semanas más recientes
+    # Ajustes de conexión SQLite (se aplican a cada conexión por hilo)
+    DB_TIMEOUT = 30  # segundos de espera ante un bloqueo
+    DB_CACHED_STATEMENTS = 256  # sentencias preparadas reutilizables por conexión
+    DB_PRAGMAS = [
+        ("journal_mode", "WAL"),      # lectores concurrentes con un escritor
+        ("synchronous", "NORMAL"),    # seguro con WAL y mucho más rápido que FULL
+        ("cache_size", -20000),       # ~20MB de caché de páginas
+        ("mmap_size", 268435456),     # 256MB de lectura mapeada en memoria
+        ("temp_store", "MEMORY"),
+        ("foreign_keys", "ON")
+    ]
 
 # Configuración de logging
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro (fecha, nivel, logger, hilo, origen y mensaje)"""
+
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "hilo": record.threadName,
+            "funcion": record.funcName,
+            "linea": record.lineno,
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False)
+
+
+class LimiteRepetidos(logging.Filter):
+    """Limita los avisos y errores repetidos desde un mismo punto del código.
+
+    Por cada (logger, línea, nivel) se dejan pasar `limite` registros por
+    ventana de `ventana` segundos; el primero de la ventana siguiente indica
+    cuántos se suprimieron.
+    """
+
+    def __init__(self, limite=None, ventana=None):
+        super().__init__()
+        self.limite = limite or Config.LOG_LIMITE_REPETIDOS
+        self.ventana = ventana or Config.LOG_VENTANA_REPETIDOS
+        self._lock = threading.Lock()
+        self._contadores = {}  # clave -> [inicio de ventana, emitidos, suprimidos]
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or record.name == "in02.consultas_lentas":
+            return True
+        clave = (record.name, record.pathname, record.lineno, record.levelno)
+        with self._lock:
+            estado = self._contadores.get(clave)
+            if estado is None or record.created - estado[0] >= self.ventana:
+                suprimidos = estado[2] if estado else 0
+                self._contadores[clave] = [record.created, 1, 0]
+                if suprimidos:
+                    record.msg = f"{record.msg} ({suprimidos} registros similares suprimidos)"
+                return True
+            if estado[1] < self.limite:
+                estado[1] += 1
+                return True
+            estado[2] += 1
+            return False
+
+
+class ColaLogHandler(QueueHandler):
+    """QueueHandler que resuelve el mensaje y la traza en el hilo que registra
+    y deja el formateo (JSON o texto) al hilo del QueueListener"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
 def setup_logging():
+    """Envía todos los registros a una cola; un QueueListener los escribe en
+    archivo (y opcionalmente en consola) sin bloquear el hilo de la interfaz"""
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
+    for nombre, nivel in Config.LOG_NIVELES.items():
+        logging.getLogger(nombre).setLevel(nivel)
+
+    if Config.LOG_FORMATO == "json":
+        formatter = FormatoJSON()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    es_lenta = lambda record: record.name == "in02.consultas_lentas"
+
     file_handler = RotatingFileHandler(
         Config.LOG_FILE, 
         maxBytes=Config.MAX_LOG_SIZE, 
         backupCount=Config.BACKUP_COUNT)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    file_handler.addFilter(lambda record: not es_lenta(record))
+    handlers = [file_handler]
+
+    # Consultas lentas en un archivo aparte, fuera del log general
+    lentas_handler = RotatingFileHandler(
+        Config.SLOW_QUERY_LOG,
+        maxBytes=Config.MAX_LOG_SIZE,
+        backupCount=Config.BACKUP_COUNT)
+    lentas_handler.setFormatter(formatter)
+    lentas_handler.addFilter(es_lenta)
+    handlers.append(lentas_handler)
+
+    if Config.LOG_CONSOLA:
+        consola = logging.StreamHandler(sys.stdout)
+        consola.setFormatter(formatter)
+        handlers.append(consola)
+
+    cola = queue.SimpleQueue()
+    cola_handler = ColaLogHandler(cola)
+    cola_handler.addFilter(LimiteRepetidos())
+    logger.addHandler(cola_handler)
+
+    listener = QueueListener(cola, *handlers, respect_handler_level=True)
+    listener.start()
+
+    def detener():
+        # Escribir lo pendiente al salir (stop no admite llamarse dos veces)
+        if getattr(listener, '_thread', None) is not None:
+            listener.stop()
+    atexit.register(detener)
+    return listener
 
-setup_logging()
+LOG_LISTENER = setup_logging()
 
+# Registradores por subsistema (niveles en Config.LOG_NIVELES)
+log_db = logging.getLogger("in02.db")
+log_export = logging.getLogger("in02.export")
+log_ui = logging.getLogger("in02.ui")
+
+
+def DateEntry(*args, **kwargs):
+    """Crea un tkcalendar.DateEntry importando tkcalendar recién en el primer uso"""
+    from tkcalendar import DateEntry as _DateEntry
+    return _DateEntry(*args, **kwargs)
+
+
+def precargar_modulos(modulos=None):
+    """Importa los módulos de exportación para que el primer uso no demore"""
+    for nombre in modulos or Config.PRELOAD_MODULES:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(nombre)
+            log_ui.debug(f"Módulo {nombre} precargado en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        except ImportError as e:
+            log_ui.warning(f"No se pudo precargar {nombre}: {e}")
+
+
+
+class FiltroEquipos:
+    """Especificación tipada de filtros para Database.obtener_equipos.
+
+    Cada campo en None se ignora. Los valores siempre se envían como
+    parámetros; el texto SQL depende solo de qué campos están presentes
+    (la "forma" del filtro), por lo que se reutiliza la sentencia preparada.
+    """
+
+    # campo -> fragmento SQL (en el orden en que se agregan al WHERE)
+    CONDICIONES = [
+        ("estado", "e.estado = ?"),
+        ("fecha_desde", "e.fecha_ingreso >= ?"),
+        ("fecha_hasta", "e.fecha_ingreso <= ?"),
+        ("marca", "ma.nombre = ?"),
+        ("tipo", "te.nombre = ?"),
+        ("serie", "e.serie = ?"),
+        ("ubicacion", "e.ubicacion LIKE ?"),
+        ("texto", "(e.pj LIKE ? OR e.serie LIKE ? OR e.ubicacion LIKE ? OR e.falla LIKE ?)"),
+        ("excluir_id", "e.id != ?")
+    ]
+
+    def __init__(self, estado=None, fecha_desde=None, fecha_hasta=None, marca=None,
+                 tipo=None, serie=None, ubicacion=None, texto=None, excluir_id=None):
+        self.estado = estado
+        self.fecha_desde = fecha_desde
+        self.fecha_hasta = fecha_hasta
+        self.marca = marca
+        self.tipo = tipo
+        self.serie = serie
+        self.ubicacion = ubicacion
+        self.texto = texto
+        self.excluir_id = excluir_id
+
+    def forma(self):
+        """Tupla con los campos presentes; identifica el texto SQL generado"""
+        return tuple(campo for campo, _ in self.CONDICIONES
+                     if getattr(self, campo) not in (None, ""))
+
+    def condiciones(self):
+        """Devuelve (lista de fragmentos SQL, lista de parámetros)"""
+        sql, params = [], []
+        for campo, fragmento in self.CONDICIONES:
+            valor = getattr(self, campo)
+            if valor in (None, ""):
+                continue
+            sql.append(fragmento)
+            if campo == "ubicacion":
+                params.append(f"%{valor}%")
+            elif campo == "texto":
+                params.extend([f"%{valor}%"] * 4)
+            else:
+                params.append(valor)
+        return sql, params
+
+    def parametros(self):
+        return self.condiciones()[1]
+
+    def __repr__(self):
+        campos = ", ".join(f"{c}={getattr(self, c)!r}" for c in self.forma())
+        return f"FiltroEquipos({campos})"
+
+
+class EstadisticaConsulta:
+    """Cantidad, tiempo total, máximo, filas e histograma de latencias (ms)"""
+
+    LIMITES_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    __slots__ = ("llamadas", "total_ms", "max_ms", "filas", "lentas", "cubetas")
+
+    def __init__(self):
+        self.llamadas = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.filas = 0
+        self.lentas = 0
+        self.cubetas = [0] * (len(self.LIMITES_MS) + 1)
+
+    def registrar(self, ms, lenta=False):
+        self.llamadas += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.lentas += lenta
+        self.cubetas[bisect_left(self.LIMITES_MS, ms)] += 1
+
+    def ajustar(self, ms_anterior, ms):
+        """Corrige una muestra ya registrada (p. ej. al sumar el tiempo de lectura)"""
+        self.total_ms += ms - ms_anterior
+        self.max_ms = max(self.max_ms, ms)
+        self.cubetas[bisect_left(self.LIMITES_MS, ms_anterior)] -= 1
+        self.cubetas[bisect_left(self.LIMITES_MS, ms)] += 1
+
+    def percentil(self, q):
+        """Cota superior de la cubeta que contiene el percentil q"""
+        objetivo, acumulado = q * self.llamadas, 0
+        for limite, cantidad in zip(self.LIMITES_MS + (self.max_ms,), self.cubetas):
+            acumulado += cantidad
+            if acumulado >= objetivo:
+                return min(limite, self.max_ms)
+        return self.max_ms
+
+    def resumen(self, nombre):
+        """(nombre, llamadas, promedio, p95, máximo, total, filas, lentas)"""
+        promedio = self.total_ms / self.llamadas if self.llamadas else 0.0
+        return (nombre, self.llamadas, promedio, self.percentil(0.95), self.max_ms,
+                self.total_ms, self.filas, self.lentas)
+
+
+class MonitorConsultas:
+    """Acumula la latencia de las consultas por método de Database y por
+    forma de SQL (literales reemplazados por ?) con histogramas en memoria.
+
+    Las sentencias y los métodos que superan umbral_ms se escriben en el log
+    de consultas lentas; la primera vez que una forma de SQL es lenta se
+    agrega su EXPLAIN QUERY PLAN. Los parámetros nunca se registran.
+    """
+
+    _LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _ESPACIOS = re.compile(r"\s+")
+    _EXPLICABLES = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+    def __init__(self, umbral_ms=None):
+        self.umbral_ms = Config.UMBRAL_CONSULTA_LENTA_MS if umbral_ms is None else umbral_ms
+        self.equipo = socket.gethostname()
+        self.log = logging.getLogger("in02.consultas_lentas")
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.por_metodo = {}
+            self.por_sql = {}
+            self._explicadas = set()
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def forma(sql):
+        """SQL normalizado: espacios colapsados, literales y listas IN como ?"""
+        forma = MonitorConsultas._ESPACIOS.sub(" ", sql).strip()
+        forma = MonitorConsultas._LITERAL.sub("?", forma)
+        return MonitorConsultas._LISTA.sub("(?...)", forma)
+
+    def metodo_actual(self):
+        return getattr(self._local, 'metodo', None)
+
+    def registrar_sentencia(self, conn, sql, parametros, ms, filas=0):
+        forma = self.forma(sql)
+        with self._lock:
+            estadistica = self.por_sql.get(forma)
+            if estadistica is None:
+                estadistica = self.por_sql[forma] = EstadisticaConsulta()
+            estadistica.registrar(ms, ms >= self.umbral_ms)
+            estadistica.filas += max(filas, 0)
+        if ms >= self.umbral_ms:
+            self._registrar_lenta(conn, forma, sql, parametros, ms)
+
+    def registrar_lectura(self, conn, sql, parametros, ms_anterior, ms, filas):
+        """Suma a la ejecución ya registrada las filas y el tiempo de un fetch*"""
+        forma = self.forma(sql)
+        with self._lock:
+            estadistica = self.por_sql.get(forma)
+            if estadistica is None:
+                return
+            estadistica.ajustar(ms_anterior, ms)
+            estadistica.filas += filas
+            cruza_umbral = ms_anterior < self.umbral_ms <= ms
+            estadistica.lentas += cruza_umbral
+        if cruza_umbral:
+            self._registrar_lenta(conn, forma, sql, parametros, ms)
+
+    def _registrar_lenta(self, conn, forma, sql, parametros, ms):
+        with self._lock:
+            explicar = forma not in self._explicadas
+            self._explicadas.add(forma)
+        self.log.warning(f"{ms:.1f} ms | {self.metodo_actual() or '-'} | {self.equipo} | {forma}")
+        if explicar and parametros is not None and forma.upper().startswith(self._EXPLICABLES):
+            self._explicar(conn, sql, parametros)
+
+    def registrar_metodo(self, nombre, ms):
+        lenta = ms >= self.umbral_ms
+        with self._lock:
+            estadistica = self.por_metodo.get(nombre)
+            if estadistica is None:
+                estadistica = self.por_metodo[nombre] = EstadisticaConsulta()
+            estadistica.registrar(ms, lenta)
+        if lenta:
+            self.log.warning(f"{ms:.1f} ms | método {nombre} | {self.equipo}")
+
+    def _explicar(self, conn, sql, parametros):
+        try:
+            # Cursor sin instrumentar para no medir el propio EXPLAIN
+            plan = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parametros).fetchall()
+        except sqlite3.Error as e:
+            self.log.warning(f"No se pudo obtener el plan: {e}")
+            return
+        for _, padre, _, detalle in plan:
+            self.log.warning(f"    plan: {'  ' * (padre > 0)}{detalle}")
+
+    def top(self, n=20, orden="total"):
+        """Los n métodos y las n formas de SQL con más tiempo (o promedio, p95...)"""
+        columna = {"llamadas": 1, "promedio": 2, "p95": 3, "max": 4, "total": 5}[orden]
+        with self._lock:
+            metodos = [e.resumen(nombre) for nombre, e in self.por_metodo.items()]
+            sentencias = [e.resumen(forma) for forma, e in self.por_sql.items()]
+        metodos.sort(key=lambda fila: fila[columna], reverse=True)
+        sentencias.sort(key=lambda fila: fila[columna], reverse=True)
+        return metodos[:n], sentencias[:n]
+
+    def volcar_resumen(self, n=10):
+        """Escribe en el log de consultas lentas los métodos con más tiempo acumulado"""
+        metodos, _ = self.top(n)
+        for nombre, llamadas, promedio, p95, maximo, total, _, _ in metodos:
+            self.log.info(f"Resumen {self.equipo} | {nombre}: {llamadas} llamadas, "
+                          f"prom {promedio:.1f} ms, p95 {p95:.1f} ms, máx {maximo:.1f} ms, total {total:.0f} ms")
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """Cursor que informa al monitor de la conexión la duración de cada
+    sentencia, incluido el tiempo de leer sus filas con fetchall/fetchmany"""
+
+    _sql = ""
+    _parametros = None
+    _ms = 0.0
+
+    def execute(self, sql, parameters=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql, self._parametros = sql, parameters
+            self._ms = (time.perf_counter() - inicio) * 1000
+            self.connection.monitor.registrar_sentencia(
+                self.connection, sql, parameters, self._ms, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql, self._parametros = sql, None
+            self._ms = (time.perf_counter() - inicio) * 1000
+            self.connection.monitor.registrar_sentencia(
+                self.connection, sql, None, self._ms, self.rowcount)
+
+    def _leer(self, lectura, *args):
+        inicio = time.perf_counter()
+        filas = lectura(*args)
+        if self._sql:
+            ms_anterior = self._ms
+            self._ms += (time.perf_counter() - inicio) * 1000
+            self.connection.monitor.registrar_lectura(
+                self.connection, self._sql, self._parametros, ms_anterior, self._ms, len(filas))
+        return filas
+
+    def fetchall(self):
+        return self._leer(super().fetchall)
+
+    def fetchmany(self, size=None):
+        return self._leer(super().fetchmany, self.arraysize if size is None else size)
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión cuyos cursores (y execute directo) usan CursorInstrumentado"""
+
+    monitor = None
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or CursorInstrumentado)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def instrumentar_metodos(cls):
+    """Decorador de clase: mide la duración de cada método público en self.monitor.
+
+    Las llamadas anidadas se atribuyen al método exterior; los métodos que
+    devuelven iteradores (iterar_*) y transaction/cerrar no se envuelven.
+    """
+    for nombre, atributo in list(vars(cls).items()):
+        if (nombre.startswith('_') or nombre.startswith('iterar_') or nombre in ('transaction', 'cerrar')
+                or not inspect.isfunction(atributo) or inspect.isgeneratorfunction(atributo)):
+            continue
+        setattr(cls, nombre, _medir_metodo(nombre, atributo))
+    return cls
+
+
+def _medir_metodo(nombre, funcion):
+    @functools.wraps(funcion)
+    def envoltura(self, *args, **kwargs):
+        monitor = self.monitor
+        if monitor is None or monitor.metodo_actual() is not None:
+            return funcion(self, *args, **kwargs)
+        monitor._local.metodo = nombre
+        inicio = time.perf_counter()
+        try:
+            return funcion(self, *args, **kwargs)
+        finally:
+            monitor._local.metodo = None
+            monitor.registrar_metodo(nombre, (time.perf_counter() - inicio) * 1000)
+    return envoltura
+
+
+class ConnectionManager:
+    """Administra una conexión SQLite por hilo con los PRAGMAs de rendimiento"""
+
+    def __init__(self, db_name, monitor=None):
+        self.db_name = db_name
+        self.monitor = monitor  # MonitorConsultas o None para conexiones sin instrumentar
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # hilo -> conexión
+        # Función que prepara cada conexión (bases adjuntas, vistas temporales);
+        # se vuelve a aplicar en cada hilo cuando cambia la generación
+        self.preparar_conexion = None
+        self._generacion = 0
+
+    def get_connection(self):
+        """Devuelve la conexión del hilo actual, creándola si no existe"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+            self._local.generacion = None
+            with self._lock:
+                self._prune()
+                self._connections[threading.current_thread()] = conn
+        # ATTACH/DETACH no se permiten dentro de una transacción: se posterga
+        if (self.preparar_conexion is not None and self._local.generacion != self._generacion
+                and not conn.in_transaction):
+            self._local.generacion = self._generacion
+            self.preparar_conexion(conn)
+        return conn
+
+    def renovar(self):
+        """Marca todas las conexiones para volver a prepararlas en su próximo uso"""
+        with self._lock:
+            self._generacion += 1
+
+    def get_cursor(self):
+        """Devuelve el cursor compartido por el hilo actual"""
+        self.get_connection()
+        return self._local.cursor
+
+    def _open(self):
+        # check_same_thread=False solo para que close_all pueda cerrarlas al salir;
+        # cada conexión se usa únicamente desde el hilo que la creó
+        conn = sqlite3.connect(self.db_name, timeout=Config.DB_TIMEOUT,
+                               check_same_thread=False,
+                               cached_statements=Config.DB_CACHED_STATEMENTS,
+                               factory=ConexionInstrumentada if self.monitor else sqlite3.Connection)
+        if self.monitor:
+            conn.monitor = self.monitor
+        for pragma, valor in Config.DB_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+        log_db.debug(f"Conexión SQLite abierta para hilo {threading.current_thread().name}")
+        return conn
+
+    def _prune(self):
+        """Cierra las conexiones de hilos que ya terminaron"""
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            try:
+                self._connections.pop(thread).close()
+            except sqlite3.Error as e:
+                log_db.warning(f"Error cerrando conexión de hilo finalizado: {e}")
+
+    def close_all(self):
+        """Cierra todas las conexiones abiertas"""
+        with self._lock:
+            for conn in self._connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error as e:
+                    log_db.warning(f"Error cerrando conexión: {e}")
+            self._connections.clear()
+        self._local = threading.local()
+
+
+class EscritorAuditoria:
+    """Escribe registros de auditoría en lotes desde un hilo propio.
+
+    Los registros se encolan (cola acotada) y se insertan con executemany en
+    una sola transacción por lote. cerrar() vacía la cola antes de terminar;
+    lo que esté en cola se pierde solo si el proceso termina abruptamente.
+    Database.transaction() encola recién después del commit, así que solo
+    llegan aquí registros de operaciones confirmadas.
+    """
+
+    SQL = """INSERT INTO auditoria
+        (usuario_id, accion, tabla_afectada, registro_id, fecha, detalles)
+        VALUES (?, ?, ?, ?, ?, ?)"""
+
+    def __init__(self, pool, tam_lote=None, intervalo=None, max_cola=None):
+        self.pool = pool
+        self.tam_lote = tam_lote or Config.AUDITORIA_LOTE
+        self.intervalo = intervalo or Config.AUDITORIA_INTERVALO
+        self._cola = queue.Queue(maxsize=max_cola or Config.AUDITORIA_COLA_MAX)
+        self._fin = object()
+        self._hilo = threading.Thread(target=self._trabajar, name="auditoria", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, registro, timeout=None):
+        """Agrega un registro; devuelve False si la cola sigue llena tras timeout"""
+        try:
+            self._cola.put(registro, timeout=timeout if timeout is not None else self.intervalo)
+            return True
+        except queue.Full:
+            return False
 
+    def vaciar(self):
+        """Bloquea hasta que todo lo encolado quede escrito"""
+        self._cola.join()
 
+    def cerrar(self):
+        """Escribe lo pendiente y detiene el hilo"""
+        if self._hilo.is_alive():
+            self._cola.put(self._fin)
+            self._hilo.join()
+
+    def _trabajar(self):
+        terminar = False
+        while not terminar:
+            lote = []
+            try:
+                lote.append(self._cola.get(timeout=self.intervalo))
+                while len(lote) < self.tam_lote:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                pass
+            if self._fin in lote:
+                terminar = True
+            registros = [r for r in lote if r is not self._fin]
+            if registros:
+                self._escribir(registros)
+            for _ in lote:
+                self._cola.task_done()
+
+    def _escribir(self, registros, intentos=None):
+        intentos = intentos or Config.AUDITORIA_REINTENTOS
+        conn = self.pool.get_connection()
+        for intento in range(1, intentos + 1):
+            try:
+                with conn:
+                    conn.executemany(self.SQL, registros)
+                return
+            except sqlite3.Error as e:
+                log_db.warning(f"Error escribiendo {len(registros)} registros de auditoría "
+                                f"(intento {intento}/{intentos}): {e}")
+                if intento < intentos:
+                    # Espera creciente: el error típico es la base bloqueada por un escritor
+                    time.sleep(Config.AUDITORIA_PAUSA_REINTENTO * 2 ** (intento - 1))
+        # Dejar constancia en el log para no perder los registros
+        for registro in registros:
+            log_db.error(f"Auditoría no escrita: {registro}")
+
+
+def _migrar_libro_toner(conn):
+    """Prepara movimientos_toner como libro de stock (migración 4).
+
+    Las bases creadas con el esquema normalizado (id_tipo_movimiento,
+    id_responsable...) no coinciden con las columnas que usa la aplicación;
+    se reconstruye la tabla conservando los ids para que las referencias de
+    recargas_toner sigan siendo válidas. Después se registra un ajuste de
+    saldo inicial por modelo para que el libro coincida con stock_toner.
+    """
+    conn.executemany(
+        "INSERT OR IGNORE INTO tipos_movimiento_toner (nombre, afecta_stock) VALUES (?, ?)",
+        Database.TIPOS_MOVIMIENTO_TONER.items())
+
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(movimientos_toner)")}
+    if 'tipo' not in columnas:
+        conn.execute('''CREATE TEMP TABLE movimientos_toner_copia AS
+            SELECT mt.id, mt.id_modelo, t.nombre AS tipo, mt.cantidad, u.username AS responsable,
+                   NULL AS sector, e.nombre AS empresa_recarga, mt.observaciones, mt.fecha, mt.usuario_id
+            FROM movimientos_toner mt
+            JOIN tipos_movimiento_toner t ON mt.id_tipo_movimiento = t.id
+            LEFT JOIN usuarios u ON mt.id_responsable = u.id
+            LEFT JOIN empresas_recarga e ON mt.id_empresa_recarga = e.id''')
+        # Las referencias de recargas_toner quedan huérfanas hasta reinsertar
+        # las filas con los mismos ids; se controlan recién al confirmar
+        conn.execute("PRAGMA defer_foreign_keys = ON")
+        conn.execute("DROP TABLE movimientos_toner")
+        conn.execute('''CREATE TABLE movimientos_toner (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_modelo INTEGER NOT NULL,
+            tipo TEXT NOT NULL,
+            cantidad INTEGER NOT NULL CHECK(cantidad > 0),
+            responsable TEXT,
+            sector TEXT,
+            empresa_recarga TEXT,
+            observaciones TEXT,
+            fecha TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            usuario_id INTEGER NOT NULL,
+            FOREIGN KEY (id_modelo) REFERENCES modelos_toner(id),
+            FOREIGN KEY (tipo) REFERENCES tipos_movimiento_toner(nombre),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )''')
+        conn.execute("INSERT INTO movimientos_toner SELECT * FROM movimientos_toner_copia")
+        conn.execute("DROP TABLE movimientos_toner_copia")
+
+    # Saldo inicial: lo que el contador tiene y el libro no explica
+    conn.execute('''INSERT INTO movimientos_toner (id_modelo, tipo, cantidad, observaciones, fecha, usuario_id)
+        SELECT s.id_modelo,
+               CASE WHEN s.cantidad > COALESCE(l.cantidad, 0) THEN 'ajuste_alta' ELSE 'ajuste_baja' END,
+               ABS(s.cantidad - COALESCE(l.cantidad, 0)), 'Saldo inicial del libro de stock',
+               strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'), (SELECT MIN(id) FROM usuarios)
+        FROM stock_toner s
+        LEFT JOIN (SELECT mt.id_modelo, SUM(mt.cantidad * t.afecta_stock) AS cantidad
+                   FROM movimientos_toner mt
+                   JOIN tipos_movimiento_toner t ON t.nombre = mt.tipo
+                   GROUP BY mt.id_modelo) l ON l.id_modelo = s.id_modelo
+        WHERE s.cantidad != COALESCE(l.cantidad, 0)
+          AND EXISTS (SELECT 1 FROM usuarios)''')
+
+
+@instrumentar_metodos
 class Database:
     """Capa de acceso a datos con patrón Singleton"""
     _instance = None
+
+    # Catálogos cacheados en memoria: nombre -> consulta (con ? si depende de la marca)
+    CATALOGOS = {
+        'tipos_equipo': "SELECT id, nombre FROM tipos_equipo ORDER BY nombre",
+        'marcas': "SELECT id, nombre FROM marcas ORDER BY nombre",
+        'modelos': "SELECT id, nombre FROM modelos WHERE id_marca=? ORDER BY nombre",
+        'marcas_toner': "SELECT id, nombre FROM marcas_toner ORDER BY nombre",
+        'modelos_toner': "SELECT id, nombre FROM modelos_toner WHERE id_marca=? ORDER BY nombre",
+        'empresas_recarga': "SELECT id, nombre, contacto, telefono FROM empresas_recarga ORDER BY nombre"
+    }
+
+    # Migraciones de esquema versionadas con PRAGMA user_version.
+    # Cada entrada es (versión, descripción, sentencias); nunca modificar una
+    # migración ya publicada, agregar una nueva con la versión siguiente.
+    MIGRATIONS = [
+        (1, "Índices secundarios para listados y reportes", [
+            "CREATE INDEX IF NOT EXISTS idx_equipos_estado_fecha ON equipos(estado, fecha_ingreso)",
+            "CREATE INDEX IF NOT EXISTS idx_equipos_fecha_ingreso ON equipos(fecha_ingreso)",
+            "CREATE INDEX IF NOT EXISTS idx_equipos_modelo ON equipos(id_modelo)",
+            "CREATE INDEX IF NOT EXISTS idx_repuestos_equipo ON repuestos(id_equipo)",
+            "CREATE INDEX IF NOT EXISTS idx_movimientos_toner_fecha_modelo ON movimientos_toner(fecha, id_modelo)",
+            "CREATE INDEX IF NOT EXISTS idx_movimientos_toner_modelo ON movimientos_toner(id_modelo)",
+            "CREATE INDEX IF NOT EXISTS idx_recargas_toner_fecha_envio ON recargas_toner(fecha_envio)",
+            "CREATE INDEX IF NOT EXISTS idx_auditoria_fecha ON auditoria(fecha)"
+        ]),
+        (2, "Búsqueda de texto completo sobre equipos (FTS5)", [
+            """CREATE VIRTUAL TABLE IF NOT EXISTS equipos_fts USING fts5(
+                serie, pj, ubicacion, falla, observaciones,
+                content='equipos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )""",
+            """CREATE TRIGGER IF NOT EXISTS equipos_fts_ai AFTER INSERT ON equipos BEGIN
+                INSERT INTO equipos_fts(rowid, serie, pj, ubicacion, falla, observaciones)
+                VALUES (new.id, new.serie, new.pj, new.ubicacion, new.falla, new.observaciones);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS equipos_fts_ad AFTER DELETE ON equipos BEGIN
+                INSERT INTO equipos_fts(equipos_fts, rowid, serie, pj, ubicacion, falla, observaciones)
+                VALUES ('delete', old.id, old.serie, old.pj, old.ubicacion, old.falla, old.observaciones);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS equipos_fts_au
+                AFTER UPDATE OF serie, pj, ubicacion, falla, observaciones ON equipos BEGIN
+                INSERT INTO equipos_fts(equipos_fts, rowid, serie, pj, ubicacion, falla, observaciones)
+                VALUES ('delete', old.id, old.serie, old.pj, old.ubicacion, old.falla, old.observaciones);
+                INSERT INTO equipos_fts(rowid, serie, pj, ubicacion, falla, observaciones)
+                VALUES (new.id, new.serie, new.pj, new.ubicacion, new.falla, new.observaciones);
+            END""",
+            "INSERT INTO equipos_fts(equipos_fts) VALUES ('rebuild')"
+        ]),
+        (3, "Resumen mensual de repuestos mantenido por triggers", [
+            """CREATE TABLE IF NOT EXISTS resumen_repuestos_mensual (
+                año TEXT NOT NULL,
+                mes TEXT NOT NULL,
+                nombre TEXT NOT NULL,
+                cantidad INTEGER NOT NULL DEFAULT 0,
+                costo REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (año, mes, nombre)
+            ) WITHOUT ROWID""",
+            # Cada trigger suma (o resta) el aporte de las filas afectadas al
+            # mes de ingreso del equipo y luego descarta los grupos vacíos
+            """CREATE TRIGGER IF NOT EXISTS resumen_repuestos_ai AFTER INSERT ON repuestos BEGIN
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), new.nombre,
+                       new.cantidad, COALESCE(new.costo, 0) * new.cantidad
+                FROM equipos e WHERE e.id = new.id_equipo
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS resumen_repuestos_ad AFTER DELETE ON repuestos BEGIN
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), old.nombre,
+                       -old.cantidad, -COALESCE(old.costo, 0) * old.cantidad
+                FROM equipos e WHERE e.id = old.id_equipo
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                DELETE FROM resumen_repuestos_mensual WHERE cantidad <= 0;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS resumen_repuestos_au
+                AFTER UPDATE OF id_equipo, nombre, cantidad, costo ON repuestos BEGIN
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), old.nombre,
+                       -old.cantidad, -COALESCE(old.costo, 0) * old.cantidad
+                FROM equipos e WHERE e.id = old.id_equipo
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), new.nombre,
+                       new.cantidad, COALESCE(new.costo, 0) * new.cantidad
+                FROM equipos e WHERE e.id = new.id_equipo
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                DELETE FROM resumen_repuestos_mensual WHERE cantidad <= 0;
+            END""",
+            # El período es el mes de ingreso del equipo: si cambia, mover sus repuestos
+            """CREATE TRIGGER IF NOT EXISTS resumen_repuestos_equipo_au
+                AFTER UPDATE OF fecha_ingreso ON equipos
+                WHEN strftime('%Y-%m', old.fecha_ingreso) IS NOT strftime('%Y-%m', new.fecha_ingreso)
+            BEGIN
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', old.fecha_ingreso), strftime('%m', old.fecha_ingreso), r.nombre,
+                       -SUM(r.cantidad), -SUM(COALESCE(r.costo, 0) * r.cantidad)
+                FROM repuestos r WHERE r.id_equipo = old.id GROUP BY r.nombre
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', new.fecha_ingreso), strftime('%m', new.fecha_ingreso), r.nombre,
+                       SUM(r.cantidad), SUM(COALESCE(r.costo, 0) * r.cantidad)
+                FROM repuestos r WHERE r.id_equipo = new.id GROUP BY r.nombre
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                DELETE FROM resumen_repuestos_mensual WHERE cantidad <= 0;
+            END""",
+            # Al borrar un equipo los repuestos se eliminan en cascada cuando el
+            # equipo ya no existe, así que su aporte se descuenta antes
+            """CREATE TRIGGER IF NOT EXISTS resumen_repuestos_equipo_bd BEFORE DELETE ON equipos BEGIN
+                INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', old.fecha_ingreso), strftime('%m', old.fecha_ingreso), r.nombre,
+                       -SUM(r.cantidad), -SUM(COALESCE(r.costo, 0) * r.cantidad)
+                FROM repuestos r WHERE r.id_equipo = old.id GROUP BY r.nombre
+                ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo;
+                DELETE FROM resumen_repuestos_mensual WHERE cantidad <= 0;
+            END""",
+            "DELETE FROM resumen_repuestos_mensual",
+            """INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), r.nombre,
+                       SUM(r.cantidad), SUM(COALESCE(r.costo, 0) * r.cantidad)
+                FROM repuestos r JOIN equipos e ON r.id_equipo = e.id
+                GROUP BY 1, 2, 3"""
+        ]),
+        (4, "Libro de stock de toner con cierres mensuales", [
+            _migrar_libro_toner,
+            "CREATE INDEX IF NOT EXISTS idx_movimientos_toner_fecha_modelo ON movimientos_toner(fecha, id_modelo)",
+            "CREATE INDEX IF NOT EXISTS idx_movimientos_toner_modelo_fecha ON movimientos_toner(id_modelo, fecha)",
+            "DROP INDEX IF EXISTS idx_movimientos_toner_modelo",
+            """CREATE TABLE IF NOT EXISTS stock_toner_mensual (
+                id_modelo INTEGER NOT NULL,
+                mes TEXT NOT NULL,
+                cantidad INTEGER NOT NULL,
+                PRIMARY KEY (id_modelo, mes),
+                FOREIGN KEY (id_modelo) REFERENCES modelos_toner(id) ON DELETE CASCADE
+            ) WITHOUT ROWID""",
+            # Un movimiento con fecha en un mes ya cerrado invalida ese cierre
+            # y los posteriores del modelo; se regeneran en la próxima pasada
+            """CREATE TRIGGER IF NOT EXISTS stock_toner_mensual_ai AFTER INSERT ON movimientos_toner BEGIN
+                DELETE FROM stock_toner_mensual
+                WHERE id_modelo = new.id_modelo AND mes >= strftime('%Y-%m', new.fecha);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS stock_toner_mensual_ad AFTER DELETE ON movimientos_toner BEGIN
+                DELETE FROM stock_toner_mensual
+                WHERE id_modelo = old.id_modelo AND mes >= strftime('%Y-%m', old.fecha);
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS stock_toner_mensual_au
+                AFTER UPDATE OF id_modelo, tipo, cantidad, fecha ON movimientos_toner BEGIN
+                DELETE FROM stock_toner_mensual
+                WHERE id_modelo = old.id_modelo AND mes >= strftime('%Y-%m', old.fecha);
+                DELETE FROM stock_toner_mensual
+                WHERE id_modelo = new.id_modelo AND mes >= strftime('%Y-%m', new.fecha);
+            END"""
+        ]),
+        (5, "Indicadores de equipos por tipo, marca y estado mantenidos por triggers", [
+            """CREATE TABLE IF NOT EXISTS kpi_equipos (
+                id_tipo_equipo INTEGER NOT NULL,
+                id_marca INTEGER NOT NULL,
+                estado TEXT NOT NULL,
+                cantidad INTEGER NOT NULL DEFAULT 0,
+                con_salida INTEGER NOT NULL DEFAULT 0,
+                dias_reparacion REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (id_tipo_equipo, id_marca, estado)
+            ) WITHOUT ROWID""",
+            # con_salida y dias_reparacion acumulan los equipos con fecha de
+            # salida válida y sus días entre ingreso y salida (para el promedio)
+            """CREATE TRIGGER IF NOT EXISTS kpi_equipos_ai AFTER INSERT ON equipos BEGIN
+                INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                VALUES (new.id_tipo_equipo, new.id_marca, IFNULL(new.estado, 'En reparación'), 1,
+                        (julianday(new.fecha_salida) - julianday(new.fecha_ingreso)) IS NOT NULL,
+                        IFNULL(julianday(new.fecha_salida) - julianday(new.fecha_ingreso), 0))
+                ON CONFLICT (id_tipo_equipo, id_marca, estado) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, con_salida = con_salida + excluded.con_salida,
+                    dias_reparacion = dias_reparacion + excluded.dias_reparacion;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS kpi_equipos_ad AFTER DELETE ON equipos BEGIN
+                INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                VALUES (old.id_tipo_equipo, old.id_marca, IFNULL(old.estado, 'En reparación'), -1,
+                        -((julianday(old.fecha_salida) - julianday(old.fecha_ingreso)) IS NOT NULL),
+                        -IFNULL(julianday(old.fecha_salida) - julianday(old.fecha_ingreso), 0))
+                ON CONFLICT (id_tipo_equipo, id_marca, estado) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, con_salida = con_salida + excluded.con_salida,
+                    dias_reparacion = dias_reparacion + excluded.dias_reparacion;
+                DELETE FROM kpi_equipos WHERE cantidad <= 0;
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS kpi_equipos_au
+                AFTER UPDATE OF id_tipo_equipo, id_marca, estado, fecha_ingreso, fecha_salida ON equipos BEGIN
+                INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                VALUES (old.id_tipo_equipo, old.id_marca, IFNULL(old.estado, 'En reparación'), -1,
+                        -((julianday(old.fecha_salida) - julianday(old.fecha_ingreso)) IS NOT NULL),
+                        -IFNULL(julianday(old.fecha_salida) - julianday(old.fecha_ingreso), 0))
+                ON CONFLICT (id_tipo_equipo, id_marca, estado) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, con_salida = con_salida + excluded.con_salida,
+                    dias_reparacion = dias_reparacion + excluded.dias_reparacion;
+                INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                VALUES (new.id_tipo_equipo, new.id_marca, IFNULL(new.estado, 'En reparación'), 1,
+                        (julianday(new.fecha_salida) - julianday(new.fecha_ingreso)) IS NOT NULL,
+                        IFNULL(julianday(new.fecha_salida) - julianday(new.fecha_ingreso), 0))
+                ON CONFLICT (id_tipo_equipo, id_marca, estado) DO UPDATE SET
+                    cantidad = cantidad + excluded.cantidad, con_salida = con_salida + excluded.con_salida,
+                    dias_reparacion = dias_reparacion + excluded.dias_reparacion;
+                DELETE FROM kpi_equipos WHERE cantidad <= 0;
+            END""",
+            """INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                SELECT id_tipo_equipo, id_marca, IFNULL(estado, 'En reparación'), COUNT(*),
+                       SUM((julianday(fecha_salida) - julianday(fecha_ingreso)) IS NOT NULL),
+                       TOTAL(julianday(fecha_salida) - julianday(fecha_ingreso))
+                FROM equipos GROUP BY 1, 2, 3"""
+        ]),
+    ]
+
+    # Tipos de movimiento del libro de stock de toner: nombre -> signo
+    TIPOS_MOVIMIENTO_TONER = {
+        'ingreso': 1,
+        'retiro': -1,
+        'envio_recarga': -1,
+        'recepcion_recarga': 1,
+        'ajuste_alta': 1,
+        'ajuste_baja': -1
+    }
     
     def __new__(cls):
         if cls._instance is None:
@@ -79,12 +1043,96 @@ class Database:
         return cls._instance
     
     def _initialize(self):
-        self.conn = sqlite3.connect(Config.DB_NAME, check_same_thread=False)
-        self.conn.execute("PRAGMA foreign_keys = ON")
-        self.cursor = self.conn.cursor()
+        self.monitor = MonitorConsultas() if Config.INSTRUMENTAR_CONSULTAS else None
+        self.pool = ConnectionManager(Config.DB_NAME, self.monitor)
+        self._consultas_equipos = {}  # forma del filtro -> SQL de obtener_equipos
+        self._catalogos = {}  # (catálogo, id_marca) -> (filas, nombre->id, id->nombre)
+        self._catalogos_lock = threading.Lock()
+        self._transacciones = threading.local()  # nivel de anidamiento por hilo
+        self._backup_lock = threading.Lock()  # una copia o restauración a la vez
+        self.auditoria_diferida = EscritorAuditoria(self.pool) if Config.AUDITORIA_DIFERIDA else None
         self._create_tables()
+        self._run_migrations()
         self._insert_default_data()
-        logging.info("Database initialized")
+        self.pool.preparar_conexion = self._adjuntar_archivos
+        self.pool.renovar()
+        log_db.info("Database initialized")
+
+    @property
+    def conn(self):
+        """Conexión del hilo actual"""
+        return self.pool.get_connection()
+
+    @property
+    def cursor(self):
+        """Cursor del hilo actual"""
+        return self.pool.get_cursor()
+
+    @contextmanager
+    def transaction(self):
+        """Unidad de trabajo: todo lo ejecutado dentro del bloque se confirma
+        con un único commit al salir, o se deshace si se produce una excepción.
+
+        Los bloques anidados usan SAVEPOINT: un error interno deshace solo su
+        parte y el bloque externo decide si continúa. El bloque más externo
+        abre la transacción con BEGIN IMMEDIATE para tomar el bloqueo de
+        escritura desde el inicio; si ya había cambios sin confirmar en la
+        conexión, se incorporan a esta transacción.
+
+            with db.transaction():
+                db.registrar_movimiento_toner(...)
+                db.registrar_auditoria(...)
+        """
+        conn = self.conn
+        nivel = getattr(self._transacciones, 'nivel', 0)
+        if nivel == 0:
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            self._transacciones.nivel = 1
+            # Auditoría diferida de esta transacción: se encola tras el commit
+            self._transacciones.auditoria = []
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                self._encolar_auditoria(self._transacciones.auditoria)
+            finally:
+                self._transacciones.nivel = 0
+                self._transacciones.auditoria = []
+        else:
+            savepoint = f"sp_{nivel}"
+            conn.execute(f"SAVEPOINT {savepoint}")
+            self._transacciones.nivel = nivel + 1
+            pendientes = len(self._transacciones.auditoria)
+            try:
+                yield conn
+                conn.execute(f"RELEASE {savepoint}")
+            except BaseException:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+                del self._transacciones.auditoria[pendientes:]
+                raise
+            finally:
+                self._transacciones.nivel = nivel
+
+    def _encolar_auditoria(self, registros):
+        """Pasa al escritor diferido la auditoría de una transacción confirmada;
+        si la cola sigue llena, la escribe aquí mismo en una transacción propia"""
+        rechazados = [r for r in registros if not self.auditoria_diferida.encolar(r)]
+        if rechazados:
+            with self.conn:
+                self.conn.executemany(EscritorAuditoria.SQL, rechazados)
+
+    def cerrar(self):
+        """Escribe la auditoría pendiente y cierra todas las conexiones"""
+        if self.auditoria_diferida is not None:
+            self.auditoria_diferida.cerrar()
+        if self.monitor is not None:
+            self.monitor.volcar_resumen()
+        self.pool.close_all()
     
     def _create_tables(self):
         try:
@@ -190,19 +1238,16 @@ class Database:
                 '''CREATE TABLE IF NOT EXISTS movimientos_toner (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     id_modelo INTEGER NOT NULL,
-                    id_tipo_movimiento INTEGER NOT NULL,
+                    tipo TEXT NOT NULL,      -- Ver Database.TIPOS_MOVIMIENTO_TONER
                     cantidad INTEGER NOT NULL CHECK(cantidad > 0),
-                    id_responsable INTEGER,  -- Puede ser NULL si es una recarga
-                    id_sector INTEGER,       -- Puede ser NULL si es una recarga
-                    id_empresa_recarga INTEGER,  -- Solo para movimientos de recarga
+                    responsable TEXT,        -- Puede ser NULL si es una recarga
+                    sector TEXT,             -- Puede ser NULL si es una recarga
+                    empresa_recarga TEXT,    -- Solo para movimientos de recarga
                     observaciones TEXT,
                     fecha TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     usuario_id INTEGER NOT NULL,
                     FOREIGN KEY (id_modelo) REFERENCES modelos_toner(id),
-                    FOREIGN KEY (id_tipo_movimiento) REFERENCES tipos_movimiento_toner(id),
-                    FOREIGN KEY (id_responsable) REFERENCES usuarios(id),
-                    FOREIGN KEY (id_sector) REFERENCES sectores(id),
-                    FOREIGN KEY (id_empresa_recarga) REFERENCES empresas_recarga(id),
+                    FOREIGN KEY (tipo) REFERENCES tipos_movimiento_toner(nombre),
                     FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
                 )''',
 
@@ -225,11 +1270,39 @@ class Database:
             for table in tables:
                 self.cursor.execute(table)
             self.conn.commit()
-            logging.info("Tables created successfully")
+            log_db.info("Tables created successfully")
         except sqlite3.Error as e:
-            logging.error(f"Error creating tables: {e}")
+            log_db.error(f"Error creating tables: {e}")
             raise
     
+    def _run_migrations(self):
+        """Aplica las migraciones pendientes según PRAGMA user_version"""
+        version_actual = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        pendientes = [m for m in self.MIGRATIONS if m[0] > version_actual]
+        if not pendientes:
+            return
+
+        for version, descripcion, sentencias in pendientes:
+            try:
+                self.conn.execute("BEGIN")
+                for sentencia in sentencias:
+                    # Las migraciones que necesitan inspeccionar el esquema son funciones
+                    if callable(sentencia):
+                        sentencia(self.conn)
+                    else:
+                        self.conn.execute(sentencia)
+                self.conn.execute(f"PRAGMA user_version = {int(version)}")
+                self.conn.commit()
+                log_db.info(f"Migración {version} aplicada: {descripcion}")
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                log_db.error(f"Error aplicando migración {version}: {e}")
+                raise
+
+        # Actualizar estadísticas para que el planificador use los índices nuevos
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+    
     def _insert_default_data(self):
         try:
             default_tipos = ["CPU", "Impresora", "Monitor", "Switch", "Router", "Otro"]
@@ -254,9 +1327,9 @@ class Database:
                 ("admin", hashed_pw, "admin", 1))
         
             self.conn.commit()
-            logging.info("Default data inserted")
+            log_db.info("Default data inserted")
         except sqlite3.Error as e:
-            logging.error(f"Error inserting default data: {e}")
+            log_db.error(f"Error inserting default data: {e}")
             self.conn.rollback()
             raise
 
@@ -279,9 +1352,9 @@ class Database:
                     (hp_id, modelo))
         
             self.conn.commit()
-            logging.info("Default toner data inserted")
+            log_db.info("Default toner data inserted")
         except sqlite3.Error as e:
-            logging.error(f"Error inserting default toner data: {e}")
+            log_db.error(f"Error inserting default toner data: {e}")
             self.conn.rollback()
             raise
 
@@ -302,175 +1375,502 @@ class Database:
             resultado = self.cursor.fetchone()
             
             if resultado:
-                logging.info(f"Autenticación exitosa para usuario: {username}")
+                log_db.info(f"Autenticación exitosa para usuario: {username}")
                 return resultado
             else:
-                logging.warning(f"Intento fallido de autenticación para usuario: {username}")
+                log_db.warning(f"Intento fallido de autenticación para usuario: {username}")
                 return None
                 
         except sqlite3.Error as e:
-            logging.error(f"Error en autenticación: {e}")
+            log_db.error(f"Error en autenticación: {e}")
             return None
     
+    # Caché de catálogos
+    def _catalogo(self, catalogo, id_marca=None):
+        """Devuelve (filas, nombre->id, id->nombre) del catálogo, cargándolo si hace falta"""
+        clave = (catalogo, id_marca)
+        entrada = self._catalogos.get(clave)
+        if entrada is None:
+            query = self.CATALOGOS[catalogo]
+            params = (id_marca,) if "?" in query else ()
+            filas = self.conn.execute(query, params).fetchall()
+            entrada = (filas,
+                       {fila[1]: fila[0] for fila in filas},
+                       {fila[0]: fila[1] for fila in filas})
+            with self._catalogos_lock:
+                self._catalogos[clave] = entrada
+        return entrada
+
+    def invalidar_catalogos(self, *catalogos):
+        """Descarta la caché de los catálogos indicados (todos si no se indica ninguno)"""
+        with self._catalogos_lock:
+            if not catalogos:
+                self._catalogos.clear()
+                return
+            for clave in [c for c in self._catalogos if c[0] in catalogos]:
+                del self._catalogos[clave]
+
+    def id_catalogo(self, catalogo, nombre, id_marca=None):
+        """Resuelve el ID de un elemento del catálogo a partir de su nombre"""
+        try:
+            return self._catalogo(catalogo, id_marca)[1][nombre]
+        except KeyError:
+            raise LookupError(f"'{nombre}' no existe en {catalogo}")
+
+    def nombre_catalogo(self, catalogo, id_elemento, id_marca=None):
+        """Resuelve el nombre de un elemento del catálogo a partir de su ID"""
+        return self._catalogo(catalogo, id_marca)[2].get(id_elemento)
+
     def obtener_tipos_equipo(self):
         """Obtiene todos los tipos de equipo disponibles"""
-        self.cursor.execute("SELECT id, nombre FROM tipos_equipo ORDER BY nombre")
-        return self.cursor.fetchall()
+        return list(self._catalogo('tipos_equipo')[0])
     
     def obtener_marcas(self):
         """Obtiene todas las marcas disponibles"""
-        self.cursor.execute("SELECT id, nombre FROM marcas ORDER BY nombre")
-        return self.cursor.fetchall()
+        return list(self._catalogo('marcas')[0])
     
     def agregar_marca(self, nombre, usuario_id):
         """Agrega una nueva marca al sistema"""
         try:
-            self.cursor.execute(
-                "INSERT INTO marcas (nombre) VALUES (?)", 
-                (nombre,))
+            with self.transaction():
+                self.cursor.execute(
+                    "INSERT INTO marcas (nombre) VALUES (?)", 
+                    (nombre,))
             
-            marca_id = self.cursor.lastrowid
+                marca_id = self.cursor.lastrowid
             
-            self.registrar_auditoria(
-                usuario_id, 'ALTA_MARCA', 'marcas', marca_id,
-                f"Nueva marca agregada: {nombre}")
-            
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'ALTA_MARCA', 'marcas', marca_id,
+                    f"Nueva marca agregada: {nombre}")
+            self.invalidar_catalogos('marcas')
             return marca_id
         except sqlite3.IntegrityError:
             raise ValueError("La marca ya existe")
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error agregando marca: {e}")
+            log_db.error(f"Error agregando marca: {e}")
             raise
     
     def obtener_modelos(self, id_marca):
         """Obtiene los modelos de una marca específica"""
-        self.cursor.execute(
-            "SELECT id, nombre FROM modelos WHERE id_marca=? ORDER BY nombre", 
-            (id_marca,))
-        return self.cursor.fetchall()
+        return list(self._catalogo('modelos', id_marca)[0])
     
     def agregar_modelo(self, id_marca, nombre, usuario_id):
         """Agrega un nuevo modelo a una marca"""
         try:
-            self.cursor.execute(
-                "INSERT INTO modelos (id_marca, nombre) VALUES (?, ?)", 
-                (id_marca, nombre))
-            
-            modelo_id = self.cursor.lastrowid
+            with self.transaction():
+                self.cursor.execute(
+                    "INSERT INTO modelos (id_marca, nombre) VALUES (?, ?)", 
+                    (id_marca, nombre))
             
-            self.registrar_auditoria(
-                usuario_id, 'ALTA_MODELO', 'modelos', modelo_id,
-                f"Nuevo modelo agregado: {nombre} para marca ID: {id_marca}")
+                modelo_id = self.cursor.lastrowid
             
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'ALTA_MODELO', 'modelos', modelo_id,
+                    f"Nuevo modelo agregado: {nombre} para marca ID: {id_marca}")
+            self.invalidar_catalogos('modelos')
             return modelo_id
         except sqlite3.IntegrityError:
             raise ValueError("El modelo ya existe para esta marca")
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error agregando modelo: {e}")
+            log_db.error(f"Error agregando modelo: {e}")
             raise
     
     def agregar_equipo(self, datos, usuario_id):
         """Agrega un nuevo equipo al sistema"""
         try:
-            query = '''INSERT INTO equipos 
-                (pj, id_tipo_equipo, serie, id_marca, id_modelo, ubicacion, 
-                 fecha_ingreso, fecha_salida, falla, estado, observaciones) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
-            self.cursor.execute(query, datos)
-            equipo_id = self.cursor.lastrowid
-            
-            self.registrar_auditoria(
-                usuario_id, 'ALTA_EQUIPO', 'equipos', equipo_id,
-                f"Equipo ingresado: {datos[2]} (PJ: {datos[0]})")
-            
-            self.conn.commit()
+            with self.transaction():
+                query = '''INSERT INTO equipos 
+                    (pj, id_tipo_equipo, serie, id_marca, id_modelo, ubicacion, 
+                     fecha_ingreso, fecha_salida, falla, estado, observaciones) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+                self.cursor.execute(query, datos)
+                equipo_id = self.cursor.lastrowid
+            
+                self.registrar_auditoria(
+                    usuario_id, 'ALTA_EQUIPO', 'equipos', equipo_id,
+                    f"Equipo ingresado: {datos[2]} (PJ: {datos[0]})")
             return equipo_id
         except sqlite3.IntegrityError as e:
             if "serie" in str(e):
                 raise ValueError("El número de serie ya existe")
             raise
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error agregando equipo: {e}")
+            log_db.error(f"Error agregando equipo: {e}")
             raise
 
 
+    def agregar_tipo_equipo(self, nombre, usuario_id):
+        """Agrega un nuevo tipo de equipo"""
+        try:
+            with self.transaction():
+                self.cursor.execute(
+                    "INSERT INTO tipos_equipo (nombre) VALUES (?)",
+                    (nombre,))
+                tipo_id = self.cursor.lastrowid
+                self.registrar_auditoria(
+                    usuario_id, 'ALTA_TIPO_EQUIPO', 'tipos_equipo', tipo_id,
+                    f"Nuevo tipo de equipo: {nombre}")
+            self.invalidar_catalogos('tipos_equipo')
+            return tipo_id
+        except sqlite3.IntegrityError:
+            raise ValueError("El tipo de equipo ya existe")
+
+    def equipos_por_serie(self, series, tam_lote=500):
+        """Devuelve {serie: (id, estado)} de los equipos con esas series.
+
+        Consulta por conjuntos (IN) de a tam_lote series para no superar el
+        límite de parámetros de SQLite.
+        """
+        series = list(dict.fromkeys(series))
+        encontrados = {}
+        for i in range(0, len(series), tam_lote):
+            lote = series[i:i + tam_lote]
+            marcas = ", ".join("?" * len(lote))
+            self.cursor.execute(
+                f"SELECT serie, id, estado FROM equipos WHERE serie IN ({marcas})", lote)
+            encontrados.update((serie, (equipo_id, estado))
+                               for serie, equipo_id, estado in self.cursor.fetchall())
+        return encontrados
+
+    @staticmethod
+    def _condicion_periodo(columna, año=None, mes=None):
+        """Construye condiciones de rango semiabierto (columna >= ? AND columna < ?)
+        para un año y/o mes, de modo que SQLite pueda usar el índice de la columna.
+
+        Retorna una tupla (condiciones, parámetros). Si solo se indica el mes,
+        no existe un rango contiguo y se filtra por strftime como antes.
+        """
+        if not año:
+            if mes:
+                return [f"strftime('%m', {columna}) = ?"], [f"{int(mes):02d}"]
+            return [], []
+
+        año = int(año)
+        if mes:
+            mes = int(mes)
+            desde = f"{año:04d}-{mes:02d}-01"
+            hasta = f"{año + 1:04d}-01-01" if mes == 12 else f"{año:04d}-{mes + 1:02d}-01"
+        else:
+            desde = f"{año:04d}-01-01"
+            hasta = f"{año + 1:04d}-01-01"
+        return [f"{columna} >= ?", f"{columna} < ?"], [desde, hasta]
+
+    # Agregado de repuestos por mes de ingreso del equipo (fuente del resumen);
+    # incluye el archivo histórico, cuyo aporte el resumen conserva
+    _AGREGADO_REPUESTOS = """
+        SELECT strftime('%Y', e.fecha_ingreso) AS año, strftime('%m', e.fecha_ingreso) AS mes,
+               r.nombre, SUM(r.cantidad), SUM(COALESCE(r.costo, 0) * r.cantidad)
+        FROM repuestos_historico r JOIN equipos_historico e ON r.id_equipo = e.id
+        GROUP BY 1, 2, 3
+    """
+
     def obtener_resumen_repuestos(self, año=None, mes=None):
-        """Obtiene un resumen de repuestos usados agrupados por nombre y cantidad total"""
-        query = """
-            SELECT 
-                r.nombre, 
-                SUM(r.cantidad) as cantidad_total,
-                strftime('%m', e.fecha_ingreso) as mes,
-                strftime('%Y', e.fecha_ingreso) as año
-            FROM repuestos r
-            JOIN equipos e ON r.id_equipo = e.id
+        """Obtiene un resumen de repuestos usados agrupados por nombre y cantidad total.
+
+        Lee la tabla resumen_repuestos_mensual (mantenida por triggers) en lugar
+        de agregar todo el historial de repuestos.
         """
-    
-        params = []
-        conditions = []
-    
+        query = "SELECT nombre, cantidad AS cantidad_total, mes, año FROM resumen_repuestos_mensual"
+        conditions, params = [], []
         if año:
-            conditions.append("strftime('%Y', e.fecha_ingreso) = ?")
-            params.append(str(año))
+            conditions.append("año = ?")
+            params.append(f"{int(año):04d}")
         if mes:
-            conditions.append("strftime('%m', e.fecha_ingreso) = ?")
-            params.append(f"{mes:02d}")
+            conditions.append("mes = ?")
+            params.append(f"{int(mes):02d}")
     
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
     
-        query += " GROUP BY r.nombre, mes, año ORDER BY año, mes, cantidad_total DESC"
+        query += " ORDER BY año, mes, cantidad_total DESC"
     
         self.cursor.execute(query, params)
-        return self.cursor.fetchall()  
+        return self.cursor.fetchall()
+
+    def reconstruir_resumen_repuestos(self):
+        """Vuelve a calcular resumen_repuestos_mensual desde repuestos y equipos"""
+        with self.transaction():
+            self.cursor.execute("DELETE FROM resumen_repuestos_mensual")
+            self.cursor.execute(
+                "INSERT INTO resumen_repuestos_mensual (año, mes, nombre, cantidad, costo) "
+                + self._AGREGADO_REPUESTOS)
+            filas = self.cursor.rowcount
+        log_db.info(f"Resumen mensual de repuestos reconstruido: {filas} grupos")
+        return filas
+
+    def verificar_resumen_repuestos(self):
+        """Compara el resumen con el agregado real.
+
+        Devuelve la lista de diferencias (año, mes, nombre, cantidad_resumen,
+        cantidad_real, costo_resumen, costo_real); vacía si es consistente.
+        """
+        self.cursor.execute(self._AGREGADO_REPUESTOS)
+        real = {fila[:3]: (fila[3], round(fila[4], 2)) for fila in self.cursor.fetchall()}
+        self.cursor.execute("SELECT año, mes, nombre, cantidad, costo FROM resumen_repuestos_mensual")
+        resumen = {fila[:3]: (fila[3], round(fila[4], 2)) for fila in self.cursor.fetchall()}
+
+        diferencias = []
+        for clave in sorted(set(real) | set(resumen)):
+            cant_resumen, costo_resumen = resumen.get(clave, (0, 0.0))
+            cant_real, costo_real = real.get(clave, (0, 0.0))
+            if cant_resumen != cant_real or abs(costo_resumen - costo_real) > 0.01:
+                diferencias.append((*clave, cant_resumen, cant_real, costo_resumen, costo_real))
+        if diferencias:
+            log_db.warning(f"Resumen mensual de repuestos inconsistente: {len(diferencias)} grupos")
+        return diferencias  
+
+    # Agregado de equipos por tipo, marca y estado (fuente de kpi_equipos)
+    _AGREGADO_KPI = """
+        SELECT id_tipo_equipo, id_marca, IFNULL(estado, 'En reparación'), COUNT(*),
+               SUM((julianday(fecha_salida) - julianday(fecha_ingreso)) IS NOT NULL),
+               TOTAL(julianday(fecha_salida) - julianday(fecha_ingreso))
+        FROM equipos_historico GROUP BY 1, 2, 3
+    """
+
+    def obtener_tablero(self, meses=12):
+        """Indicadores del tablero de MainView, leídos de kpi_equipos y
+        resumen_repuestos_mensual (tablas chicas mantenidas por triggers).
+
+        Devuelve un dict con:
+          por_estado: {estado: cantidad}
+          por_tipo_marca: [(tipo, marca, {estado: cantidad})] de mayor a menor
+          dias_promedio: días promedio entre ingreso y salida (None sin datos)
+          costo_mensual: [(año, mes, cantidad, costo)] de los últimos `meses`
+        """
+        self.cursor.execute("""
+            SELECT te.nombre, ma.nombre, k.estado, k.cantidad, k.con_salida, k.dias_reparacion
+            FROM kpi_equipos k
+            JOIN tipos_equipo te ON k.id_tipo_equipo = te.id
+            JOIN marcas ma ON k.id_marca = ma.id
+        """)
+        por_estado, grupos = {}, {}
+        con_salida, dias = 0, 0.0
+        for tipo, marca, estado, cantidad, salidas, dias_grupo in self.cursor.fetchall():
+            por_estado[estado] = por_estado.get(estado, 0) + cantidad
+            grupo = grupos.setdefault((tipo, marca), {})
+            grupo[estado] = grupo.get(estado, 0) + cantidad
+            con_salida += salidas
+            dias += dias_grupo
+        por_tipo_marca = sorted(((tipo, marca, estados) for (tipo, marca), estados in grupos.items()),
+                                key=lambda g: (-sum(g[2].values()), g[0], g[1]))
+
+        self.cursor.execute("""
+            SELECT año, mes, SUM(cantidad), SUM(costo) FROM resumen_repuestos_mensual
+            GROUP BY año, mes ORDER BY año DESC, mes DESC LIMIT ?
+        """, (meses,))
+        return {
+            'por_estado': por_estado,
+            'por_tipo_marca': por_tipo_marca,
+            'dias_promedio': dias / con_salida if con_salida else None,
+            'costo_mensual': self.cursor.fetchall()
+        }
+
+    def reconstruir_kpi_equipos(self):
+        """Vuelve a calcular kpi_equipos desde los equipos (incluido el archivo)"""
+        with self.transaction():
+            self.cursor.execute("DELETE FROM kpi_equipos")
+            self.cursor.execute(
+                "INSERT INTO kpi_equipos (id_tipo_equipo, id_marca, estado, cantidad, con_salida, "
+                "dias_reparacion) " + self._AGREGADO_KPI)
+            filas = self.cursor.rowcount
+        log_db.info(f"Indicadores de equipos reconstruidos: {filas} grupos")
+        return filas
+
+    def verificar_kpi_equipos(self):
+        """Compara kpi_equipos con el agregado real; devuelve las diferencias
+        (id_tipo_equipo, id_marca, estado, cantidad_kpi, cantidad_real)"""
+        self.cursor.execute(self._AGREGADO_KPI)
+        real = {fila[:3]: (fila[3], fila[4], round(fila[5], 3)) for fila in self.cursor.fetchall()}
+        self.cursor.execute("SELECT id_tipo_equipo, id_marca, estado, cantidad, con_salida, "
+                            "dias_reparacion FROM kpi_equipos")
+        kpi = {fila[:3]: (fila[3], fila[4], round(fila[5], 3)) for fila in self.cursor.fetchall()}
+
+        diferencias = [(*clave, kpi.get(clave, (0,))[0], real.get(clave, (0,))[0])
+                       for clave in sorted(set(real) | set(kpi))
+                       if kpi.get(clave, (0, 0, 0.0)) != real.get(clave, (0, 0, 0.0))]
+        if diferencias:
+            log_db.warning(f"Indicadores de equipos inconsistentes: {len(diferencias)} grupos")
+        return diferencias
     
 
     def actualizar_equipo(self, equipo_id, datos, usuario_id):
         """Actualiza un equipo existente en el sistema"""
         try:
-            query = '''UPDATE equipos SET
-                pj = ?, id_tipo_equipo = ?, serie = ?, id_marca = ?, id_modelo = ?,
-                ubicacion = ?, fecha_ingreso = ?, falla = ?, observaciones = ?
-                WHERE id = ?'''
+            with self.transaction():
+                query = '''UPDATE equipos SET
+                    pj = ?, id_tipo_equipo = ?, serie = ?, id_marca = ?, id_modelo = ?,
+                    ubicacion = ?, fecha_ingreso = ?, falla = ?, observaciones = ?
+                    WHERE id = ?'''
             
-            self.cursor.execute(query, (*datos, equipo_id))
-            
-            self.registrar_auditoria(
-                usuario_id, 'MODIFICAR_EQUIPO', 'equipos', equipo_id,
-                f"Equipo modificado: {datos[2]} (PJ: {datos[0]})")
+                self.cursor.execute(query, (*datos, equipo_id))
             
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'MODIFICAR_EQUIPO', 'equipos', equipo_id,
+                    f"Equipo modificado: {datos[2]} (PJ: {datos[0]})")
             return True
         except sqlite3.IntegrityError as e:
             if "serie" in str(e):
                 raise ValueError("El número de serie ya existe en otro equipo")
             raise
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error actualizando equipo: {e}")
+            log_db.error(f"Error actualizando equipo: {e}")
             raise
     
-    def obtener_equipos(self, filtro=None):
-        """Obtiene todos los equipos con opción de filtrado"""
-        query = """
-            SELECT e.id, e.pj, te.nombre, ma.nombre, mo.nombre, e.ubicacion, 
+    def _consulta_equipos(self, filtro, keyset=False, paginada=False, historico=False):
+        """Devuelve el SQL para la forma del filtro, reutilizando el ya construido"""
+        forma = filtro.forma() if filtro else ()
+        clave = (forma, keyset, paginada, historico)
+        query = self._consultas_equipos.get(clave)
+        if query is None:
+            query = f"""
+                SELECT e.id, e.pj, te.nombre, ma.nombre, mo.nombre, e.ubicacion, 
+                       e.fecha_ingreso, e.fecha_salida, e.estado
+                FROM {'equipos_historico' if historico else 'equipos'} e
+                JOIN tipos_equipo te ON e.id_tipo_equipo = te.id
+                JOIN marcas ma ON e.id_marca = ma.id
+                JOIN modelos mo ON e.id_modelo = mo.id
+            """
+            condiciones = filtro.condiciones()[0] if forma else []
+            if keyset:
+                condiciones.append("e.id < ?")
+            if condiciones:
+                query += " WHERE " + " AND ".join(condiciones)
+            query += " ORDER BY e.id DESC"
+            if paginada:
+                query += " LIMIT ?"
+            self._consultas_equipos[clave] = query
+        return query
+
+    def obtener_equipos(self, filtro=None, despues_de_id=None, limite=None, historico=False):
+        """Obtiene los equipos con opción de filtrado (FiltroEquipos).
+
+        Con despues_de_id y limite se obtiene una página por keyset sobre
+        e.id DESC: los siguientes `limite` equipos con id menor al indicado.
+        Con historico=True incluye los equipos archivados (equipos_historico).
+        """
+        if filtro is not None and not isinstance(filtro, FiltroEquipos):
+            raise ValueError("El filtro debe ser una instancia de FiltroEquipos")
+
+        query = self._consulta_equipos(filtro, despues_de_id is not None, limite is not None,
+                                       historico)
+        params = filtro.parametros() if filtro else []
+        if despues_de_id is not None:
+            params.append(despues_de_id)
+        if limite is not None:
+            params.append(limite)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    @staticmethod
+    def _consulta_fts(texto):
+        """Convierte el texto ingresado en una consulta FTS5 de prefijos (AND implícito)"""
+        palabras = re.findall(r"\w+", texto or "")
+        return " ".join('"' + p.replace('"', '""') + '"*' for p in palabras)
+
+    def buscar_equipos(self, texto, limit=None):
+        """Busca equipos por serie, PJ, ubicación, falla u observaciones.
+
+        Cada palabra se busca como prefijo y los resultados se ordenan por
+        relevancia (bm25, con más peso en serie y PJ). Si el texto es un número
+        y coincide con un ID, ese equipo aparece primero. Devuelve filas con
+        la misma forma que obtener_equipos.
+        """
+        limit = limit or Config.BUSQUEDA_LIMITE
+        consulta = self._consulta_fts(texto)
+        if not consulta:
+            return []
+
+        columnas = """
+            SELECT e.id, e.pj, te.nombre, ma.nombre, mo.nombre, e.ubicacion,
                    e.fecha_ingreso, e.fecha_salida, e.estado
             FROM equipos e
             JOIN tipos_equipo te ON e.id_tipo_equipo = te.id
             JOIN marcas ma ON e.id_marca = ma.id
             JOIN modelos mo ON e.id_modelo = mo.id
         """
-        if filtro:
-            query += f" WHERE {filtro}"
-        query += " ORDER BY e.id DESC"
-        
-        self.cursor.execute(query)
-        return self.cursor.fetchall()
+        try:
+            self.cursor.execute(columnas + """
+                JOIN (SELECT rowid, bm25(equipos_fts, 10.0, 5.0, 2.0, 1.0, 1.0) AS rango
+                      FROM equipos_fts WHERE equipos_fts MATCH ?
+                      ORDER BY rango LIMIT ?) f ON f.rowid = e.id
+                ORDER BY f.rango
+            """, (consulta, limit))
+            filas = self.cursor.fetchall()
+
+            texto = texto.strip()
+            if texto.isdigit():
+                equipo_id = int(texto)
+                por_id = next((f for f in filas if f[0] == equipo_id), None)
+                if por_id is None:
+                    self.cursor.execute(columnas + " WHERE e.id = ?", (equipo_id,))
+                    por_id = self.cursor.fetchone()
+                if por_id:
+                    filas = [por_id] + [f for f in filas if f[0] != equipo_id][:limit - 1]
+            return filas
+        except sqlite3.Error as e:
+            log_db.error(f"Error en búsqueda de equipos '{texto}': {e}")
+            raise
+
+    def iterar_consulta(self, query, params=(), tamaño_lote=None):
+        """Recorre el resultado de una consulta por lotes sin cargarlo completo.
+
+        Usa un cursor propio para no interferir con self.cursor; pensado para
+        exportaciones que escriben fila por fila.
+        """
+        tamaño_lote = tamaño_lote or Config.EXPORT_BATCH_SIZE
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                filas = cursor.fetchmany(tamaño_lote)
+                if not filas:
+                    break
+                yield from filas
+        finally:
+            cursor.close()
+
+    def iterar_equipos(self, filtro=None, historico=False):
+        """Iterador de equipos para exportaciones grandes (mismo orden que obtener_equipos)"""
+        return self.iterar_consulta(self._consulta_equipos(filtro, historico=historico),
+                                    filtro.parametros() if filtro else [])
+
+    def iterar_auditoria(self, año=None):
+        """Iterador de registros de auditoría (incluido el archivo), opcionalmente de un año"""
+        if self.auditoria_diferida is not None:
+            self.auditoria_diferida.vaciar()
+        query = """
+            SELECT a.fecha, u.username, a.accion, a.tabla_afectada, a.registro_id, a.detalles
+            FROM auditoria_historico a
+            LEFT JOIN usuarios u ON a.usuario_id = u.id
+        """
+        conditions, params = self._condicion_periodo("a.fecha", año)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY a.fecha"
+        return self.iterar_consulta(query, params)
+
+    def contar_equipos(self, filtro=None):
+        """Cuenta los equipos que cumplen el filtro.
+
+        Sin filtro y sin archivos históricos el total sale de kpi_equipos
+        (tabla chica mantenida por triggers); con archivo, kpi_equipos incluye
+        lo archivado y se cuenta la tabla viva.
+        """
+        condiciones, params = filtro.condiciones() if filtro else ([], [])
+        if not condiciones and not self.archivos_historicos():
+            self.cursor.execute("SELECT IFNULL(SUM(cantidad), 0) FROM kpi_equipos")
+            return self.cursor.fetchone()[0]
+        query = """
+            SELECT COUNT(*)
+            FROM equipos e
+            JOIN tipos_equipo te ON e.id_tipo_equipo = te.id
+            JOIN marcas ma ON e.id_marca = ma.id
+            JOIN modelos mo ON e.id_modelo = mo.id
+        """
+        if condiciones:
+            query += " WHERE " + " AND ".join(condiciones)
+        self.cursor.execute(query, params)
+        return self.cursor.fetchone()[0]
     
     def obtener_equipo_por_id(self, equipo_id):
         """Obtiene un equipo específico por su ID"""
@@ -494,13 +1894,13 @@ class Database:
         return self.cursor.fetchall()
     
     def obtener_repuestos_por_periodo(self, fecha_inicio, fecha_fin):
-        """Obtiene repuestos utilizados en un período específico"""
+        """Obtiene repuestos utilizados en un período específico (incluido el archivo)"""
         query = """
             SELECT r.nombre, SUM(r.cantidad) as cantidad_total, 
                    SUM(r.costo * r.cantidad) as costo_total, 
                    e.serie, te.nombre as tipo_equipo
-            FROM repuestos r
-            JOIN equipos e ON r.id_equipo = e.id
+            FROM repuestos_historico r
+            JOIN equipos_historico e ON r.id_equipo = e.id
             JOIN tipos_equipo te ON e.id_tipo_equipo = te.id
             WHERE e.fecha_ingreso BETWEEN ? AND ?
             GROUP BY r.nombre, e.serie, te.nombre
@@ -512,113 +1912,126 @@ class Database:
     def agregar_repuesto(self, equipo_id, nombre, cantidad, costo, usuario_id):
         """Agrega un repuesto a un equipo"""
         try:
-            # Verificar si el equipo ya está reparado
-            equipo = self.obtener_equipo_por_id(equipo_id)
-            if equipo and equipo['estado'] == "Reparado":
-                raise ValueError("No se pueden agregar repuestos a equipos ya reparados")
+            with self.transaction():
+                # Verificar si el equipo ya está reparado
+                equipo = self.obtener_equipo_por_id(equipo_id)
+                if equipo and equipo['estado'] == "Reparado":
+                    raise ValueError("No se pueden agregar repuestos a equipos ya reparados")
                 
-            self.cursor.execute(
-                "INSERT INTO repuestos (id_equipo, nombre, cantidad, costo) VALUES (?, ?, ?, ?)",
-                (equipo_id, nombre, cantidad, costo))
+                self.cursor.execute(
+                    "INSERT INTO repuestos (id_equipo, nombre, cantidad, costo) VALUES (?, ?, ?, ?)",
+                    (equipo_id, nombre, cantidad, costo))
             
-            repuesto_id = self.cursor.lastrowid
+                repuesto_id = self.cursor.lastrowid
             
-            self.registrar_auditoria(
-                usuario_id, 'AGREGAR_REPUESTO', 'repuestos', repuesto_id,
-                f"Repuesto agregado: {nombre} (Cant: {cantidad}, Costo: {costo})")
-            
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'AGREGAR_REPUESTO', 'repuestos', repuesto_id,
+                    f"Repuesto agregado: {nombre} (Cant: {cantidad}, Costo: {costo})")
             return repuesto_id
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error agregando repuesto: {e}")
+            log_db.error(f"Error agregando repuesto: {e}")
             raise
     
     def eliminar_repuesto(self, repuesto_id, usuario_id):
         """Elimina un repuesto del sistema"""
         try:
-            # Obtener datos del repuesto antes de eliminarlo para auditoría
-            self.cursor.execute(
-                "SELECT nombre, cantidad, costo FROM repuestos WHERE id = ?",
-                (repuesto_id,))
-            repuesto = self.cursor.fetchone()
-            
-            if not repuesto:
-                raise ValueError("Repuesto no encontrado")
+            with self.transaction():
+                # Obtener datos del repuesto antes de eliminarlo para auditoría
+                self.cursor.execute(
+                    "SELECT nombre, cantidad, costo FROM repuestos WHERE id = ?",
+                    (repuesto_id,))
+                repuesto = self.cursor.fetchone()
             
-            # Verificar si el equipo ya está reparado
-            self.cursor.execute(
-                "SELECT id_equipo FROM repuestos WHERE id = ?",
-                (repuesto_id,))
-            equipo_id = self.cursor.fetchone()[0]
+                if not repuesto:
+                    raise ValueError("Repuesto no encontrado")
             
-            equipo = self.obtener_equipo_por_id(equipo_id)
-            if equipo and equipo['estado'] == "Reparado":
-                raise ValueError("No se pueden modificar repuestos de equipos ya reparados")
+                # Verificar si el equipo ya está reparado
+                self.cursor.execute(
+                    "SELECT id_equipo FROM repuestos WHERE id = ?",
+                    (repuesto_id,))
+                equipo_id = self.cursor.fetchone()[0]
             
-            self.cursor.execute(
-                "DELETE FROM repuestos WHERE id = ?",
-                (repuesto_id,))
+                equipo = self.obtener_equipo_por_id(equipo_id)
+                if equipo and equipo['estado'] == "Reparado":
+                    raise ValueError("No se pueden modificar repuestos de equipos ya reparados")
             
-            self.registrar_auditoria(
-                usuario_id, 'ELIMINAR_REPUESTO', 'repuestos', repuesto_id,
-                f"Repuesto eliminado: {repuesto[0]} (Cant: {repuesto[1]}, Costo: {repuesto[2]})")
+                self.cursor.execute(
+                    "DELETE FROM repuestos WHERE id = ?",
+                    (repuesto_id,))
             
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'ELIMINAR_REPUESTO', 'repuestos', repuesto_id,
+                    f"Repuesto eliminado: {repuesto[0]} (Cant: {repuesto[1]}, Costo: {repuesto[2]})")
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error eliminando repuesto: {e}")
+            log_db.error(f"Error eliminando repuesto: {e}")
             raise
     
     def actualizar_estado_equipo(self, equipo_id, estado, observaciones, usuario_id):
         """Actualiza el estado de un equipo"""
         try:
-            # Verificar si ya está en el estado solicitado
-            equipo = self.obtener_equipo_por_id(equipo_id)
-            if equipo and equipo['estado'] == estado:
-                return  # No hacer nada si el estado es el mismo
-            
-            query = """UPDATE equipos 
-                      SET estado = ?, 
-                          observaciones = ?,
-                          fecha_salida = ?
-                      WHERE id = ?"""
-            
-            fecha_salida = datetime.now().strftime("%Y-%m-%d") if estado == "Reparado" else None
-            
-            self.cursor.execute(query, (
-                estado,
-                observaciones or None,
-                fecha_salida,
-                equipo_id
-            ))
-            
-            self.registrar_auditoria(
-                usuario_id, 'ACTUALIZAR_ESTADO', 'equipos', equipo_id,
-                f"Estado actualizado a: {estado}")
+            with self.transaction():
+                # Verificar si ya está en el estado solicitado
+                equipo = self.obtener_equipo_por_id(equipo_id)
+                if equipo and equipo['estado'] == estado:
+                    return  # No hacer nada si el estado es el mismo
+            
+                query = """UPDATE equipos 
+                          SET estado = ?, 
+                              observaciones = ?,
+                              fecha_salida = ?
+                          WHERE id = ?"""
+            
+                fecha_salida = datetime.now().strftime("%Y-%m-%d") if estado == "Reparado" else None
+            
+                self.cursor.execute(query, (
+                    estado,
+                    observaciones or None,
+                    fecha_salida,
+                    equipo_id
+                ))
             
-            self.conn.commit()
+                self.registrar_auditoria(
+                    usuario_id, 'ACTUALIZAR_ESTADO', 'equipos', equipo_id,
+                    f"Estado actualizado a: {estado}")
         except sqlite3.Error as e:
-            self.conn.rollback()
-            logging.error(f"Error actualizando estado del equipo: {e}")
+            log_db.error(f"Error actualizando estado del equipo: {e}")
             raise
     
     def registrar_auditoria(self, usuario_id, accion, tabla=None, registro_id=None, detalles=None):
-        """Registra una acción en el log de auditoría"""
+        """Registra una acción en el log de auditoría.
+
+        No confirma: el registro forma parte de la transacción del llamador,
+        que hace commit (o rollback) junto con la operación auditada. Con
+        Config.AUDITORIA_DIFERIDA y dentro de transaction(), el registro se
+        guarda aparte y se encola para el escritor en segundo plano recién
+        cuando la transacción se confirma (un rollback lo descarta); fuera de
+        transaction() no se sabe si habrá commit y se escribe en la del llamador.
+        """
+        registro = (usuario_id, accion, tabla, registro_id,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"), detalles)
+        if self.auditoria_diferida is not None and getattr(self._transacciones, 'nivel', 0):
+            self._transacciones.auditoria.append(registro)
+            return
         try:
-            self.cursor.execute(
-                """INSERT INTO auditoria 
-                (usuario_id, accion, tabla_afectada, registro_id, fecha, detalles) 
-                VALUES (?, ?, ?, ?, ?, ?)""",
-                (usuario_id, accion, tabla, registro_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), detalles))
-            self.conn.commit()
+            self.cursor.execute(EscritorAuditoria.SQL, registro)
         except sqlite3.Error as e:
-            logging.error(f"Error registrando auditoría: {e}")
-            self.conn.rollback()
+            log_db.error(f"Error registrando auditoría: {e}")
+            raise
     
+    def registrar_auditoria_lote(self, registros):
+        """Registra varias acciones (usuario_id, accion, tabla, registro_id, detalles)
+        con un solo executemany dentro de la transacción del llamador"""
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        filas = [(usuario_id, accion, tabla, registro_id, fecha, detalles)
+                 for usuario_id, accion, tabla, registro_id, detalles in registros]
+        if self.auditoria_diferida is not None and getattr(self._transacciones, 'nivel', 0):
+            self._transacciones.auditoria.extend(filas)
+        elif filas:
+            self.cursor.executemany(EscritorAuditoria.SQL, filas)
+
     def __del__(self):
-        if hasattr(self, 'conn'):
-            self.conn.close()
+        if 'pool' in self.__dict__:
+            self.pool.close_all()
 
 
 
@@ -642,32 +2055,30 @@ class Database:
         
     # Métodos para marcas de toner
     def obtener_marcas_toner(self):
-        self.cursor.execute("SELECT id, nombre FROM marcas_toner ORDER BY nombre")
-        return self.cursor.fetchall()
+        return list(self._catalogo('marcas_toner')[0])
 
     def agregar_marca_toner(self, nombre, usuario_id):
         try:
-            self.cursor.execute("INSERT INTO marcas_toner (nombre) VALUES (?)", (nombre,))
-            marca_id = self.cursor.lastrowid
-            self.registrar_auditoria(usuario_id, 'ALTA_MARCA_TONER', 'marcas_toner', marca_id, f"Nueva marca de toner: {nombre}")
-            self.conn.commit()
+            with self.transaction():
+                self.cursor.execute("INSERT INTO marcas_toner (nombre) VALUES (?)", (nombre,))
+                marca_id = self.cursor.lastrowid
+                self.registrar_auditoria(usuario_id, 'ALTA_MARCA_TONER', 'marcas_toner', marca_id, f"Nueva marca de toner: {nombre}")
+            self.invalidar_catalogos('marcas_toner')
             return marca_id
         except sqlite3.IntegrityError:
             raise ValueError("La marca ya existe")
 
     # Métodos para modelos de toner
     def obtener_modelos_toner(self, id_marca):
-        self.cursor.execute(
-            "SELECT id, nombre FROM modelos_toner WHERE id_marca=? ORDER BY nombre", 
-            (id_marca,))
-        return self.cursor.fetchall()
+        return list(self._catalogo('modelos_toner', id_marca)[0])
 
     def agregar_modelo_toner(self, id_marca, nombre, usuario_id):
         try:
-            self.cursor.execute("INSERT INTO modelos_toner (id_marca, nombre) VALUES (?, ?)", (id_marca, nombre))
-            modelo_id = self.cursor.lastrowid
-            self.registrar_auditoria(usuario_id, 'ALTA_MODELO_TONER', 'modelos_toner', modelo_id, f"Nuevo modelo de toner: {nombre}")
-            self.conn.commit()
+            with self.transaction():
+                self.cursor.execute("INSERT INTO modelos_toner (id_marca, nombre) VALUES (?, ?)", (id_marca, nombre))
+                modelo_id = self.cursor.lastrowid
+                self.registrar_auditoria(usuario_id, 'ALTA_MODELO_TONER', 'modelos_toner', modelo_id, f"Nuevo modelo de toner: {nombre}")
+            self.invalidar_catalogos('modelos_toner')
             return modelo_id
         except sqlite3.IntegrityError:
             raise ValueError("El modelo ya existe para esta marca")
@@ -685,98 +2096,270 @@ class Database:
         return self.cursor.fetchall()
 
     def actualizar_stock_toner(self, id_modelo, cantidad, usuario_id):
+        """Fija el stock de un modelo registrando un ajuste por la diferencia.
+
+        El libro de movimientos es la fuente de verdad: en lugar de pisar el
+        contador se agrega un movimiento de ajuste y el contador queda en
+        la cantidad indicada.
+        """
+        if cantidad < 0:
+            raise ValueError("La cantidad no puede ser negativa")
         try:
-            # Verificar si ya existe registro para este modelo
-            self.cursor.execute("SELECT id FROM stock_toner WHERE id_modelo=?", (id_modelo,))
-            exists = self.cursor.fetchone()
-        
-            if exists:
-                self.cursor.execute("UPDATE stock_toner SET cantidad=? WHERE id_modelo=?", (cantidad, id_modelo))
-            else:
-                self.cursor.execute("INSERT INTO stock_toner (id_modelo, cantidad) VALUES (?, ?)", (id_modelo, cantidad))
-        
-            self.registrar_auditoria(usuario_id, 'ACTUALIZAR_STOCK_TONER', 'stock_toner', id_modelo, f"Stock actualizado a {cantidad}")
-            self.conn.commit()
+            with self.transaction():
+                actual = self.stock_toner_a_fecha(None, id_modelo)
+                actual = actual[0][3] if actual else 0
+                diferencia = cantidad - actual
+                if diferencia:
+                    self._insertar_movimiento_toner(
+                        id_modelo, 'ajuste_alta' if diferencia > 0 else 'ajuste_baja',
+                        abs(diferencia), usuario_id, observaciones=f"Ajuste de inventario a {cantidad}",
+                        actualizar_contador=False)
+                self.cursor.execute("""
+                    INSERT INTO stock_toner (id_modelo, cantidad) VALUES (?, ?)
+                    ON CONFLICT (id_modelo) DO UPDATE SET cantidad = excluded.cantidad
+                """, (id_modelo, cantidad))
+        
+                self.registrar_auditoria(usuario_id, 'ACTUALIZAR_STOCK_TONER', 'stock_toner', id_modelo, f"Stock actualizado a {cantidad}")
         except sqlite3.Error as e:
-            self.conn.rollback()
+            log_db.error(f"Error actualizando stock de toner: {e}")
             raise
 
     # Métodos para movimientos de toner
+    def _insertar_movimiento_toner(self, id_modelo, tipo, cantidad, usuario_id, responsable=None,
+                                   sector=None, empresa_recarga=None, observaciones=None,
+                                   actualizar_contador=True):
+        """Agrega un movimiento al libro y aplica su signo al contador de stock.
+
+        Debe llamarse dentro de una transacción. Un retiro mayor al stock
+        hace fallar el CHECK de stock_toner y revierte también el movimiento.
+        """
+        if tipo not in self.TIPOS_MOVIMIENTO_TONER:
+            raise ValueError(f"Tipo de movimiento de toner inválido: {tipo}")
+        fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.cursor.execute("""
+            INSERT INTO movimientos_toner 
+            (id_modelo, tipo, cantidad, responsable, sector, empresa_recarga, observaciones, fecha, usuario_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (id_modelo, tipo, cantidad, responsable, sector, empresa_recarga, observaciones, fecha, usuario_id))
+        movimiento_id = self.cursor.lastrowid
+
+        signo = self.TIPOS_MOVIMIENTO_TONER[tipo]
+        if actualizar_contador and signo > 0:
+            self.cursor.execute("""
+                INSERT INTO stock_toner (id_modelo, cantidad) VALUES (?, ?)
+                ON CONFLICT (id_modelo) DO UPDATE SET cantidad = cantidad + excluded.cantidad
+            """, (id_modelo, cantidad))
+        elif actualizar_contador and signo < 0:
+            self.cursor.execute("UPDATE stock_toner SET cantidad = cantidad - ? WHERE id_modelo=?",
+                                (cantidad, id_modelo))
+            if self.cursor.rowcount == 0:
+                raise ValueError("No hay stock registrado para este modelo")
+        return movimiento_id
+
     def registrar_movimiento_toner(self, id_modelo, tipo, cantidad, responsable, sector, empresa_recarga, observaciones, usuario_id):
         try:
-            query = """
-                INSERT INTO movimientos_toner 
-                (id_modelo, tipo, cantidad, responsable, sector, empresa_recarga, observaciones, fecha, usuario_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.cursor.execute(query, (id_modelo, tipo, cantidad, responsable, sector, empresa_recarga, observaciones, fecha, usuario_id))
-        
-            # Actualizar stock según el tipo de movimiento
-            if tipo == 'retiro':
-                self.cursor.execute("UPDATE stock_toner SET cantidad = cantidad - ? WHERE id_modelo=?", (cantidad, id_modelo))
-            elif tipo == 'ingreso':
-                self.cursor.execute("UPDATE stock_toner SET cantidad = cantidad + ? WHERE id_modelo=?", (cantidad, id_modelo))
-        
-            movimiento_id = self.cursor.lastrowid
-            self.registrar_auditoria(usuario_id, 'MOVIMIENTO_TONER', 'movimientos_toner', movimiento_id, 
-                                   f"Movimiento de toner: {tipo} - Cantidad: {cantidad}")
-            self.conn.commit()
+            with self.transaction():
+                movimiento_id = self._insertar_movimiento_toner(
+                    id_modelo, tipo, cantidad, usuario_id, responsable, sector,
+                    empresa_recarga, observaciones)
+                self.registrar_auditoria(usuario_id, 'MOVIMIENTO_TONER', 'movimientos_toner', movimiento_id, 
+                                       f"Movimiento de toner: {tipo} - Cantidad: {cantidad}")
             return movimiento_id
         except sqlite3.Error as e:
-            self.conn.rollback()
+            log_db.error(f"Error registrando movimiento de toner: {e}")
             raise
 
+    # Libro de stock: cierres mensuales, stock a una fecha y conciliación
+    _STOCK_TONER_A_FECHA = """
+        SELECT mo.id, ma.nombre, mo.nombre,
+               COALESCE(sn.cantidad, 0) + COALESCE((
+                   SELECT SUM(mt.cantidad * t.afecta_stock)
+                   FROM movimientos_toner mt
+                   JOIN tipos_movimiento_toner t ON t.nombre = mt.tipo
+                   WHERE mt.id_modelo = mo.id
+                     AND mt.fecha >= COALESCE(date(sn.mes || '-01', '+1 month'), '')
+                     AND mt.fecha < :hasta), 0)
+        FROM modelos_toner mo
+        JOIN marcas_toner ma ON mo.id_marca = ma.id
+        LEFT JOIN stock_toner_mensual sn ON sn.id_modelo = mo.id
+             AND sn.mes = (SELECT MAX(s2.mes) FROM stock_toner_mensual s2
+                           WHERE s2.id_modelo = mo.id AND s2.mes < :mes)
+        WHERE :id_modelo IS NULL OR mo.id = :id_modelo
+        ORDER BY ma.nombre, mo.nombre
+    """
+
+    def stock_toner_a_fecha(self, fecha=None, id_modelo=None):
+        """Stock de cada modelo al final del día indicado (o actual si fecha es None).
+
+        Parte del último cierre mensual anterior al mes de la fecha y suma
+        los movimientos posteriores, así que no recorre toda la historia.
+        Devuelve (id_modelo, marca, modelo, cantidad) ordenado por marca y modelo.
+        """
+        if fecha is None:
+            mes, hasta = '9999-12', '9999-12-32'
+        else:
+            if isinstance(fecha, str):
+                fecha = datetime.strptime(fecha[:10], "%Y-%m-%d")
+            mes = fecha.strftime("%Y-%m")
+            hasta = (fecha + timedelta(days=1)).strftime("%Y-%m-%d")
+        self.cursor.execute(self._STOCK_TONER_A_FECHA,
+                            {'mes': mes, 'hasta': hasta, 'id_modelo': id_modelo})
+        return self.cursor.fetchall()
+
+    def generar_cierres_stock_toner(self):
+        """Guarda el stock al final de cada mes cerrado que tenga movimientos.
+
+        Es incremental: por modelo continúa desde su último cierre. Los
+        triggers de movimientos_toner borran los cierres que un movimiento
+        con fecha pasada deja desactualizados. Devuelve los cierres escritos.
+        """
+        inicio_mes = datetime.now().strftime("%Y-%m-01")
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT s.id_modelo, s.cantidad FROM stock_toner_mensual s
+                WHERE s.mes = (SELECT MAX(s2.mes) FROM stock_toner_mensual s2
+                               WHERE s2.id_modelo = s.id_modelo)
+            """)
+            saldos = dict(self.cursor.fetchall())
+            self.cursor.execute("""
+                SELECT mt.id_modelo, strftime('%Y-%m', mt.fecha), SUM(mt.cantidad * t.afecta_stock)
+                FROM movimientos_toner mt
+                JOIN tipos_movimiento_toner t ON t.nombre = mt.tipo
+                LEFT JOIN (SELECT id_modelo, MAX(mes) AS mes FROM stock_toner_mensual
+                           GROUP BY id_modelo) ul ON ul.id_modelo = mt.id_modelo
+                WHERE mt.fecha < ?
+                  AND (ul.mes IS NULL OR mt.fecha >= date(ul.mes || '-01', '+1 month'))
+                GROUP BY 1, 2
+                ORDER BY 1, 2
+            """, (inicio_mes,))
+            cierres = []
+            for id_modelo, mes, delta in self.cursor.fetchall():
+                saldos[id_modelo] = saldos.get(id_modelo, 0) + delta
+                cierres.append((id_modelo, mes, saldos[id_modelo]))
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO stock_toner_mensual (id_modelo, mes, cantidad) VALUES (?, ?, ?)",
+                cierres)
+        if cierres:
+            log_db.info(f"Cierres de stock de toner generados: {len(cierres)}")
+        return len(cierres)
+
+    def conciliar_stock_toner(self, reparar=False, usuario_id=None):
+        """Compara el contador stock_toner con el libro de movimientos.
+
+        Devuelve (id_modelo, marca, modelo, contador, libro) por cada modelo
+        con diferencia. Con reparar=True el contador se corrige al valor del
+        libro; un saldo negativo en el libro no es reparable y solo se informa.
+        """
+        with self.transaction():
+            self.cursor.execute("SELECT id_modelo, cantidad FROM stock_toner")
+            contadores = dict(self.cursor.fetchall())
+            diferencias = [(id_modelo, marca, modelo, contadores.get(id_modelo, 0), libro)
+                           for id_modelo, marca, modelo, libro in self.stock_toner_a_fecha()
+                           if contadores.get(id_modelo, 0) != libro]
+            for id_modelo, marca, modelo, contador, libro in diferencias:
+                log_db.warning(f"Stock de toner desfasado en {marca} {modelo}: "
+                                f"contador {contador}, libro {libro}")
+                if not reparar:
+                    continue
+                if libro < 0:
+                    log_db.error(f"Libro de toner con saldo negativo en {marca} {modelo}: {libro}")
+                    continue
+                self.cursor.execute("""
+                    INSERT INTO stock_toner (id_modelo, cantidad) VALUES (?, ?)
+                    ON CONFLICT (id_modelo) DO UPDATE SET cantidad = excluded.cantidad
+                """, (id_modelo, libro))
+                self.registrar_auditoria(usuario_id, 'CONCILIAR_STOCK_TONER', 'stock_toner', id_modelo,
+                                         f"Contador {contador} corregido a {libro} según movimientos")
+        return diferencias
+
     # Métodos para recargas de toner
     def registrar_recarga_toner(self, id_modelo, cantidad, empresa, observaciones, usuario_id):
-        try:
-            query = """
-                INSERT INTO recargas_toner 
-                (id_modelo, cantidad, empresa, fecha_envio, estado, observaciones, usuario_envio_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.cursor.execute(query, (id_modelo, cantidad, empresa, fecha, 'Enviado', observaciones, usuario_id))
-        
-            # Actualizar stock (restar los enviados a recarga)
-            self.cursor.execute("UPDATE stock_toner SET cantidad = cantidad - ? WHERE id_modelo=?", (cantidad, id_modelo))
-        
+        """Envía unidades a recarga: el movimiento envio_recarga descuenta el
+        stock y guarda modelo, cantidad y empresa; recargas_toner lo referencia"""
+        with self.transaction():
+            movimiento_id = self._insertar_movimiento_toner(
+                id_modelo, 'envio_recarga', cantidad, usuario_id,
+                empresa_recarga=empresa, observaciones=observaciones)
+            self.cursor.execute("""
+                INSERT INTO recargas_toner (id_movimiento_envio, estado, fecha_envio)
+                SELECT id, 'Enviado', fecha FROM movimientos_toner WHERE id = ?
+            """, (movimiento_id,))
             recarga_id = self.cursor.lastrowid
+
             self.registrar_auditoria(usuario_id, 'ENVIO_RECARGA_TONER', 'recargas_toner', recarga_id, 
                                    f"Envío a recarga: {cantidad} unidades")
-            self.conn.commit()
-            return recarga_id
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            raise
+        return recarga_id
 
     def recibir_recarga_toner(self, recarga_id, observaciones, usuario_id):
-        try:
-            # Obtener datos de la recarga
-            self.cursor.execute("SELECT id_modelo, cantidad FROM recargas_toner WHERE id=?", (recarga_id,))
+        """Recibe una recarga enviada: registra el movimiento recepcion_recarga
+        por el modelo y la cantidad del envío y lo vincula a la recarga"""
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT mt.id_modelo, mt.cantidad, mt.empresa_recarga, r.estado
+                FROM recargas_toner r
+                JOIN movimientos_toner mt ON r.id_movimiento_envio = mt.id
+                WHERE r.id = ?
+            """, (recarga_id,))
             recarga = self.cursor.fetchone()
             if not recarga:
                 raise ValueError("Recarga no encontrada")
-        
-            id_modelo, cantidad = recarga
-        
-            # Actualizar recarga
-            fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            id_modelo, cantidad, empresa, estado = recarga
+            if estado != 'Enviado':
+                raise ValueError(f"La recarga no está pendiente (estado: {estado})")
+
+            # Sumar al stock los recibidos
+            movimiento_id = self._insertar_movimiento_toner(
+                id_modelo, 'recepcion_recarga', cantidad, usuario_id,
+                empresa_recarga=empresa, observaciones=observaciones)
             self.cursor.execute("""
-                UPDATE recargas_toner 
-                SET estado='Recibido', fecha_recibo=?, observaciones=?, usuario_recibo_id=?
-                WHERE id=?
-             """, (fecha, observaciones, usuario_id, recarga_id))
-        
-            # Actualizar stock (sumar los recibidos)
-            self.cursor.execute("UPDATE stock_toner SET cantidad = cantidad + ? WHERE id_modelo=?", (cantidad, id_modelo))
-        
+                UPDATE recargas_toner
+                SET estado = 'Recibido', id_movimiento_recepcion = ?,
+                    fecha_recepcion = (SELECT fecha FROM movimientos_toner WHERE id = ?),
+                    usuario_recepcion = ?
+                WHERE id = ?
+            """, (movimiento_id, movimiento_id, usuario_id, recarga_id))
+
             self.registrar_auditoria(usuario_id, 'RECIBO_RECARGA_TONER', 'recargas_toner', recarga_id, 
                                    f"Recepción de recarga: {cantidad} unidades")
-            self.conn.commit()
-        except sqlite3.Error as e:
-            self.conn.rollback()
-            raise
+
+    def obtener_consumos_diarios_toner(self, desde):
+        """Retiros desde la fecha indicada como (id_modelo, días desde `desde`,
+        cantidad), uno por fila; se agregan del lado de numpy, lo que evita el
+        ordenamiento de un GROUP BY"""
+        self.cursor.execute("""
+            SELECT id_modelo, CAST(julianday(substr(fecha, 1, 10)) - julianday(?) AS INTEGER), cantidad
+            FROM movimientos_toner
+            WHERE fecha >= ? AND tipo = 'retiro'
+        """, (desde, desde))
+        return self.cursor.fetchall()
+
+    def obtener_modelos_para_pedido(self):
+        """Modelos de toner con su stock y recargas, como (id_modelo, marca,
+        modelo, stock, en_recarga, envíos a recarga, última empresa de recarga).
+
+        Lo que está en recarga son las recargas en estado 'Enviado'; modelo,
+        cantidad y empresa salen del movimiento de envío que cada una referencia.
+        """
+        self.cursor.execute("""
+            WITH recargas AS (
+                SELECT me.id_modelo,
+                       SUM(CASE r.estado WHEN 'Enviado' THEN me.cantidad ELSE 0 END) AS en_recarga,
+                       COUNT(*) AS envios,
+                       MAX(me.id) AS ultimo_envio
+                FROM recargas_toner r
+                JOIN movimientos_toner me ON r.id_movimiento_envio = me.id
+                GROUP BY me.id_modelo
+            )
+            SELECT mo.id, ma.nombre, mo.nombre, IFNULL(s.cantidad, 0),
+                   IFNULL(r.en_recarga, 0), IFNULL(r.envios, 0),
+                   (SELECT empresa_recarga FROM movimientos_toner WHERE id = r.ultimo_envio)
+            FROM modelos_toner mo
+            JOIN marcas_toner ma ON mo.id_marca = ma.id
+            LEFT JOIN stock_toner s ON s.id_modelo = mo.id
+            LEFT JOIN recargas r ON r.id_modelo = mo.id
+            ORDER BY ma.nombre, mo.nombre
+        """)
+        return self.cursor.fetchall()
 
     # Métodos para informes
     def obtener_movimientos_toner(self, fecha_inicio, fecha_fin, id_marca=None, id_modelo=None):
@@ -805,27 +2388,21 @@ class Database:
         return self.cursor.fetchall()
 
     def obtener_recargas_toner(self, año=None, mes=None, estado=None):
+        """Recargas con modelo, cantidad y empresa tomados del movimiento de envío;
+        el id de la recarga va al final para no correr las columnas existentes"""
         query = """
-            SELECT m.nombre as marca, mo.nombre as modelo, r.cantidad, r.empresa,
-                   r.fecha_envio, r.fecha_recibo, r.estado, ue.username as usuario_envio,
-                   ur.username as usuario_recibo
+            SELECT m.nombre as marca, mo.nombre as modelo, me.cantidad, me.empresa_recarga,
+                   r.fecha_envio, r.fecha_recepcion, r.estado, ue.username as usuario_envio,
+                   ur.username as usuario_recibo, r.id
             FROM recargas_toner r
-            JOIN modelos_toner mo ON r.id_modelo = mo.id
+            JOIN movimientos_toner me ON r.id_movimiento_envio = me.id
+            JOIN modelos_toner mo ON me.id_modelo = mo.id
             JOIN marcas_toner m ON mo.id_marca = m.id
-            JOIN usuarios ue ON r.usuario_envio_id = ue.id
-            LEFT JOIN usuarios ur ON r.usuario_recibo_id = ur.id
+            JOIN usuarios ue ON me.usuario_id = ue.id
+            LEFT JOIN usuarios ur ON r.usuario_recepcion = ur.id
         """
     
-        conditions = []
-        params = []
-    
-        if año:
-            conditions.append("strftime('%Y', r.fecha_envio) = ?")
-            params.append(str(año))
-    
-        if mes:
-            conditions.append("strftime('%m', r.fecha_envio) = ?")
-            params.append(f"{mes:02d}")
+        conditions, params = self._condicion_periodo("r.fecha_envio", año, mes)
     
         if estado:
             conditions.append("r.estado = ?")
@@ -853,9 +2430,7 @@ class Database:
 
     def obtener_empresas_recarga(self):
         """Obtiene todas las empresas de recarga"""
-        self.cursor.execute(
-            "SELECT id, nombre, contacto, telefono FROM empresas_recarga ORDER BY nombre")
-        return self.cursor.fetchall()
+        return list(self._catalogo('empresas_recarga')[0])
 
     def obtener_anios_movimientos_toner(self):
         """Obtiene los años distintos en los que hay movimientos"""
@@ -864,47 +2439,771 @@ class Database:
         return [int(row[0]) for row in self.cursor.fetchall()]
 
     def obtener_movimientos_toner_para_informe(self, año, mes=None):
-        """Obtiene movimientos para generar informes"""
+        """Obtiene los retiros (consumos) del período para generar informes.
+
+        Sin año no hay período que informar y se devuelve una lista vacía.
+        """
+        if not año:
+            return []
         query = """
-            SELECT m.fecha, ma.nombre, mo.nombre, mt.cantidad, mt.responsable, mt.sector
+            SELECT mt.fecha, ma.nombre, mo.nombre, mt.cantidad, mt.responsable, mt.sector
             FROM movimientos_toner mt
             JOIN modelos_toner mo ON mt.id_modelo = mo.id
             JOIN marcas_toner ma ON mo.id_marca = ma.id
-            WHERE strftime('%Y', mt.fecha) = ?
         """
-        params = [str(año)]
-    
-        if mes:
-            query += " AND strftime('%m', mt.fecha) = ?"
-            params.append(f"{mes:02d}")
+        conditions, params = self._condicion_periodo("mt.fecha", año, mes)
+        conditions.append("mt.tipo = 'retiro'")
+        query += " WHERE " + " AND ".join(conditions)
     
         query += " ORDER BY mt.fecha DESC"
     
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
-    def obtener_recargas_toner_para_informe(self, año, mes=None):
-        """Obtiene recargas para generar informes"""
-        query = """
-            SELECT r.fecha_envio, r.fecha_recibo, ma.nombre, mo.nombre, r.cantidad, e.nombre, r.estado
-            FROM recargas_toner r
-            JOIN modelos_toner mo ON r.id_modelo = mo.id
-            JOIN marcas_toner ma ON mo.id_marca = ma.id
-            JOIN empresas_recarga e ON r.id_empresa = e.id
-            WHERE strftime('%Y', r.fecha_envio) = ?
-        """
-        params = [str(año)]
-    
-        if mes:
-            query += " AND strftime('%m', r.fecha_envio) = ?"
-            params.append(f"{mes:02d}")
-    
-        query += " ORDER BY r.fecha_envio DESC"
-    
-        self.cursor.execute(query, params)
-        return self.cursor.fetchall()
+    def obtener_recargas_toner_para_informe(self, año, mes=None):
+        """Obtiene recargas para generar informes; modelo, cantidad y empresa
+        salen del movimiento de envío. Sin año devuelve una lista vacía.
+        """
+        if not año:
+            return []
+        query = """
+            SELECT r.fecha_envio, r.fecha_recepcion, ma.nombre, mo.nombre, me.cantidad,
+                   me.empresa_recarga, r.estado
+            FROM recargas_toner r
+            JOIN movimientos_toner me ON r.id_movimiento_envio = me.id
+            JOIN modelos_toner mo ON me.id_modelo = mo.id
+            JOIN marcas_toner ma ON mo.id_marca = ma.id
+        """
+        conditions, params = self._condicion_periodo("r.fecha_envio", año, mes)
+        query += " WHERE " + " AND ".join(conditions)
+    
+        query += " ORDER BY r.fecha_envio DESC"
+    
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    # Copias de seguridad
+    _PATRON_BACKUP = re.compile(r"_(\d{8}_\d{6})(?:-\d+)?\.db\.gz$")
+
+    @staticmethod
+    def _verificar_integridad(conn):
+        resultado = conn.execute("PRAGMA integrity_check").fetchall()
+        if resultado != [("ok",)]:
+            raise sqlite3.DatabaseError(
+                f"Verificación de integridad fallida: {'; '.join(r[0] for r in resultado[:5])}")
+
+    class _CopiaReiniciada(Exception):
+        pass
+
+    @staticmethod
+    def _copiar_paginas(origen, destino, tarea=None, mensaje="Copiando"):
+        """origen.backup(destino) por pasos, informando progreso y cediendo
+        el turno a los escritores entre paso y paso.
+
+        SQLite vuelve a empezar la copia si otra conexión escribe en el origen
+        entre dos pasos; tras Config.BACKUP_MAX_REINICIOS se copia el resto en
+        un solo paso (con WAL los escritores no se bloquean igualmente).
+        """
+        anterior = [None, 0]  # páginas restantes del paso previo, reinicios
+
+        def progreso(estado, restantes, total):
+            if anterior[0] is not None and restantes > anterior[0]:
+                anterior[1] += 1
+                if anterior[1] > Config.BACKUP_MAX_REINICIOS:
+                    raise Database._CopiaReiniciada()
+            anterior[0] = restantes
+            if tarea is not None:
+                tarea.progreso(total - restantes, total, f"{mensaje} ({total - restantes}/{total} páginas)")
+            time.sleep(Config.BACKUP_PAUSA)
+
+        try:
+            origen.backup(destino, pages=Config.BACKUP_PAGINAS_POR_PASO, progress=progreso)
+        except Database._CopiaReiniciada:
+            log_db.info("La copia se reinició por escrituras concurrentes; se completa en un solo paso")
+            origen.backup(destino)
+
+    @staticmethod
+    def _eliminar_temporal(ruta):
+        for archivo in (ruta, ruta + "-wal", ruta + "-shm", ruta + "-journal"):
+            if os.path.exists(archivo):
+                os.remove(archivo)
+
+    def _copiar_comprimido(self, ruta_origen, destino, tarea=None, mensaje="Copiando"):
+        """Copia en caliente la base ruta_origen, la verifica y la deja
+        comprimida en destino (.db.gz)"""
+        copia = destino[:-len(".gz")] + ".parcial"
+        try:
+            origen = sqlite3.connect(ruta_origen, timeout=Config.DB_TIMEOUT)
+            conn_copia = sqlite3.connect(copia)
+            try:
+                self._copiar_paginas(origen, conn_copia, tarea, mensaje)
+                self._verificar_integridad(conn_copia)
+                # Archivo autocontenido (sin -wal) para comprimir y restaurar
+                conn_copia.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                conn_copia.close()
+                origen.close()
+
+            if tarea is not None:
+                tarea.progreso(0, None, "Comprimiendo...")
+            with open(copia, 'rb') as entrada, gzip.open(destino + ".parcial", 'wb', compresslevel=6) as salida:
+                shutil.copyfileobj(entrada, salida, 1024 * 1024)
+            os.replace(destino + ".parcial", destino)
+        finally:
+            self._eliminar_temporal(copia)
+            self._eliminar_temporal(destino + ".parcial")
+
+    @staticmethod
+    def _archivos_de_backup(ruta):
+        """Archivos históricos guardados con la copia como {año: ruta .db.gz},
+        o None si no tiene manifiesto (copia anterior a que se guardaran)"""
+        base = ruta[:-len(".db.gz")]
+        if not os.path.exists(base + ".archivos.json"):
+            return None
+        with open(base + ".archivos.json", encoding='utf-8') as f:
+            años = json.load(f)["archivos"]
+        return {int(año): f"{base}.archivo_{int(año)}.db.gz" for año in años}
+
+    def crear_backup(self, directorio=None, tarea=None, rotar=True):
+        """Copia la base en caliente y devuelve la ruta del archivo .db.gz.
+
+        Usa la API de backup de SQLite sobre una conexión propia, de a
+        Config.BACKUP_PAGINAS_POR_PASO páginas, así que la aplicación puede
+        seguir leyendo y escribiendo mientras tanto. Cada archivo histórico
+        (archivo_AAAA.db) se copia junto a ella como <copia>.archivo_AAAA.db.gz
+        y un manifiesto <copia>.archivos.json registra el conjunto, ya que la
+        base y sus archivos solo son coherentes juntos. Las copias se verifican
+        con PRAGMA integrity_check antes de comprimirlas; con rotar=True
+        después se aplica rotar_backups.
+        """
+        if not self._backup_lock.acquire(blocking=False):
+            raise ValueError("Ya hay una copia de seguridad o restauración en curso")
+        try:
+            directorio = directorio or Config.BACKUP_DIR
+            os.makedirs(directorio, exist_ok=True)
+            base = os.path.splitext(os.path.basename(Config.DB_NAME))[0]
+            prefijo = os.path.join(directorio, f"{base}_{datetime.now():%Y%m%d_%H%M%S}")
+            nombre, sufijo = prefijo, 1
+            while os.path.exists(nombre + ".db.gz"):  # dos copias en el mismo segundo
+                nombre, sufijo = f"{prefijo}-{sufijo}", sufijo + 1
+            destino, manifiesto = nombre + ".db.gz", nombre + ".archivos.json"
+            archivos = self.archivos_historicos()
+            escritos = []
+
+            try:
+                # La base principal se escribe al final: su .db.gz indica que
+                # la copia está completa
+                for año, ruta in archivos.items():
+                    escritos.append(f"{nombre}.archivo_{año}.db.gz")
+                    self._copiar_comprimido(ruta, escritos[-1], tarea, f"Copiando archivo {año}")
+                escritos.append(manifiesto)
+                with open(manifiesto, 'w', encoding='utf-8') as f:
+                    json.dump({"archivos": list(archivos)}, f)
+                self._copiar_comprimido(Config.DB_NAME, destino, tarea, "Copiando")
+            except BaseException:
+                for ruta in escritos:
+                    if os.path.exists(ruta):
+                        os.remove(ruta)
+                raise
+        finally:
+            self._backup_lock.release()
+
+        log_db.info(f"Copia de seguridad creada: {destino} ({os.path.getsize(destino) // 1024} KB)")
+        if rotar:
+            self.rotar_backups(directorio)
+        return destino
+
+    def listar_backups(self, directorio=None):
+        """Copias disponibles como (ruta, fecha, tamaño en bytes), la más reciente primero"""
+        directorio = directorio or Config.BACKUP_DIR
+        if not os.path.isdir(directorio):
+            return []
+        backups = []
+        for archivo in os.listdir(directorio):
+            coincidencia = self._PATRON_BACKUP.search(archivo)
+            if coincidencia:
+                ruta = os.path.join(directorio, archivo)
+                backups.append((ruta, datetime.strptime(coincidencia.group(1), "%Y%m%d_%H%M%S"),
+                                os.path.getsize(ruta)))
+        backups.sort(key=lambda backup: backup[1], reverse=True)
+        return backups
+
+    def rotar_backups(self, directorio=None, diarias=None, semanales=None):
+        """Conserva la última copia de cada uno de los días y semanas más
+        recientes (Config.BACKUP_RETENER_*) y borra el resto; devuelve las borradas"""
+        diarias = Config.BACKUP_RETENER_DIARIAS if diarias is None else diarias
+        semanales = Config.BACKUP_RETENER_SEMANALES if semanales is None else semanales
+        backups = self.listar_backups(directorio)
+        dias, semanas, conservar = set(), set(), set()
+        for ruta, fecha, _ in backups:
+            semana = fecha.isocalendar()[:2]
+            if fecha.date() not in dias and len(dias) < diarias:
+                dias.add(fecha.date())
+                conservar.add(ruta)
+            if semana not in semanas and len(semanas) < semanales:
+                semanas.add(semana)
+                conservar.add(ruta)
+
+        borradas = [ruta for ruta, _, _ in backups if ruta not in conservar]
+        for ruta in borradas:
+            try:
+                # Primero la base: sin ella los acompañantes ya no se listan
+                os.remove(ruta)
+                for archivo in (self._archivos_de_backup(ruta) or {}).values():
+                    if os.path.exists(archivo):
+                        os.remove(archivo)
+                if os.path.exists(ruta[:-len(".db.gz")] + ".archivos.json"):
+                    os.remove(ruta[:-len(".db.gz")] + ".archivos.json")
+                log_db.info(f"Copia de seguridad rotada: {ruta}")
+            except OSError as e:
+                log_db.warning(f"No se pudo borrar la copia {ruta}: {e}")
+        return borradas
+
+    def _descomprimir_backup(self, ruta):
+        temporal = ruta[:-len(".gz")] + ".verificar"
+        with gzip.open(ruta, 'rb') as entrada, open(temporal, 'wb') as salida:
+            shutil.copyfileobj(entrada, salida, 1024 * 1024)
+        return temporal
+
+    def verificar_backup(self, ruta):
+        """Descomprime la copia (y los archivos históricos guardados con ella)
+        en temporales y corre PRAGMA integrity_check"""
+        archivos = self._archivos_de_backup(ruta) or {}
+        for copia in [ruta, *archivos.values()]:
+            if not os.path.exists(copia):
+                raise ValueError(f"Falta {os.path.basename(copia)}, que forma parte de la copia")
+            temporal = self._descomprimir_backup(copia)
+            try:
+                conn = sqlite3.connect(temporal)
+                try:
+                    self._verificar_integridad(conn)
+                finally:
+                    conn.close()
+            finally:
+                self._eliminar_temporal(temporal)
+        return True
+
+    def _volcar_backup(self, copia, ruta_destino, tarea=None, mensaje="Restaurando"):
+        """Vuelca una copia .db.gz sobre la base ruta_destino con la API de backup"""
+        temporal = self._descomprimir_backup(copia)
+        try:
+            origen = sqlite3.connect(temporal)
+            destino = sqlite3.connect(ruta_destino, timeout=Config.DB_TIMEOUT)
+            try:
+                self._copiar_paginas(origen, destino, tarea, mensaje)
+            finally:
+                destino.close()
+                origen.close()
+        finally:
+            self._eliminar_temporal(temporal)
+
+    def restaurar_backup(self, ruta, usuario_id, tarea=None):
+        """Reemplaza el contenido de la base por el de una copia .db.gz.
+
+        Antes se guarda una copia del estado actual (se devuelve su ruta). La
+        copia elegida se verifica y se vuelca sobre la base abierta con la API
+        de backup, sin cerrar la aplicación; luego se aplican las migraciones
+        pendientes por si la copia es de un esquema anterior.
+
+        Los archivos históricos vuelven al conjunto registrado en la copia: los
+        guardados se vuelcan sobre archivo_AAAA.db y los creados después se
+        vacían, porque sus filas están de nuevo en la base. Una copia sin
+        manifiesto no se restaura si hay archivos históricos, ya que no se sabe
+        qué filas de ellos contiene.
+        """
+        if not self._PATRON_BACKUP.search(os.path.basename(ruta)):
+            raise ValueError(f"{os.path.basename(ruta)} no es una copia de la base principal")
+        archivos = self._archivos_de_backup(ruta)
+        if archivos is None and self.archivos_historicos():
+            raise ValueError(
+                f"{os.path.basename(ruta)} no registra los archivos históricos y ya hay datos "
+                f"archivados en {Config.ARCHIVO_DIR}; restaurarla duplicaría esas filas")
+        if tarea is not None:
+            tarea.progreso(0, None, "Verificando la copia...")
+        self.verificar_backup(ruta)
+
+        previa = self.crear_backup(tarea=tarea, rotar=False)
+        if not self._backup_lock.acquire(blocking=False):
+            raise ValueError("Ya hay una copia de seguridad o restauración en curso")
+        try:
+            self._volcar_backup(ruta, Config.DB_NAME, tarea)
+            if archivos:
+                os.makedirs(Config.ARCHIVO_DIR, exist_ok=True)
+            for año, copia in (archivos or {}).items():
+                self._volcar_backup(copia, os.path.join(Config.ARCHIVO_DIR, f"archivo_{año}.db"),
+                                    tarea, f"Restaurando archivo {año}")
+            for año, actual in self.archivos_historicos().items():
+                if año not in (archivos or {}):
+                    # Vaciado y no borrado: otras conexiones pueden tenerlo adjunto
+                    conn = sqlite3.connect(actual, timeout=Config.DB_TIMEOUT)
+                    try:
+                        with conn:
+                            for tabla in self._COLUMNAS_ARCHIVO:
+                                conn.execute(f"DELETE FROM {tabla}")
+                    finally:
+                        conn.close()
+                    log_db.info(f"Archivo {año} vaciado: no forma parte de la copia restaurada")
+        finally:
+            self._backup_lock.release()
+
+        # Que cada hilo vuelva a adjuntar los archivos restaurados
+        self.pool.renovar()
+        self._run_migrations()
+        self.invalidar_catalogos()
+        with self.transaction():
+            self.registrar_auditoria(usuario_id, 'RESTAURAR_BACKUP', None, None,
+                                     f"Restaurada {os.path.basename(ruta)}; estado previo en {os.path.basename(previa)}")
+        log_db.warning(f"Base restaurada desde {ruta}; estado previo guardado en {previa}")
+        return previa
+
+    # Archivo histórico por año
+    _PATRON_ARCHIVO = re.compile(r"^archivo_(\d{4})\.db$")
+
+    # Tablas que se archivan y sus columnas, en el orden de las vistas *_historico
+    _COLUMNAS_ARCHIVO = {
+        'equipos': ("id", "pj", "id_tipo_equipo", "serie", "id_marca", "id_modelo", "ubicacion",
+                    "fecha_ingreso", "fecha_salida", "falla", "estado", "observaciones"),
+        'repuestos': ("id", "id_equipo", "nombre", "cantidad", "costo"),
+        'auditoria': ("id", "usuario_id", "accion", "tabla_afectada", "registro_id", "fecha", "detalles")
+    }
+
+    # Sin claves foráneas hacia los catálogos, que quedan en la base viva
+    _TABLAS_ARCHIVO = [
+        """CREATE TABLE IF NOT EXISTS {esquema}.equipos (
+            id INTEGER PRIMARY KEY,
+            pj TEXT NOT NULL,
+            id_tipo_equipo INTEGER NOT NULL,
+            serie TEXT NOT NULL,
+            id_marca INTEGER NOT NULL,
+            id_modelo INTEGER NOT NULL,
+            ubicacion TEXT,
+            fecha_ingreso TEXT NOT NULL,
+            fecha_salida TEXT,
+            falla TEXT NOT NULL,
+            estado TEXT,
+            observaciones TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS {esquema}.repuestos (
+            id INTEGER PRIMARY KEY,
+            id_equipo INTEGER NOT NULL,
+            nombre TEXT NOT NULL,
+            cantidad INTEGER NOT NULL,
+            costo REAL
+        )""",
+        """CREATE TABLE IF NOT EXISTS {esquema}.auditoria (
+            id INTEGER PRIMARY KEY,
+            usuario_id INTEGER,
+            accion TEXT NOT NULL,
+            tabla_afectada TEXT,
+            registro_id INTEGER,
+            fecha TEXT NOT NULL,
+            detalles TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS {esquema}.idx_equipos_fecha_ingreso ON equipos(fecha_ingreso)",
+        "CREATE INDEX IF NOT EXISTS {esquema}.idx_repuestos_equipo ON repuestos(id_equipo)",
+        "CREATE INDEX IF NOT EXISTS {esquema}.idx_auditoria_fecha ON auditoria(fecha)"
+    ]
+
+    def archivos_historicos(self):
+        """Archivos anuales disponibles como {año: ruta}, en orden de año"""
+        if not os.path.isdir(Config.ARCHIVO_DIR):
+            return {}
+        archivos = {}
+        for archivo in os.listdir(Config.ARCHIVO_DIR):
+            coincidencia = self._PATRON_ARCHIVO.match(archivo)
+            if coincidencia:
+                archivos[int(coincidencia.group(1))] = os.path.join(Config.ARCHIVO_DIR, archivo)
+        return dict(sorted(archivos.items()))
+
+    def _adjuntar_archivos(self, conn):
+        """Adjunta a la conexión los archivos anuales y arma las vistas
+        temporales equipos_historico, repuestos_historico y auditoria_historico
+        (la tabla viva UNION ALL la de cada archivo)"""
+        archivos = self.archivos_historicos()
+        if len(archivos) > Config.ARCHIVO_MAX_ADJUNTOS:
+            log_db.warning(f"Hay {len(archivos)} archivos históricos; solo se consultan los "
+                           f"{Config.ARCHIVO_MAX_ADJUNTOS} más recientes")
+            archivos = dict(list(archivos.items())[-Config.ARCHIVO_MAX_ADJUNTOS:])
+        deseados = {f"archivo_{año}": ruta for año, ruta in archivos.items()}
+        adjuntos = {fila[1] for fila in conn.execute("PRAGMA database_list")
+                    if fila[1].startswith("archivo_")}
+
+        for tabla in self._COLUMNAS_ARCHIVO:
+            conn.execute(f"DROP VIEW IF EXISTS temp.{tabla}_historico")
+        for esquema in adjuntos - set(deseados):
+            conn.execute(f"DETACH DATABASE {esquema}")
+        for esquema in set(deseados) - adjuntos:
+            conn.execute(f"ATTACH DATABASE ? AS {esquema}", (deseados[esquema],))
+
+        for tabla, columnas in self._COLUMNAS_ARCHIVO.items():
+            lista = ", ".join(columnas)
+            partes = [f"SELECT {lista} FROM main.{tabla}"]
+            partes += [f"SELECT {lista} FROM {esquema}.{tabla}" for esquema in deseados]
+            conn.execute(f"CREATE TEMP VIEW {tabla}_historico AS " + " UNION ALL ".join(partes))
+
+    def archivar_historial(self, año_corte, usuario_id, tarea=None):
+        """Mueve a archivo_AAAA.db lo cerrado antes del 1 de enero de año_corte.
+
+        Pasan los equipos que no están "En reparación" y cuya fecha de salida
+        (o de ingreso, si no la tienen) es anterior al corte, junto con sus
+        repuestos, y los registros de auditoría anteriores al corte; cada uno
+        al archivo del año de esa fecha. Por año se copia en una transacción y
+        se borra de la base viva en otra (un corte entre ambas deja filas
+        duplicadas que la siguiente pasada resuelve, nunca pérdidas). El
+        resumen mensual de repuestos y kpi_equipos conservan el aporte de lo
+        archivado.
+
+        Devuelve {año: (equipos, repuestos, auditoria)} con lo movido.
+        """
+        año_corte = int(año_corte)
+        if año_corte > datetime.now().year:
+            raise ValueError("El año de corte no puede ser posterior al año actual")
+        # Una copia tomada a mitad de camino tendría filas en la base y en el archivo
+        if not self._backup_lock.acquire(blocking=False):
+            raise ValueError("Hay una copia de seguridad o restauración en curso")
+        try:
+            movidos = self._archivar_historial(año_corte, tarea)
+        finally:
+            self._backup_lock.release()
+
+        # Que cada hilo adjunte los archivos nuevos en su próxima consulta
+        self.pool.renovar()
+        with self.transaction():
+            self.registrar_auditoria(
+                usuario_id, 'ARCHIVAR_HISTORIAL', None, None,
+                f"Corte {año_corte:04d}-01-01: " + ", ".join(f"{año}: {e} equipos, {a} auditoría"
+                                                            for año, (e, _, a) in movidos.items()))
+        return movidos
+
+    def _archivar_historial(self, año_corte, tarea=None):
+        """Copia y borra año por año; se llama con _backup_lock tomado"""
+        if self.auditoria_diferida is not None:
+            self.auditoria_diferida.vaciar()
+        corte = f"{año_corte:04d}-01-01"
+        cierre = "COALESCE(fecha_salida, fecha_ingreso)"
+        os.makedirs(Config.ARCHIVO_DIR, exist_ok=True)
+
+        conn = sqlite3.connect(Config.DB_NAME, timeout=Config.DB_TIMEOUT)
+        conn.execute("PRAGMA foreign_keys = ON")
+        movidos = {}
+        try:
+            años = sorted({int(fila[0]) for fila in conn.execute(f"""
+                SELECT DISTINCT strftime('%Y', {cierre}) FROM equipos
+                WHERE estado != 'En reparación' AND {cierre} < ?
+                UNION
+                SELECT DISTINCT strftime('%Y', fecha) FROM auditoria WHERE fecha < ?
+            """, (corte, corte)) if fila[0]})
+            conn.execute("CREATE TEMP TABLE a_archivar (id INTEGER PRIMARY KEY)")
+            columnas = {tabla: ", ".join(c) for tabla, c in self._COLUMNAS_ARCHIVO.items()}
+
+            for i, año in enumerate(años):
+                if tarea is not None:
+                    tarea.progreso(i, len(años), f"Archivando {año}...")
+                desde, hasta = f"{año:04d}-01-01", min(f"{año + 1:04d}-01-01", corte)
+                conn.execute("ATTACH DATABASE ? AS destino",
+                             (os.path.join(Config.ARCHIVO_DIR, f"archivo_{año}.db"),))
+                try:
+                    for sentencia in self._TABLAS_ARCHIVO:
+                        conn.execute(sentencia.format(esquema="destino"))
+
+                    with conn:
+                        conn.execute("DELETE FROM temp.a_archivar")
+                        conn.execute(f"""
+                            INSERT INTO temp.a_archivar SELECT id FROM main.equipos
+                            WHERE estado != 'En reparación' AND {cierre} >= ? AND {cierre} < ?
+                        """, (desde, hasta))
+                        equipos = conn.execute(f"""
+                            INSERT OR REPLACE INTO destino.equipos ({columnas['equipos']})
+                            SELECT {columnas['equipos']} FROM main.equipos
+                            WHERE id IN (SELECT id FROM temp.a_archivar)""").rowcount
+                        repuestos = conn.execute(f"""
+                            INSERT OR REPLACE INTO destino.repuestos ({columnas['repuestos']})
+                            SELECT {columnas['repuestos']} FROM main.repuestos
+                            WHERE id_equipo IN (SELECT id FROM temp.a_archivar)""").rowcount
+                        auditoria = conn.execute(f"""
+                            INSERT OR REPLACE INTO destino.auditoria ({columnas['auditoria']})
+                            SELECT {columnas['auditoria']} FROM main.auditoria
+                            WHERE fecha >= ? AND fecha < ?""", (desde, hasta)).rowcount
+
+                    with conn:
+                        # Los triggers descuentan del resumen y de los indicadores lo
+                        # borrado; se vuelve a sumar desde el archivo para conservar la historia
+                        conn.execute("""
+                            DELETE FROM main.equipos WHERE id IN (SELECT id FROM temp.a_archivar)
+                            AND id IN (SELECT id FROM destino.equipos)""")
+                        conn.execute("""
+                            INSERT INTO main.resumen_repuestos_mensual (año, mes, nombre, cantidad, costo)
+                            SELECT strftime('%Y', e.fecha_ingreso), strftime('%m', e.fecha_ingreso), r.nombre,
+                                   SUM(r.cantidad), SUM(COALESCE(r.costo, 0) * r.cantidad)
+                            FROM destino.repuestos r JOIN destino.equipos e ON r.id_equipo = e.id
+                            WHERE e.id IN (SELECT id FROM temp.a_archivar)
+                            GROUP BY 1, 2, 3
+                            ON CONFLICT (año, mes, nombre) DO UPDATE SET
+                                cantidad = cantidad + excluded.cantidad, costo = costo + excluded.costo""")
+                        conn.execute("""
+                            INSERT INTO main.kpi_equipos
+                                (id_tipo_equipo, id_marca, estado, cantidad, con_salida, dias_reparacion)
+                            SELECT id_tipo_equipo, id_marca, IFNULL(estado, 'En reparación'), COUNT(*),
+                                   SUM((julianday(fecha_salida) - julianday(fecha_ingreso)) IS NOT NULL),
+                                   TOTAL(julianday(fecha_salida) - julianday(fecha_ingreso))
+                            FROM destino.equipos WHERE id IN (SELECT id FROM temp.a_archivar)
+                            GROUP BY 1, 2, 3
+                            ON CONFLICT (id_tipo_equipo, id_marca, estado) DO UPDATE SET
+                                cantidad = cantidad + excluded.cantidad,
+                                con_salida = con_salida + excluded.con_salida,
+                                dias_reparacion = dias_reparacion + excluded.dias_reparacion""")
+                        conn.execute("""
+                            DELETE FROM main.auditoria WHERE fecha >= ? AND fecha < ?
+                            AND id IN (SELECT id FROM destino.auditoria)""", (desde, hasta))
+                finally:
+                    conn.execute("DETACH DATABASE destino")
+
+                movidos[año] = (equipos, repuestos, auditoria)
+                log_db.info(f"Archivo {año}: {equipos} equipos, {repuestos} repuestos, "
+                            f"{auditoria} registros de auditoría")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        return movidos
+
+
+class TreeviewVirtual:
+    """Listado paginado sobre un ttk.Treeview.
+
+    Solo se cargan las filas visibles más un margen de precarga; al acercarse
+    el scroll al final se pide la página siguiente con paginación por keyset
+    (la primera columna de cada fila debe ser el id, en orden descendente).
+    cargar_pagina(despues_de_id, limite) debe devolver la lista de filas.
+    """
+
+    def __init__(self, treeview, scrollbar, cargar_pagina, tam_pagina=None):
+        self.treeview = treeview
+        self.scrollbar = scrollbar
+        self.cargar_pagina = cargar_pagina
+        self.tam_pagina = tam_pagina or Config.PAGINA_TREEVIEW
+        self.ultimo_id = None
+        self.completo = False
+        self._cargando = False
+        self.treeview.configure(yscrollcommand=self._on_scroll)
+
+    def recargar(self):
+        """Vacía el listado y carga la primera página"""
+        children = self.treeview.get_children()
+        if children:
+            self.treeview.delete(*children)
+        self.ultimo_id = None
+        self.completo = False
+        self.cargar_mas()
+
+    def cargar_mas(self):
+        """Agrega la página siguiente al final del listado"""
+        if self.completo or self._cargando:
+            return 0
+        self._cargando = True
+        try:
+            filas = self.cargar_pagina(self.ultimo_id, self.tam_pagina)
+            for fila in filas:
+                self.treeview.insert("", tk.END, values=fila)
+            if filas:
+                self.ultimo_id = filas[-1][0]
+            self.completo = len(filas) < self.tam_pagina
+            return len(filas)
+        finally:
+            self._cargando = False
+
+    def mostrar(self, filas):
+        """Reemplaza el listado por un conjunto fijo de filas (sin paginar)"""
+        children = self.treeview.get_children()
+        if children:
+            self.treeview.delete(*children)
+        for fila in filas:
+            self.treeview.insert("", tk.END, values=fila)
+        self.ultimo_id = filas[-1][0] if filas else None
+        self.completo = True
+
+    def cantidad_cargada(self):
+        return len(self.treeview.get_children())
+
+    def _on_scroll(self, primero, ultimo):
+        self.scrollbar.set(primero, ultimo)
+        if not self.completo and float(ultimo) >= 1.0 - Config.MARGEN_PREFETCH:
+            # Diferir la carga para no insertar filas dentro del callback de scroll
+            self.treeview.after_idle(self.cargar_mas)
+
+
+class TareaCancelada(Exception):
+    """Se lanza dentro de una tarea cuando se solicitó su cancelación"""
+
+
+class Tarea:
+    """Tarea enviada al TaskExecutor; permite cancelarla e informar progreso"""
+
+    def __init__(self, executor, on_progreso=None):
+        self._executor = executor
+        self._cancelada = threading.Event()
+        self.on_progreso = on_progreso
+        self.future = None
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def cancelar(self):
+        """Solicita la cancelación; si aún no empezó, no llega a ejecutarse"""
+        self._cancelada.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def comprobar(self):
+        """Punto de cancelación cooperativa para usar dentro de la tarea"""
+        if self.cancelada:
+            raise TareaCancelada()
+
+    def progreso(self, actual, total=None, mensaje=None):
+        """Informa progreso desde el hilo de trabajo; se entrega en el hilo de Tk"""
+        self.comprobar()
+        if self.on_progreso:
+            self._executor.en_hilo_ui(self.on_progreso, actual, total, mensaje)
+
+
+class TaskExecutor:
+    """Ejecutor de tareas en segundo plano de la aplicación.
+
+    Las funciones corren en un pool de hilos (o de procesos si se pide) y los
+    resultados se entregan en el hilo de Tk mediante root.after, por lo que
+    los callbacks pueden tocar widgets directamente.
+    """
+
+    def __init__(self, root, max_workers=None, max_procesos=None):
+        self.root = root
+        self._hilos = ThreadPoolExecutor(
+            max_workers=max_workers or Config.TASK_WORKERS,
+            thread_name_prefix="tarea")
+        self._max_procesos = max_procesos or Config.TASK_PROCESSES
+        self._procesos = None
+        self._tareas = set()
+        self._lock = threading.Lock()
+        self._cerrado = False
+
+    def ejecutar(self, funcion, *args, on_exito=None, on_error=None, on_progreso=None,
+                 con_tarea=False, en_proceso=False, **kwargs):
+        """Ejecuta funcion(*args, **kwargs) en segundo plano y devuelve la Tarea.
+
+        con_tarea=True pasa la Tarea como primer argumento para que la función
+        pueda llamar a tarea.progreso() y tarea.comprobar(). en_proceso=True usa
+        el pool de procesos (la función y sus argumentos deben ser serializables
+        y no se informa progreso).
+        """
+        tarea = Tarea(self, on_progreso)
+        if con_tarea and not en_proceso:
+            args = (tarea,) + args
+
+        if en_proceso:
+            if self._procesos is None:
+                self._procesos = ProcessPoolExecutor(max_workers=self._max_procesos)
+            tarea.future = self._procesos.submit(funcion, *args, **kwargs)
+        else:
+            tarea.future = self._hilos.submit(funcion, *args, **kwargs)
+
+        with self._lock:
+            self._tareas.add(tarea)
+        tarea.future.add_done_callback(
+            lambda future: self._finalizar(tarea, future, on_exito, on_error))
+        return tarea
+
+    def _finalizar(self, tarea, future, on_exito, on_error):
+        """Se ejecuta en el hilo de trabajo al terminar; delega la entrega a Tk"""
+        with self._lock:
+            self._tareas.discard(tarea)
+        if tarea.cancelada or future.cancelled():
+            return
+
+        try:
+            resultado = future.result()
+        except (TareaCancelada, CancelledError):
+            return
+        except Exception as e:
+            log_ui.error(f"Error en tarea en segundo plano: {e}", exc_info=e)
+            if on_error:
+                self.en_hilo_ui(self._entregar, tarea, on_error, e)
+            return
+
+        if on_exito:
+            self.en_hilo_ui(self._entregar, tarea, on_exito, resultado)
+
+    @staticmethod
+    def _entregar(tarea, funcion, valor):
+        """Llama al callback en el hilo de Tk, salvo que la tarea se haya
+        cancelado mientras esperaba su turno (p. ej. al destruir la vista)"""
+        if not tarea.cancelada:
+            funcion(valor)
+
+    def en_hilo_ui(self, funcion, *args):
+        """Programa funcion(*args) en el hilo de Tk"""
+        if self._cerrado:
+            return
+        try:
+            self.root.after(0, lambda: funcion(*args))
+        except (RuntimeError, tk.TclError) as e:
+            # La ventana ya fue destruida
+            log_ui.debug(f"No se pudo entregar el resultado de la tarea: {e}")
+
+    def cancelar_todas(self):
+        with self._lock:
+            tareas = list(self._tareas)
+        for tarea in tareas:
+            tarea.cancelar()
+
+    def cerrar(self):
+        """Cancela lo pendiente y libera los pools sin bloquear la interfaz"""
+        self.cancelar_todas()
+        self._cerrado = True
+        self._hilos.shutdown(wait=False, cancel_futures=True)
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=False, cancel_futures=True)
+
+
+class DialogoProgreso(tk.Toplevel):
+    """Ventana de progreso con botón Cancelar para tareas en segundo plano"""
+
+    def __init__(self, parent, titulo, mensaje, tarea=None):
+        super().__init__(parent)
+        self.title(titulo)
+        self.geometry("320x120")
+        self.resizable(False, False)
+        self.transient(parent)
+
+        self.mensaje_var = tk.StringVar(value=mensaje)
+        ttk.Label(self, textvariable=self.mensaje_var).pack(pady=(15, 5))
+        self.barra = ttk.Progressbar(self, mode="indeterminate", length=260)
+        self.barra.pack(pady=5)
+        self.barra.start(10)
+
+        self.tarea = tarea
+        ttk.Button(self, text="Cancelar", command=self.cancelar).pack(pady=5)
+        self.protocol("WM_DELETE_WINDOW", self.cancelar)
+        self.grab_set()
+
+    def actualizar(self, actual, total=None, mensaje=None):
+        """Callback de progreso compatible con Tarea.progreso"""
+        if not self.winfo_exists():
+            return
+        if total:
+            self.barra.stop()
+            self.barra.configure(mode="determinate", maximum=total, value=actual)
+        if mensaje:
+            self.mensaje_var.set(mensaje)
+
+    def cancelar(self):
+        if self.tarea is not None:
+            self.tarea.cancelar()
+        self.cerrar()
+
+    def cerrar(self):
+        if self.winfo_exists():
+            self.grab_release()
+            self.destroy()
 
-          
 
 class LoginView(ttk.Frame):
     """Vista para el sistema de login con diseño profesional"""
@@ -958,6 +3257,7 @@ class LoginView(ttk.Frame):
         logo_frame.grid(row=0, column=0, pady=(0, 30))
         
         try:
+            from PIL import Image, ImageTk
             logo_img = Image.open("logo_pj.png")
             logo_img = logo_img.resize((120, 120), Image.Resampling.LANCZOS)
             self.logo = ImageTk.PhotoImage(logo_img)
@@ -1038,6 +3338,8 @@ class MainView(ttk.Frame):
         if not self.controller.current_user:
             self.controller.mostrar_vista("LoginView")
             return
+        self._actualizar_menu_rol()
+        self._actualizar_tablero()
     
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -1089,12 +3391,13 @@ class MainView(ttk.Frame):
                 messagebox.showerror("Error", "No se pudo generar el informe técnico")
                 
         except Exception as e:
-            logging.error(f"Error generando informe técnico: {e}")
+            log_ui.error(f"Error generando informe técnico: {e}")
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
 
     def _imprimir_informe_directo(self):
         """Opción directa para imprimir informe desde el menú"""
-        equipo_id = simpledialog.askinteger("Imprimir Informe", "Ingrese el ID del equipo:")
+        equipo_id = self._equipo_seleccionado() or simpledialog.askinteger(
+            "Imprimir Informe", "Ingrese el ID del equipo:")
         if equipo_id:
             self._generar_informe_tecnico(equipo_id)
 
@@ -1117,6 +3420,16 @@ class MainView(ttk.Frame):
         ttk.Button(toolbar, text="Nuevo Equipo", 
                   command=lambda: self.controller.mostrar_vista("EquipmentView")).pack(side=tk.LEFT, padx=5)
         
+        # Búsqueda mientras se escribe (serie, PJ, ubicación, falla, observaciones)
+        self.busqueda_var = tk.StringVar()
+        self._busqueda_after = None
+        self._busqueda_tarea = None
+        busqueda_entry = ttk.Entry(toolbar, textvariable=self.busqueda_var, width=40)
+        busqueda_entry.pack(side=tk.RIGHT, padx=5)
+        busqueda_entry.bind("<Escape>", lambda e: self.busqueda_var.set(""))
+        ttk.Label(toolbar, text="Buscar:").pack(side=tk.RIGHT)
+        self.busqueda_var.trace_add("write", lambda *args: self._programar_busqueda())
+        
         # Barra de estado
         status_bar = ttk.Label(self, textvariable=self.status_var, 
                              relief=tk.SUNKEN, anchor=tk.W,
@@ -1133,6 +3446,13 @@ class MainView(ttk.Frame):
         file_menu.add_command(label="Exportar a Excel", command=self._exportar_excel)
         file_menu.add_command(label="Exportar a Word", command=self._exportar_word)  # Opcional: si ya tienes esta función
         file_menu.add_separator()
+        file_menu.add_command(label="Importar Equipos...", command=lambda: self._importar("equipos"))
+        file_menu.add_command(label="Importar Repuestos...", command=lambda: self._importar("repuestos"))
+        file_menu.add_separator()
+        file_menu.add_command(label="Crear Copia de Seguridad", command=self._crear_backup)
+        file_menu.add_command(label="Restaurar Copia de Seguridad...", command=self._restaurar_backup)
+        file_menu.add_command(label="Archivar Historial...", command=self._archivar_historial)
+        file_menu.add_separator()
         file_menu.add_command(label="Cerrar sesión", command=self._cerrar_sesion)  # ¡Nueva opción!
         file_menu.add_separator()
         file_menu.add_command(label="Salir", command=self.controller.cerrar_aplicacion)
@@ -1169,6 +3489,10 @@ class MainView(ttk.Frame):
 
         reportes_menu.add_command(label="Resumen de Repuestos", 
                           command=lambda: self.controller.mostrar_vista("ReporteResumenRepuestosView"))
+        reportes_menu.add_command(label="Exportar Auditoría a Excel", 
+                          command=self._exportar_auditoria)
+        reportes_menu.add_command(label="Verificar Resumen de Repuestos", 
+                          command=self._verificar_resumen_repuestos)
         
         # Menú Configuración
         config_menu = tk.Menu(menubar, tearoff=0)
@@ -1179,11 +3503,11 @@ class MainView(ttk.Frame):
                               command=lambda: self.controller.mostrar_vista("ModelosView"))
         menubar.add_cascade(label="Configuración", menu=config_menu)
 
-        config_menu.add_command(label="Gestionar Usuarios", 
-                      command=lambda: self.controller.mostrar_vista("UsuariosView"))
-
-
-
+        # La vista se construye una sola vez por proceso: la entrada existe
+        # siempre y _actualizar_menu_rol la habilita según el usuario actual
+        config_menu.add_command(label="Gestionar Usuarios", command=self._gestionar_usuarios)
+        self._config_menu = config_menu
+        self._indice_gestionar_usuarios = config_menu.index(tk.END)
 
         # Menú Toner (nuevo menú)
         toner_menu = tk.Menu(menubar, tearoff=0)
@@ -1193,23 +3517,25 @@ class MainView(ttk.Frame):
                              command=lambda: self.controller.mostrar_vista("MarcasTonerView"))
         toner_menu.add_command(label="Modelos de Toner", 
                              command=lambda: self.controller.mostrar_vista("ModelosTonerView"))
+        toner_menu.add_separator()
+        toner_menu.add_command(label="Stock a una Fecha...", command=self._stock_toner_a_fecha)
+        toner_menu.add_command(label="Conciliar Stock de Toner", command=self._conciliar_stock_toner)
         menubar.add_cascade(label="Toner", menu=toner_menu)
 
                 
 
-
-        # MODIFICAR ESTA PARTE - Añadir condición para mostrar opción de usuarios  
-        if self.controller.current_user and self.controller.current_user['rol'] == 'admin':
-            config_menu.add_command(label="Gestionar Usuarios", 
-                                  command=lambda: self.controller.mostrar_vista("UsuariosView"))
-        
-             
         self.controller.root.config(menu=menubar)
         
         # Panel principal con pestañas
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # Pestaña de Tablero (indicadores precalculados)
+        self.tablero_frame = ttk.Frame(self.notebook)
+        self._setup_tablero_ui()
+        self.notebook.add(self.tablero_frame, text="Tablero")
+        self.notebook.bind("<<NotebookTabChanged>>", self._on_cambio_pestaña)
+        
         # Pestaña de Equipos
         self.equipos_frame = ttk.Frame(self.notebook)
         self._setup_equipos_ui()
@@ -1261,6 +3587,13 @@ class MainView(ttk.Frame):
         self.equipos_treeview.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        # Listado paginado: solo se cargan las filas que se van mostrando
+        self.filtro_equipos = None
+        self.equipos_lista = TreeviewVirtual(
+            self.equipos_treeview, scrollbar,
+            lambda despues_de_id, limite: self.controller.db.obtener_equipos(
+                self.filtro_equipos, despues_de_id, limite))
+        
         # Cargar datos iniciales
         self._cargar_equipos()
     
@@ -1268,30 +3601,158 @@ class MainView(ttk.Frame):
         """Configura la interfaz de la pestaña de reportes"""
         label = ttk.Label(self.reportes_frame, text="Panel de Reportes - Seleccione una opción del menú")
         label.pack(pady=50)
+
+    def _setup_tablero_ui(self):
+        """Configura la pestaña de tablero: totales por estado, equipos por
+        tipo y marca y costo de repuestos por mes"""
+        totales_frame = ttk.LabelFrame(self.tablero_frame, text="Equipos", padding="10")
+        totales_frame.pack(fill=tk.X, padx=5, pady=5)
+        self.tablero_totales = {}
+        for columna, clave in enumerate(("En reparación", "Reparado", "Irreparable", "Promedio")):
+            texto = "Días promedio de reparación" if clave == "Promedio" else clave
+            ttk.Label(totales_frame, text=texto).grid(row=0, column=columna, padx=15)
+            valor = ttk.Label(totales_frame, text="-", font=('Helvetica', 16, 'bold'))
+            valor.grid(row=1, column=columna, padx=15)
+            self.tablero_totales[clave] = valor
+        ttk.Button(totales_frame, text="Recalcular",
+                   command=self._recalcular_tablero).grid(row=0, column=4, rowspan=2, padx=15)
+
+        detalle_frame = ttk.Frame(self.tablero_frame)
+        detalle_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        detalle_frame.grid_columnconfigure(0, weight=3)
+        detalle_frame.grid_columnconfigure(1, weight=2)
+        detalle_frame.grid_rowconfigure(0, weight=1)
+
+        tipos_frame = ttk.LabelFrame(detalle_frame, text="Por tipo y marca", padding="5")
+        tipos_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
+        self.tablero_tipos = ttk.Treeview(tipos_frame, columns=(
+            "Tipo", "Marca", "En reparación", "Reparado", "Irreparable", "Total"), show="headings")
+        for col in self.tablero_tipos["columns"]:
+            self.tablero_tipos.heading(col, text=col)
+            self.tablero_tipos.column(col, width=110 if col in ("Tipo", "Marca") else 90,
+                                      anchor=tk.W if col in ("Tipo", "Marca") else tk.CENTER)
+        scrollbar = ttk.Scrollbar(tipos_frame, orient="vertical", command=self.tablero_tipos.yview)
+        self.tablero_tipos.configure(yscrollcommand=scrollbar.set)
+        self.tablero_tipos.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        costos_frame = ttk.LabelFrame(detalle_frame, text="Repuestos por mes de ingreso", padding="5")
+        costos_frame.grid(row=0, column=1, sticky="nsew")
+        self.tablero_costos = ttk.Treeview(costos_frame, columns=("Mes", "Cantidad", "Costo"),
+                                           show="headings")
+        for col in self.tablero_costos["columns"]:
+            self.tablero_costos.heading(col, text=col)
+            self.tablero_costos.column(col, width=90, anchor=tk.CENTER)
+        self.tablero_costos.pack(fill=tk.BOTH, expand=True)
+
+    def _on_cambio_pestaña(self, event=None):
+        if self.notebook.select() == str(self.tablero_frame):
+            self._actualizar_tablero()
+
+    def _actualizar_tablero(self):
+        """Lee los indicadores en segundo plano; son tablas chicas mantenidas
+        por triggers, así que no depende del tamaño del historial"""
+        self.controller.executor.ejecutar(
+            self.controller.db.obtener_tablero, on_exito=self._mostrar_tablero,
+            on_error=lambda e: log_ui.error(f"Error cargando el tablero: {e}"))
+
+    def _mostrar_tablero(self, tablero):
+        for estado in ("En reparación", "Reparado", "Irreparable"):
+            self.tablero_totales[estado].config(text=str(tablero['por_estado'].get(estado, 0)))
+        dias = tablero['dias_promedio']
+        self.tablero_totales["Promedio"].config(text="-" if dias is None else f"{dias:.1f}")
+
+        self.tablero_tipos.delete(*self.tablero_tipos.get_children())
+        for tipo, marca, estados in tablero['por_tipo_marca']:
+            self.tablero_tipos.insert("", tk.END, values=(
+                tipo, marca, estados.get("En reparación", 0), estados.get("Reparado", 0),
+                estados.get("Irreparable", 0), sum(estados.values())))
+
+        self.tablero_costos.delete(*self.tablero_costos.get_children())
+        for año, mes, cantidad, costo in tablero['costo_mensual']:
+            self.tablero_costos.insert("", tk.END, values=(f"{mes}/{año}", cantidad, f"${costo:.2f}"))
+
+    def _recalcular_tablero(self):
+        """Reconstruye los indicadores desde los equipos (por si quedaron desfasados)"""
+        self.controller.executor.ejecutar(
+            self.controller.db.reconstruir_kpi_equipos,
+            on_exito=lambda _: self._actualizar_tablero(),
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"No se pudieron recalcular los indicadores: {str(e)}"))
     
     def _cargar_equipos(self, filtro=None):
-        """Carga los equipos desde la base de datos"""
+        """Carga los equipos desde la base de datos; el total se cuenta en
+        segundo plano y se muestra en la barra de estado al terminar"""
         try:
-            # Limpiar treeview
-            for item in self.equipos_treeview.get_children():
-                self.equipos_treeview.delete(item)
-            
-            # Obtener datos
-            equipos = self.controller.db.obtener_equipos(filtro)
-            
-            # Insertar datos
-            for equipo in equipos:
-                self.equipos_treeview.insert("", tk.END, values=equipo)
-            
-            self.actualizar_status(f"{len(equipos)} equipos cargados")
+            self.filtro_equipos = filtro
+            self.equipos_lista.recargar()
         except Exception as e:
-            logging.error(f"Error cargando equipos: {e}")
+            log_ui.error(f"Error cargando equipos: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar los equipos: {str(e)}")
             self.actualizar_status("Error cargando equipos")
-    
+            return
+        
+        # Descartar un conteo anterior que siga en curso
+        if getattr(self, '_tarea_conteo', None):
+            self._tarea_conteo.cancelar()
+        
+        def mostrar_total(total):
+            self._tarea_conteo = None
+            self.actualizar_status(f"{total} equipos encontrados")
+        
+        def error(e):
+            self._tarea_conteo = None
+            log_ui.error(f"Error contando equipos: {e}")
+            self.actualizar_status("Error contando equipos")
+        
+        self.actualizar_status("Contando equipos...")
+        self._tarea_conteo = self.controller.executor.ejecutar(
+            self.controller.db.contar_equipos, filtro, on_exito=mostrar_total, on_error=error)
+    
+    def _programar_busqueda(self):
+        """Reprograma la búsqueda para que se ejecute al dejar de escribir"""
+        if self._busqueda_after is not None:
+            self.after_cancel(self._busqueda_after)
+        self._busqueda_after = self.after(Config.BUSQUEDA_DEBOUNCE_MS, self._buscar_equipos)
+
+    def _buscar_equipos(self):
+        """Ejecuta la búsqueda de texto completo y muestra los resultados"""
+        self._busqueda_after = None
+        if self._busqueda_tarea is not None:
+            self._busqueda_tarea.cancelar()
+            self._busqueda_tarea = None
+
+        texto = self.busqueda_var.get().strip()
+        if not texto:
+            self._cargar_equipos(self.filtro_equipos)
+            return
+
+        def mostrar(filas):
+            # Ignorar resultados de una búsqueda que ya fue reemplazada
+            if texto != self.busqueda_var.get().strip():
+                return
+            self.equipos_lista.mostrar(filas)
+            self.actualizar_status(f"{len(filas)} equipos coinciden con '{texto}'")
+            self.notebook.select(self.equipos_frame)
+
+        def error(e):
+            log_ui.error(f"Error buscando equipos: {e}")
+            self.actualizar_status("Error en la búsqueda")
+
+        self._busqueda_tarea = self.controller.executor.ejecutar(
+            self.controller.db.buscar_equipos, texto, on_exito=mostrar, on_error=error)
+
+    def _equipo_seleccionado(self):
+        """ID del equipo seleccionado en el listado, o None"""
+        seleccion = self.equipos_treeview.selection()
+        if not seleccion:
+            return None
+        return int(self.equipos_treeview.item(seleccion[0], "values")[0])
+
     def _editar_equipo(self):
         """Inicia el proceso de edición de un equipo"""
-        equipo_id = simpledialog.askinteger("Editar Equipo", "Ingrese el ID del equipo a editar:")
+        equipo_id = self._equipo_seleccionado() or simpledialog.askinteger(
+            "Editar Equipo", "Ingrese el ID del equipo a editar:")
     
         if equipo_id:
             try:
@@ -1312,12 +3773,13 @@ class MainView(ttk.Frame):
                 self.controller.mostrar_vista("EditarEquipoView", equipo_id)
                 
             except Exception as e:
-                logging.error(f"Error iniciando edición: {e}")
+                log_ui.error(f"Error iniciando edición: {e}")
                 messagebox.showerror("Error", f"No se pudo iniciar la edición:\n{str(e)}")
     
     def _iniciar_reparacion(self):
         """Inicia el proceso de reparación de un equipo"""
-        equipo_id = simpledialog.askinteger("Reparar Equipo", "Ingrese el ID del equipo a reparar:")
+        equipo_id = self._equipo_seleccionado() or simpledialog.askinteger(
+            "Reparar Equipo", "Ingrese el ID del equipo a reparar:")
         
         if equipo_id:
             try:
@@ -1338,7 +3800,7 @@ class MainView(ttk.Frame):
                 self.controller.mostrar_vista("ReparacionView", equipo_id)
                 
             except Exception as e:
-                logging.error(f"Error iniciando reparación: {e}")
+                log_ui.error(f"Error iniciando reparación: {e}")
                 messagebox.showerror("Error", f"No se pudo iniciar la reparación:\n{str(e)}")
     
     def _mostrar_lista_equipos(self):
@@ -1356,6 +3818,13 @@ class MainView(ttk.Frame):
         self.controller.mostrar_vista("ReporteRepuestosView")
         self.notebook.select(self.reportes_frame)
     
+    def _exportar_equipos(self, filtro, export_func, data, *args, **kwargs):
+        """Agrega a data los equipos del filtro y los exporta (corre en segundo plano)"""
+        data = list(data)
+        data.extend(["" if v is None else v for v in fila]
+                    for fila in self.controller.db.obtener_equipos(filtro))
+        return export_func(data, *args, **kwargs)
+    
     def _exportar_pdf(self):
         """Exporta los datos actuales a PDF"""
         if not self.controller.current_user:
@@ -1374,8 +3843,8 @@ class MainView(ttk.Frame):
                           for col in self.equipos_treeview["columns"]]
                 data.append(headers)
                 
-                for item in self.equipos_treeview.get_children():
-                    data.append(self.equipos_treeview.item(item)["values"])
+                # El listado está paginado: los equipos del filtro actual se
+                # leen de la base en segundo plano (ver _exportar_equipos)
                 
                 title = "Reporte de Equipos"
             else:
@@ -1389,15 +3858,12 @@ class MainView(ttk.Frame):
             )
             
             if filename:
-                if ExportManager.export_to_pdf(data, filename, title):
-                    messagebox.showinfo("Éxito", f"Reporte exportado a PDF:\n{filename}")
-                    if messagebox.askyesno("Abrir", "¿Desea abrir el archivo PDF?"):
-                        webbrowser.open(filename)
-                else:
-                    messagebox.showerror("Error", "No se pudo exportar el PDF")
+                self.controller.ejecutar_exportacion(
+                    "pdf", filename, self._exportar_equipos, self.filtro_equipos,
+                    ExportManager.export_to_pdf, data, filename, title, horizontal=True)
                     
         except Exception as e:
-            logging.error(f"Error exportando a PDF: {e}")
+            log_ui.error(f"Error exportando a PDF: {e}")
             messagebox.showerror("Error", f"Error al exportar PDF: {str(e)}")
     
     def _exportar_excel(self):
@@ -1418,8 +3884,8 @@ class MainView(ttk.Frame):
                           for col in self.equipos_treeview["columns"]]
                 data.append(headers)
                 
-                for item in self.equipos_treeview.get_children():
-                    data.append(self.equipos_treeview.item(item)["values"])
+                # El listado está paginado: los equipos del filtro actual se
+                # leen de la base en segundo plano (ver _exportar_equipos)
                 
                 sheet_name = "Equipos"
             else:
@@ -1433,15 +3899,285 @@ class MainView(ttk.Frame):
             )
             
             if filename:
-                if ExportManager.export_to_excel(data, filename, sheet_name):
-                    messagebox.showinfo("Éxito", f"Reporte exportado a Excel:\n{filename}")
-                else:
-                    messagebox.showerror("Error", "No se pudo exportar el Excel")
+                self.controller.ejecutar_exportacion(
+                    "excel", filename, ExportManager.export_to_excel_stream,
+                    self.controller.db.iterar_equipos(self.filtro_equipos), headers,
+                    filename, "Reporte de Equipos", sheet_name)
                     
         except Exception as e:
-            logging.error(f"Error exportando a Excel: {e}")
+            log_ui.error(f"Error exportando a Excel: {e}")
             messagebox.showerror("Error", f"Error al exportar Excel: {str(e)}")
     
+    def _exportar_auditoria(self):
+        """Exporta la auditoría de un año a Excel por streaming"""
+        if not self.controller.current_user:
+            messagebox.showwarning("Acceso denegado", "Debe iniciar sesión para exportar")
+            self.controller.mostrar_vista("LoginView")
+            return
+
+        año = simpledialog.askinteger("Exportar Auditoría", "Ingrese el año a exportar:",
+                                      initialvalue=datetime.now().year)
+        if not año:
+            return
+
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx")],
+            initialfile=f"auditoria_{año}",
+            title="Guardar auditoría como Excel"
+        )
+        if filename:
+            headers = ["Fecha", "Usuario", "Acción", "Tabla", "Registro", "Detalles"]
+            self.controller.ejecutar_exportacion(
+                "excel", filename, ExportManager.export_to_excel_stream,
+                self.controller.db.iterar_auditoria(año), headers,
+                filename, f"Auditoría {año}", f"Auditoria {año}")
+    
+    def _verificar_resumen_repuestos(self):
+        """Controla el resumen mensual de repuestos y ofrece reconstruirlo"""
+        db = self.controller.db
+
+        def al_verificar(diferencias):
+            if not diferencias:
+                messagebox.showinfo("Resumen de Repuestos", "El resumen mensual es consistente")
+                return
+            detalle = "\n".join(f"{mes}/{año} {nombre}: {cant_resumen} en resumen, {cant_real} real"
+                                for año, mes, nombre, cant_resumen, cant_real, _, _ in diferencias[:10])
+            if messagebox.askyesno("Resumen de Repuestos",
+                                   f"Se encontraron {len(diferencias)} diferencias:\n{detalle}\n\n"
+                                   "¿Desea reconstruir el resumen?"):
+                self.controller.executor.ejecutar(
+                    db.reconstruir_resumen_repuestos,
+                    on_exito=lambda filas: messagebox.showinfo(
+                        "Resumen de Repuestos", f"Resumen reconstruido ({filas} grupos)"),
+                    on_error=lambda e: messagebox.showerror(
+                        "Error", f"No se pudo reconstruir el resumen: {str(e)}"))
+
+        self.controller.executor.ejecutar(
+            db.verificar_resumen_repuestos, on_exito=al_verificar,
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"No se pudo verificar el resumen: {str(e)}"))
+
+    def _stock_toner_a_fecha(self):
+        """Exporta a Excel el stock de toner al cierre de una fecha (auditorías)"""
+        fecha = simpledialog.askstring("Stock a una Fecha", "Fecha (AAAA-MM-DD):",
+                                       initialvalue=datetime.now().strftime("%Y-%m-%d"))
+        if not fecha:
+            return
+        try:
+            fecha = datetime.strptime(fecha.strip(), "%Y-%m-%d")
+        except ValueError:
+            messagebox.showerror("Error", "Fecha inválida, use el formato AAAA-MM-DD")
+            return
+
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel files", "*.xlsx")],
+            initialfile=f"stock_toner_{fecha:%Y%m%d}.xlsx",
+            title="Guardar stock de toner como Excel"
+        )
+        if filename:
+            filas = ([marca, modelo, cantidad] for _, marca, modelo, cantidad
+                     in self.controller.db.stock_toner_a_fecha(fecha))
+            self.controller.ejecutar_exportacion(
+                "excel", filename, ExportManager.export_to_excel_stream,
+                filas, ["Marca", "Modelo", "Cantidad"],
+                filename, f"Stock de toner al {fecha:%d/%m/%Y}", "Stock")
+
+    def _conciliar_stock_toner(self):
+        """Controla el contador de stock de toner contra los movimientos y ofrece corregirlo"""
+        db = self.controller.db
+        usuario_id = self.controller.current_user['id'] if self.controller.current_user else None
+
+        def al_conciliar(diferencias):
+            if not diferencias:
+                messagebox.showinfo("Stock de Toner", "El stock coincide con los movimientos")
+                return
+            detalle = "\n".join(f"{marca} {modelo}: {contador} en stock, {libro} según movimientos"
+                                for _, marca, modelo, contador, libro in diferencias[:10])
+            if messagebox.askyesno("Stock de Toner",
+                                   f"Se encontraron {len(diferencias)} diferencias:\n{detalle}\n\n"
+                                   "¿Desea corregir el stock según los movimientos?"):
+                self.controller.executor.ejecutar(
+                    db.conciliar_stock_toner, True, usuario_id,
+                    on_exito=lambda _: messagebox.showinfo("Stock de Toner", "Stock corregido"),
+                    on_error=lambda e: messagebox.showerror(
+                        "Error", f"No se pudo corregir el stock: {str(e)}"))
+
+        self.controller.executor.ejecutar(
+            db.conciliar_stock_toner, on_exito=al_conciliar,
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"No se pudo conciliar el stock: {str(e)}"))
+
+    def _es_admin(self, accion):
+        if self.controller.current_user and self.controller.current_user['rol'] == 'admin':
+            return True
+        messagebox.showwarning("Acceso denegado", f"Solo un administrador puede {accion}")
+        return False
+
+    def _actualizar_menu_rol(self):
+        """Habilita las entradas de administración solo para el rol admin"""
+        usuario = self.controller.current_user
+        estado = tk.NORMAL if usuario and usuario['rol'] == 'admin' else tk.DISABLED
+        self._config_menu.entryconfigure(self._indice_gestionar_usuarios, state=estado)
+
+    def _gestionar_usuarios(self):
+        if self._es_admin("gestionar usuarios"):
+            self.controller.mostrar_vista("UsuariosView")
+
+    def _crear_backup(self):
+        """Copia la base en caliente en segundo plano, con progreso por páginas"""
+        if not self._es_admin("crear copias de seguridad"):
+            return
+        dialogo = DialogoProgreso(self.controller.root, "Copia de seguridad", "Copiando base de datos...")
+
+        def al_terminar(ruta):
+            dialogo.cerrar()
+            messagebox.showinfo("Copia de seguridad", f"Copia creada y verificada:\n{os.path.abspath(ruta)}")
+
+        def al_fallar(error):
+            dialogo.cerrar()
+            log_ui.error(f"Error creando la copia de seguridad: {error}")
+            messagebox.showerror("Error", f"No se pudo crear la copia de seguridad:\n{str(error)}")
+
+        dialogo.tarea = self.controller.executor.ejecutar(
+            lambda tarea: self.controller.db.crear_backup(tarea=tarea),
+            con_tarea=True, on_exito=al_terminar, on_error=al_fallar,
+            on_progreso=dialogo.actualizar)
+
+    def _restaurar_backup(self):
+        """Reemplaza la base por una copia elegida, guardando antes el estado actual"""
+        if not self._es_admin("restaurar copias de seguridad"):
+            return
+        ruta = filedialog.askopenfilename(
+            initialdir=Config.BACKUP_DIR,
+            filetypes=[("Copias de seguridad", "*.db.gz")],
+            title="Restaurar copia de seguridad")
+        if not ruta:
+            return
+        if not messagebox.askyesno(
+                "Restaurar copia de seguridad",
+                f"Se reemplazarán todos los datos por los de\n{os.path.basename(ruta)}\n\n"
+                "El estado actual se guardará antes en una copia. ¿Desea continuar?"):
+            return
+
+        usuario_id = self.controller.current_user['id']
+        dialogo = DialogoProgreso(self.controller.root, "Restaurar copia", "Guardando el estado actual...")
+
+        def al_terminar(previa):
+            dialogo.cerrar()
+            self._cargar_equipos(self.filtro_equipos)
+            messagebox.showinfo("Restaurar copia",
+                                f"Base restaurada. El estado anterior quedó en:\n{os.path.abspath(previa)}")
+
+        def al_fallar(error):
+            dialogo.cerrar()
+            log_ui.error(f"Error restaurando la copia {ruta}: {error}")
+            messagebox.showerror("Error", f"No se pudo restaurar la copia:\n{str(error)}")
+
+        dialogo.tarea = self.controller.executor.ejecutar(
+            lambda tarea: self.controller.db.restaurar_backup(ruta, usuario_id, tarea=tarea),
+            con_tarea=True, on_exito=al_terminar, on_error=al_fallar,
+            on_progreso=dialogo.actualizar)
+
+    def _archivar_historial(self):
+        """Mueve a los archivos anuales los equipos cerrados y la auditoría
+        anteriores al año de corte elegido"""
+        if not self._es_admin("archivar el historial"):
+            return
+        año_actual = datetime.now().year
+        año_corte = simpledialog.askinteger(
+            "Archivar historial",
+            "Archivar lo cerrado antes del 1 de enero del año:",
+            initialvalue=año_actual - Config.ARCHIVO_AÑOS_ABIERTOS + 1,
+            minvalue=1990, maxvalue=año_actual, parent=self)
+        if not año_corte:
+            return
+        if not messagebox.askyesno(
+                "Archivar historial",
+                f"Los equipos reparados o irreparables con salida anterior a {año_corte}, "
+                "sus repuestos y la auditoría de esos años pasarán a los archivos anuales.\n"
+                "Seguirán disponibles en reportes y exportaciones. ¿Desea continuar?"):
+            return
+
+        usuario_id = self.controller.current_user['id']
+        dialogo = DialogoProgreso(self.controller.root, "Archivar historial", "Buscando años a archivar...")
+
+        def al_terminar(movidos):
+            dialogo.cerrar()
+            self._cargar_equipos(self.filtro_equipos)
+            if not movidos:
+                messagebox.showinfo("Archivar historial", "No hay registros para archivar")
+                return
+            detalle = "\n".join(f"{año}: {e} equipos, {r} repuestos, {a} registros de auditoría"
+                                for año, (e, r, a) in movidos.items())
+            messagebox.showinfo("Archivar historial", f"Historial archivado:\n{detalle}")
+
+        def al_fallar(error):
+            dialogo.cerrar()
+            log_ui.error(f"Error archivando el historial: {error}")
+            messagebox.showerror("Error", f"No se pudo archivar el historial:\n{str(error)}")
+
+        dialogo.tarea = self.controller.executor.ejecutar(
+            lambda tarea: self.controller.db.archivar_historial(año_corte, usuario_id, tarea=tarea),
+            con_tarea=True, on_exito=al_terminar, on_error=al_fallar,
+            on_progreso=dialogo.actualizar)
+
+    def _importar(self, tipo):
+        """Importa equipos o repuestos desde CSV/XLSX en segundo plano"""
+        if not self.controller.current_user:
+            messagebox.showwarning("Acceso denegado", "Debe iniciar sesión para importar")
+            self.controller.mostrar_vista("LoginView")
+            return
+
+        archivo = filedialog.askopenfilename(
+            filetypes=[("Planillas", "*.csv *.xlsx"), ("CSV", "*.csv"), ("Excel files", "*.xlsx")],
+            title=f"Importar {tipo}")
+        if not archivo:
+            return
+        simulacion = messagebox.askyesnocancel(
+            "Importar", "¿Desea solo validar el archivo (simulación, sin guardar cambios)?")
+        if simulacion is None:
+            return
+
+        importador = ImportManager(self.controller.db, self.controller.current_user['id'])
+        if tipo == "equipos":
+            crear = messagebox.askyesno(
+                "Importar", "¿Crear los tipos, marcas y modelos que no existan?")
+            importar = lambda tarea: importador.importar_equipos(
+                archivo, simulacion, crear_catalogos=crear, tarea=tarea)
+        else:
+            importar = lambda tarea: importador.importar_repuestos(archivo, simulacion, tarea=tarea)
+
+        dialogo = DialogoProgreso(self.controller.root, "Importando...", "Leyendo archivo...")
+
+        def al_terminar(resultado):
+            dialogo.cerrar()
+            if not simulacion:
+                self._cargar_equipos(self.filtro_equipos)
+            titulo = "Simulación de importación" if simulacion else "Importación finalizada"
+            if not resultado.errores:
+                messagebox.showinfo(titulo, resultado.resumen())
+                return
+            if messagebox.askyesno(titulo, resultado.resumen() +
+                                   "\n\n¿Desea guardar el detalle de errores por fila?"):
+                destino = filedialog.asksaveasfilename(
+                    defaultextension=".csv",
+                    filetypes=[("CSV", "*.csv")],
+                    initialfile=f"errores_importacion_{tipo}",
+                    title="Guardar detalle de errores")
+                if destino:
+                    resultado.guardar_errores(destino)
+
+        def al_fallar(error):
+            dialogo.cerrar()
+            log_ui.error(f"Error importando {tipo}: {error}")
+            messagebox.showerror("Error", f"No se pudo importar el archivo:\n{str(error)}")
+
+        dialogo.tarea = self.controller.executor.ejecutar(
+            importar, con_tarea=True, on_exito=al_terminar, on_error=al_fallar,
+            on_progreso=dialogo.actualizar)
+
     def _exportar_word(self):
         """Exporta los datos actuales a Word"""
 
@@ -1460,8 +4196,8 @@ class MainView(ttk.Frame):
                           for col in self.equipos_treeview["columns"]]
                 data.append(headers)
                 
-                for item in self.equipos_treeview.get_children():
-                    data.append(self.equipos_treeview.item(item)["values"])
+                # El listado está paginado: los equipos del filtro actual se
+                # leen de la base en segundo plano (ver _exportar_equipos)
                 
                 title = "Reporte de Equipos"
             else:
@@ -1475,15 +4211,12 @@ class MainView(ttk.Frame):
             )
             
             if filename:
-                if ExportManager.export_to_word(data, filename, title):
-                    messagebox.showinfo("Éxito", f"Reporte exportado a Word:\n{filename}")
-                    if messagebox.askyesno("Abrir", "¿Desea abrir el archivo Word?"):
-                        webbrowser.open(filename)
-                else:
-                    messagebox.showerror("Error", "No se pudo exportar el documento Word")
+                self.controller.ejecutar_exportacion(
+                    "word", filename, self._exportar_equipos, self.filtro_equipos,
+                    ExportManager.export_to_word, data, filename, title)
                     
         except Exception as e:
-            logging.error(f"Error exportando a Word: {e}")
+            log_ui.error(f"Error exportando a Word: {e}")
             messagebox.showerror("Error", f"Error al exportar Word: {str(e)}")
     
     def actualizar_status(self, mensaje):
@@ -1621,7 +4354,7 @@ class EquipmentView(ttk.Frame):
             self.fecha_ingreso_entry.set_date(datetime.now().date())
             
         except Exception as e:
-            logging.error(f"Error cargando comboboxes: {e}")
+            log_ui.error(f"Error cargando comboboxes: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar los datos: {str(e)}")
     
     def _limpiar_campos(self):
@@ -1641,15 +4374,14 @@ class EquipmentView(ttk.Frame):
         try:
             marca_seleccionada = self.marca_combobox.get()
             if marca_seleccionada:
-                marcas = self.controller.db.obtener_marcas()
-                id_marca = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+                id_marca = self.controller.db.id_catalogo('marcas', marca_seleccionada)
                 
                 modelos = self.controller.db.obtener_modelos(id_marca)
                 self.modelo_combobox["values"] = [m[1] for m in modelos]
                 if modelos:
                     self.modelo_combobox.current(0)
         except Exception as e:
-            logging.error(f"Error actualizando modelos: {e}")
+            log_ui.error(f"Error actualizando modelos: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar los modelos: {str(e)}")
     
     def _guardar_equipo(self):
@@ -1671,17 +4403,14 @@ class EquipmentView(ttk.Frame):
             
             # Validar número de serie único
             serie = self.serie_entry.get().strip()
-            equipos = self.controller.db.obtener_equipos(f"e.serie = '{serie}'")
+            equipos = self.controller.db.obtener_equipos(FiltroEquipos(serie=serie))
             if equipos:
                 raise ValueError(f"El número de serie '{serie}' ya existe en el sistema")
             
             # Obtener IDs de las selecciones
-            tipo_id = next(t[0] for t in self.controller.db.obtener_tipos_equipo() 
-                         if t[1] == self.tipo_combobox.get())
-            marca_id = next(m[0] for m in self.controller.db.obtener_marcas() 
-                          if m[1] == self.marca_combobox.get())
-            modelo_id = next(m[0] for m in self.controller.db.obtener_modelos(marca_id) 
-                         if m[1] == self.modelo_combobox.get())
+            tipo_id = self.controller.db.id_catalogo('tipos_equipo', self.tipo_combobox.get())
+            marca_id = self.controller.db.id_catalogo('marcas', self.marca_combobox.get())
+            modelo_id = self.controller.db.id_catalogo('modelos', self.modelo_combobox.get(), marca_id)
             
             # Preparar datos
             datos = (
@@ -1710,7 +4439,7 @@ class EquipmentView(ttk.Frame):
         except ValueError as e:
             messagebox.showerror("Error", str(e))
         except Exception as e:
-            logging.error(f"Error guardando equipo: {e}")
+            log_ui.error(f"Error guardando equipo: {e}")
             messagebox.showerror("Error", f"No se pudo guardar el equipo:\n{str(e)}")
 
 class EditarEquipoView(ttk.Frame):
@@ -1828,9 +4557,7 @@ class EditarEquipoView(ttk.Frame):
                 
                 # Cargar modelo
                 modelos = [m[1] for m in self.controller.db.obtener_modelos(
-                    next(m[0] for m in self.controller.db.obtener_marcas() 
-                        if m[1] == equipo['marca'])
-                )]
+                    self.controller.db.id_catalogo('marcas', equipo['marca']))]
                 if equipo['modelo'] in modelos:
                     self.modelo_combobox.set(equipo['modelo'])
             
@@ -1849,15 +4576,14 @@ class EditarEquipoView(ttk.Frame):
         try:
             marca_seleccionada = self.marca_combobox.get()
             if marca_seleccionada:
-                marcas = self.controller.db.obtener_marcas()
-                id_marca = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+                id_marca = self.controller.db.id_catalogo('marcas', marca_seleccionada)
                 
                 modelos = self.controller.db.obtener_modelos(id_marca)
                 self.modelo_combobox["values"] = [m[1] for m in modelos]
                 if modelos:
                     self.modelo_combobox.current(0)
         except Exception as e:
-            logging.error(f"Error actualizando modelos: {e}")
+            log_ui.error(f"Error actualizando modelos: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar los modelos: {str(e)}")
     
     def _actualizar_equipo(self):
@@ -1879,17 +4605,15 @@ class EditarEquipoView(ttk.Frame):
             
             # Validar número de serie único (excluyendo el equipo actual)
             serie = self.serie_entry.get().strip()
-            equipos = self.controller.db.obtener_equipos(f"e.serie = '{serie}' AND e.id != {self.equipo_id}")
+            equipos = self.controller.db.obtener_equipos(
+                FiltroEquipos(serie=serie, excluir_id=self.equipo_id))
             if equipos:
                 raise ValueError(f"El número de serie '{serie}' ya existe en otro equipo")
             
             # Obtener IDs de las selecciones
-            tipo_id = next(t[0] for t in self.controller.db.obtener_tipos_equipo() 
-                         if t[1] == self.tipo_combobox.get())
-            marca_id = next(m[0] for m in self.controller.db.obtener_marcas() 
-                          if m[1] == self.marca_combobox.get())
-            modelo_id = next(m[0] for m in self.controller.db.obtener_modelos(marca_id) 
-                         if m[1] == self.modelo_combobox.get())
+            tipo_id = self.controller.db.id_catalogo('tipos_equipo', self.tipo_combobox.get())
+            marca_id = self.controller.db.id_catalogo('marcas', self.marca_combobox.get())
+            modelo_id = self.controller.db.id_catalogo('modelos', self.modelo_combobox.get(), marca_id)
             
             # Preparar datos
             datos = (
@@ -1914,7 +4638,7 @@ class EditarEquipoView(ttk.Frame):
         except ValueError as e:
             messagebox.showerror("Error", str(e))
         except Exception as e:
-            logging.error(f"Error actualizando equipo: {e}")
+            log_ui.error(f"Error actualizando equipo: {e}")
             messagebox.showerror("Error", f"No se pudo actualizar el equipo:\n{str(e)}")
 
 class MarcasView(ttk.Frame):
@@ -2001,27 +4725,26 @@ class MarcasView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Primero verificamos que no exista ya una marca con ese nombre
-                marcas = self.controller.db.obtener_marcas()
-                if any(nuevo_nombre.lower() == m[1].lower() for m in marcas):
-                    raise ValueError("Ya existe una marca con ese nombre")
+                with self.controller.db.transaction():
+                    # Primero verificamos que no exista ya una marca con ese nombre
+                    marcas = self.controller.db.obtener_marcas()
+                    if any(nuevo_nombre.lower() == m[1].lower() for m in marcas):
+                        raise ValueError("Ya existe una marca con ese nombre")
                 
-                # Actualizamos la marca
-                self.controller.db.cursor.execute(
-                    "UPDATE marcas SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, marca_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_MARCA', 'marcas', marca_id,
-                    f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}")
+                    # Actualizamos la marca
+                    self.controller.db.cursor.execute(
+                        "UPDATE marcas SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, marca_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_MARCA', 'marcas', marca_id,
+                        f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}")
+                self.controller.db.invalidar_catalogos('marcas')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca modificada correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar la marca: {str(e)}")
     
     def _eliminar_marca(self):
@@ -2047,18 +4770,17 @@ class MarcasView(ttk.Frame):
             
         if messagebox.askyesno("Confirmar", f"¿Está seguro que desea eliminar la marca '{nombre}'?"):
             try:
-                self.controller.db.cursor.execute(
-                    "DELETE FROM marcas WHERE id = ?", (marca_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ELIMINAR_MARCA', 'marcas', marca_id,
-                    f"Marca eliminada: {nombre}")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM marcas WHERE id = ?", (marca_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ELIMINAR_MARCA', 'marcas', marca_id,
+                        f"Marca eliminada: {nombre}")
+                self.controller.db.invalidar_catalogos('marcas')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca eliminada correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo eliminar la marca: {str(e)}")
 
 class ModelosView(ttk.Frame):
@@ -2140,8 +4862,7 @@ class ModelosView(ttk.Frame):
             self.treeview.delete(item)
             
         # Obtener ID de la marca seleccionada
-        marcas = self.controller.db.obtener_marcas()
-        marca_id = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+        marca_id = self.controller.db.id_catalogo('marcas', marca_seleccionada)
         
         # Obtener y mostrar modelos
         modelos = self.controller.db.obtener_modelos(marca_id)
@@ -2159,8 +4880,7 @@ class ModelosView(ttk.Frame):
         if nombre:
             try:
                 # Obtener ID de la marca seleccionada
-                marcas = self.controller.db.obtener_marcas()
-                marca_id = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+                marca_id = self.controller.db.id_catalogo('marcas', marca_seleccionada)
                 
                 # Agregar el modelo
                 self.controller.db.agregar_modelo(marca_id, nombre, self.controller.current_user['id'])
@@ -2185,31 +4905,29 @@ class ModelosView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Obtener ID de la marca
-                marcas = self.controller.db.obtener_marcas()
-                marca_id = next(m[0] for m in marcas if m[1] == marca_nombre)
+                with self.controller.db.transaction():
+                    # Obtener ID de la marca
+                    marca_id = self.controller.db.id_catalogo('marcas', marca_nombre)
                 
-                # Verificar que no exista ya un modelo con ese nombre para esta marca
-                modelos = self.controller.db.obtener_modelos(marca_id)
-                if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
-                    raise ValueError("Ya existe un modelo con ese nombre para esta marca")
+                    # Verificar que no exista ya un modelo con ese nombre para esta marca
+                    modelos = self.controller.db.obtener_modelos(marca_id)
+                    if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
+                        raise ValueError("Ya existe un modelo con ese nombre para esta marca")
                 
-                # Actualizar el modelo
-                self.controller.db.cursor.execute(
-                    "UPDATE modelos SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, modelo_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_MODELO', 'modelos', modelo_id,
-                    f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}")
+                    # Actualizar el modelo
+                    self.controller.db.cursor.execute(
+                        "UPDATE modelos SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, modelo_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_MODELO', 'modelos', modelo_id,
+                        f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}")
+                self.controller.db.invalidar_catalogos('modelos')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo modificado correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar el modelo: {str(e)}")
     
     def _eliminar_modelo(self):
@@ -2235,18 +4953,17 @@ class ModelosView(ttk.Frame):
             
         if messagebox.askyesno("Confirmar", f"¿Está seguro que desea eliminar el modelo '{nombre}'?"):
             try:
-                self.controller.db.cursor.execute(
-                    "DELETE FROM modelos WHERE id = ?", (modelo_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ELIMINAR_MODELO', 'modelos', modelo_id,
-                    f"Modelo eliminado: {nombre} (Marca: {marca_nombre})")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM modelos WHERE id = ?", (modelo_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ELIMINAR_MODELO', 'modelos', modelo_id,
+                        f"Modelo eliminado: {nombre} (Marca: {marca_nombre})")
+                self.controller.db.invalidar_catalogos('modelos')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo eliminado correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo eliminar el modelo: {str(e)}")
 
 class ReparacionView(ttk.Frame):
@@ -2308,7 +5025,7 @@ class ReparacionView(ttk.Frame):
                 messagebox.showerror("Error", "No se pudo generar el informe técnico")
                 
         except Exception as e:
-            logging.error(f"Error generando informe técnico: {e}")
+            log_ui.error(f"Error generando informe técnico: {e}")
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
         
     
@@ -2648,24 +5365,29 @@ class ReporteEquiposView(ttk.Frame):
     def _cargar_datos(self):
         """Carga los datos según los filtros aplicados"""
         # Construir filtro
-        filtros = []
-        
         estado = self.estado_combobox.get()
-        if estado != "Todos":
-            filtros.append(f"e.estado = '{estado}'")
-        
-        fecha_desde = self.fecha_desde_entry.get_date().strftime("%Y-%m-%d")
-        fecha_hasta = self.fecha_hasta_entry.get_date().strftime("%Y-%m-%d")
-        filtros.append(f"e.fecha_ingreso BETWEEN '{fecha_desde}' AND '{fecha_hasta}'")
-        
-        filtro = " AND ".join(filtros) if filtros else None
-        
-        # Limpiar treeview
-        for item in self.resultados_tree.get_children():
-            self.resultados_tree.delete(item)
-            
-        # Obtener y mostrar datos
-        equipos = self.controller.db.obtener_equipos(filtro)
+        filtro = FiltroEquipos(
+            estado=estado if estado != "Todos" else None,
+            fecha_desde=self.fecha_desde_entry.get_date().strftime("%Y-%m-%d"),
+            fecha_hasta=self.fecha_hasta_entry.get_date().strftime("%Y-%m-%d"))
+        
+        # Descartar una carga anterior que siga en curso
+        if getattr(self, '_tarea_carga', None):
+            self._tarea_carga.cancelar()
+        
+        # Obtener datos en segundo plano (incluido el archivo histórico)
+        self._tarea_carga = self.controller.executor.ejecutar(
+            self.controller.db.obtener_equipos, filtro, historico=True,
+            on_exito=self._mostrar_datos,
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"No se pudieron cargar los equipos: {str(e)}"))
+    
+    def _mostrar_datos(self, equipos):
+        """Muestra en el treeview los equipos obtenidos"""
+        self._tarea_carga = None
+        children = self.resultados_tree.get_children()
+        if children:
+            self.resultados_tree.delete(*children)
         for equipo in equipos:
             self.resultados_tree.insert("", tk.END, values=equipo)
     
@@ -2736,46 +5458,27 @@ class ReporteEquiposView(ttk.Frame):
                 title=f"Guardar reporte como {formato.upper()}")
 
             if filename:
-                # Mostrar diálogo de progreso
-                progress = tk.Toplevel()
-                progress.title("Exportando...")
-                progress.geometry("300x100")
-                tk.Label(progress, text=f"Generando archivo {formato.upper()}...").pack(pady=20)
-                progress.grab_set()
-                self.update()
-
-                try:
-                    # Configurar parámetros específicos para cada formato
-                    kwargs = {'title': config['title']}
-                    if formato.lower() == 'excel':
-                        success = ExportManager.export_to_excel(
-                            data=processed_data,
-                            filename=filename,
-                            title=f"Reporte de Equipos - {datetime.now().strftime('%d/%m/%Y')}",  # Título añadido
-                            sheet_name="Equipos"
-                       )
-
-                    # Ejecutar exportación
-                    success = config['export_func'](processed_data, filename, **kwargs)
-                
-                    if success:
-                       messagebox.showinfo("Éxito", f"Reporte exportado correctamente a:\n{filename}")
-                       if messagebox.askyesno("Abrir", f"¿Desea abrir el archivo {config['ext'].upper()}?"):
-                           try:
-                               webbrowser.open(filename)
-                           except Exception as e:
-                               logging.warning(f"No se pudo abrir el archivo: {str(e)}")
-                    else:
-                        messagebox.showerror("Error", f"No se pudo exportar el reporte a {formato.upper()}")
-                finally:
-                    progress.destroy()
+                # Configurar parámetros específicos para cada formato
+                kwargs = {'title': config['title']}
+                if formato.lower() == 'pdf':
+                    kwargs['horizontal'] = True  # 9 columnas: página apaisada
+                elif formato.lower() == 'excel':
+                    kwargs = {
+                        'title': f"Reporte de Equipos - {datetime.now().strftime('%d/%m/%Y')}",
+                        'sheet_name': config['sheet_name']
+                    }
+
+                # Ejecutar exportación en segundo plano
+                self.controller.ejecutar_exportacion(
+                    config['ext'], filename, config['export_func'],
+                    processed_data, filename, **kwargs)
             
         except PermissionError:
             messagebox.showerror("Error de permisos", 
                                "No tiene permisos para guardar en la ubicación seleccionada.\n"
                                "Por favor, elija otra ubicación o cierre el archivo si está abierto.")
         except Exception as e:
-            logging.error(f"Error en exportación: {str(e)}", exc_info=True)
+            log_ui.error(f"Error en exportación: {str(e)}", exc_info=True)
             messagebox.showerror("Error", 
                                f"No se pudo completar la exportación:\n{str(e)}\n"
                                "Consulte el archivo de logs para más detalles.")
@@ -2897,12 +5600,23 @@ class ReporteRepuestosView(ttk.Frame):
         fecha_desde = self.fecha_desde_entry.get_date().strftime("%Y-%m-%d")
         fecha_hasta = self.fecha_hasta_entry.get_date().strftime("%Y-%m-%d")
         
-        # Limpiar treeview
-        for item in self.resultados_tree.get_children():
-            self.resultados_tree.delete(item)
-            
-        # Obtener y mostrar datos
-        repuestos = self.controller.db.obtener_repuestos_por_periodo(fecha_desde, fecha_hasta)
+        # Descartar una consulta anterior que siga en curso
+        if getattr(self, '_tarea_reporte', None):
+            self._tarea_reporte.cancelar()
+        
+        # Obtener datos en segundo plano y mostrarlos al terminar
+        self._tarea_reporte = self.controller.executor.ejecutar(
+            self.controller.db.obtener_repuestos_por_periodo, fecha_desde, fecha_hasta,
+            on_exito=self._mostrar_reporte,
+            on_error=lambda e: messagebox.showerror(
+                "Error", f"No se pudo generar el reporte: {str(e)}"))
+    
+    def _mostrar_reporte(self, repuestos):
+        """Muestra en el treeview los repuestos obtenidos"""
+        self._tarea_reporte = None
+        children = self.resultados_tree.get_children()
+        if children:
+            self.resultados_tree.delete(*children)
         for rep in repuestos:
             self.resultados_tree.insert("", tk.END, values=rep)
     
@@ -2959,36 +5673,15 @@ class ReporteRepuestosView(ttk.Frame):
                     title="Guardar reporte como Excel")
                 
                 if filename:
-                    # Mostrar progreso
-                    progress = tk.Toplevel()
-                    progress.title("Exportando a Excel...")
-                    tk.Label(progress, text="Generando archivo Excel...").pack(pady=20)
-                    progress.grab_set()
-                    self.update()
-
-                    try:
-                        # Configurar nombre seguro para la hoja
-                        sheet_name = f"Repuestos {periodo.split(' al ')[0]}"
-                    
-                        if ExportManager.export_to_excel(
-                            data=processed_data,
-                            filename=filename,
-                            title=f"Reporte de Repuestos ({periodo})",
-                            sheet_name=sheet_name
-                        ):
-                            messagebox.showinfo("Éxito", 
-                                          f"Reporte exportado correctamente:\n{filename}")
-                            if messagebox.askyesno("Abrir", "¿Desea abrir el archivo Excel?"):
-                                try:
-                                    webbrowser.open(filename)
-                                except Exception as e:
-                                    logging.warning(f"No se pudo abrir el archivo: {e}")
-                                    messagebox.showwarning("Aviso", 
-                                                         f"Archivo creado pero no se pudo abrir:\n{filename}")
-                        else:
-                            messagebox.showerror("Error", "No se pudo generar el archivo Excel")
-                    finally:
-                        progress.destroy()
+                    # Configurar nombre seguro para la hoja
+                    sheet_name = f"Repuestos {periodo.split(' al ')[0]}"
+                
+                    self.controller.ejecutar_exportacion(
+                        "excel", filename, ExportManager.export_to_excel,
+                        data=processed_data,
+                        filename=filename,
+                        title=f"Reporte de Repuestos ({periodo})",
+                        sheet_name=sheet_name)
 
             # ===== EXPORTACIÓN A PDF =====
             elif formato.lower() == "pdf":
@@ -2999,26 +5692,11 @@ class ReporteRepuestosView(ttk.Frame):
                     title="Guardar reporte como PDF")
 
                 if filename:
-                    progress = tk.Toplevel()
-                    progress.title("Exportando a PDF...")
-                    tk.Label(progress, text="Generando archivo PDF...").pack(pady=20)
-                    progress.grab_set()
-                    self.update()
-
-                    try:
-                        if ExportManager.export_to_pdf(
-                            data=processed_data,
-                            filename=filename,
-                            title=f"Reporte de Repuestos ({periodo})"
-                        ):
-                            messagebox.showinfo("Éxito", 
-                                          f"Reporte exportado correctamente:\n{filename}")
-                            if messagebox.askyesno("Abrir", "¿Desea abrir el archivo PDF?"):
-                                webbrowser.open(filename)
-                        else:
-                            messagebox.showerror("Error", "No se pudo generar el archivo PDF")
-                    finally:
-                        progress.destroy()
+                    self.controller.ejecutar_exportacion(
+                        "pdf", filename, ExportManager.export_to_pdf,
+                        data=processed_data,
+                        filename=filename,
+                        title=f"Reporte de Repuestos ({periodo})")
 
             # ===== EXPORTACIÓN A WORD =====
             elif formato.lower() == "word":
@@ -3029,32 +5707,17 @@ class ReporteRepuestosView(ttk.Frame):
                     title="Guardar reporte como Word")
 
                 if filename:
-                    progress = tk.Toplevel()
-                    progress.title("Exportando a Word...")
-                    tk.Label(progress, text="Generando archivo Word...").pack(pady=20)
-                    progress.grab_set()
-                    self.update()
-
-                    try:
-                        if ExportManager.export_to_word(
-                            data=processed_data,
-                            filename=filename,
-                            title=f"Reporte de Repuestos ({periodo})"
-                        ):
-                            messagebox.showinfo("Éxito", 
-                                              f"Reporte exportado correctamente:\n{filename}")
-                            if messagebox.askyesno("Abrir", "¿Desea abrir el archivo Word?"):
-                                webbrowser.open(filename)
-                        else:
-                            messagebox.showerror("Error", "No se pudo generar el archivo Word")
-                    finally:
-                        progress.destroy()
+                    self.controller.ejecutar_exportacion(
+                        "word", filename, ExportManager.export_to_word,
+                        data=processed_data,
+                        filename=filename,
+                        title=f"Reporte de Repuestos ({periodo})")
 
             else:
                 messagebox.showerror("Error", f"Formato no soportado: {formato}")
 
         except Exception as e:
-            logging.error(f"Error durante la exportación: {str(e)}", exc_info=True)
+            log_ui.error(f"Error durante la exportación: {str(e)}", exc_info=True)
             messagebox.showerror(
                  "Error crítico",
                  f"No se pudo completar la exportación:\n{str(e)}\n"
@@ -3069,6 +5732,12 @@ class UsuariosView(ttk.Frame):
         if not self.controller.current_user:
             self.controller.mostrar_vista("LoginView")
             return
+        # Y el rol: la vista sobrevive a los cambios de sesión
+        if self.controller.current_user['rol'] != 'admin':
+            messagebox.showwarning("Acceso denegado", "Solo un administrador puede gestionar usuarios")
+            self.controller.mostrar_vista("MainView")
+            return
+        self._cargar_usuarios()
            
     def __init__(self, parent, controller):
         super().__init__(parent)
@@ -3110,9 +5779,7 @@ class UsuariosView(ttk.Frame):
         
         self.treeview.grid(row=1, column=0, sticky="nsew")
         scrollbar.grid(row=1, column=1, sticky="ns")
-        
-        # Cargar datos iniciales
-        self._cargar_usuarios()
+        # Los datos se cargan en initialize, tras verificar el rol
     
     def _cargar_usuarios(self):
         """Carga los usuarios desde la base de datos"""
@@ -3128,7 +5795,7 @@ class UsuariosView(ttk.Frame):
                 estado = "Sí" if usuario[3] else "No"
                 self.treeview.insert("", tk.END, values=(usuario[0], usuario[1], usuario[2], estado))
         except sqlite3.Error as e:
-            logging.error(f"Error cargando usuarios: {e}")
+            log_ui.error(f"Error cargando usuarios: {e}")
             messagebox.showerror("Error", f"No se pudieron cargar los usuarios: {str(e)}")
     
     def _agregar_usuario(self):
@@ -3185,26 +5852,24 @@ class UsuariosView(ttk.Frame):
                 return
                 
             try:
-                hashed_pw = hashlib.sha256(password.encode('utf-8')).hexdigest()
+                with self.controller.db.transaction():
+                    hashed_pw = hashlib.sha256(password.encode('utf-8')).hexdigest()
                 
-                self.controller.db.cursor.execute(
-                    "INSERT INTO usuarios (username, password, rol, activo) VALUES (?, ?, ?, 1)",
-                    (username, hashed_pw, rol))
-                
-                user_id = self.controller.db.cursor.lastrowid
+                    self.controller.db.cursor.execute(
+                        "INSERT INTO usuarios (username, password, rol, activo) VALUES (?, ?, ?, 1)",
+                        (username, hashed_pw, rol))
                 
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ALTA_USUARIO', 'usuarios', user_id,
-                    f"Nuevo usuario creado: {username} (Rol: {rol})")
+                    user_id = self.controller.db.cursor.lastrowid
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ALTA_USUARIO', 'usuarios', user_id,
+                        f"Nuevo usuario creado: {username} (Rol: {rol})")
                 self._cargar_usuarios()
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Usuario creado correctamente")
             except sqlite3.IntegrityError:
                 messagebox.showerror("Error", "El nombre de usuario ya existe")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo crear el usuario: {str(e)}")
         
         ttk.Button(button_frame, text="Aceptar", command=on_ok).pack(side=tk.LEFT, padx=5)
@@ -3266,20 +5931,18 @@ class UsuariosView(ttk.Frame):
                 return
                 
             try:
-                self.controller.db.cursor.execute(
-                    "UPDATE usuarios SET rol = ? WHERE id = ?",
-                    (nuevo_rol, user_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_USUARIO', 'usuarios', user_id,
-                    f"Rol de usuario modificado: {username} ({rol_actual} -> {nuevo_rol})")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "UPDATE usuarios SET rol = ? WHERE id = ?",
+                        (nuevo_rol, user_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_USUARIO', 'usuarios', user_id,
+                        f"Rol de usuario modificado: {username} ({rol_actual} -> {nuevo_rol})")
                 self._cargar_usuarios()
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Usuario modificado correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar el usuario: {str(e)}")
         
         ttk.Button(button_frame, text="Aceptar", command=on_ok).pack(side=tk.LEFT, padx=5)
@@ -3343,21 +6006,19 @@ class UsuariosView(ttk.Frame):
                 return
                 
             try:
-                hashed_pw = hashlib.sha256(password.encode('utf-8')).hexdigest()
+                with self.controller.db.transaction():
+                    hashed_pw = hashlib.sha256(password.encode('utf-8')).hexdigest()
                 
-                self.controller.db.cursor.execute(
-                    "UPDATE usuarios SET password = ? WHERE id = ?",
-                    (hashed_pw, user_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'CAMBIAR_PASSWORD', 'usuarios', user_id,
-                    f"Contraseña cambiada para usuario: {username}")
+                    self.controller.db.cursor.execute(
+                        "UPDATE usuarios SET password = ? WHERE id = ?",
+                        (hashed_pw, user_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'CAMBIAR_PASSWORD', 'usuarios', user_id,
+                        f"Contraseña cambiada para usuario: {username}")
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Contraseña cambiada correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo cambiar la contraseña: {str(e)}")
         
         ttk.Button(button_frame, text="Aceptar", command=on_ok).pack(side=tk.LEFT, padx=5)
@@ -3393,22 +6054,102 @@ class UsuariosView(ttk.Frame):
         
         if messagebox.askyesno("Confirmar", f"¿Está seguro que desea {accion} al usuario '{username}'?"):
             try:
-                self.controller.db.cursor.execute(
-                    "UPDATE usuarios SET activo = ? WHERE id = ?",
-                    (nuevo_estado, user_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'CAMBIAR_ESTADO', 'usuarios', user_id,
-                    f"Usuario {accion}do: {username}")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "UPDATE usuarios SET activo = ? WHERE id = ?",
+                        (nuevo_estado, user_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'CAMBIAR_ESTADO', 'usuarios', user_id,
+                        f"Usuario {accion}do: {username}")
                 self._cargar_usuarios()
                 messagebox.showinfo("Éxito", f"Usuario {accion}do correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo {accion} el usuario: {str(e)}")
 
 
+class ConsultasView(ttk.Frame):
+    """Vista oculta de administración: métodos y sentencias SQL más costosos
+    según MonitorConsultas (se abre con Ctrl+Shift+Q)"""
+
+    COLUMNAS = (("nombre", "Método / SQL", 420, tk.W), ("llamadas", "Llamadas", 70, tk.E),
+                ("promedio", "Prom. (ms)", 80, tk.E), ("p95", "p95 (ms)", 80, tk.E),
+                ("max", "Máx. (ms)", 80, tk.E), ("total", "Total (ms)", 90, tk.E),
+                ("filas", "Filas", 80, tk.E), ("lentas", "Lentas", 60, tk.E))
+
+    def initialize(self, *args, **kwargs):
+        usuario = self.controller.current_user
+        if not usuario or usuario['rol'] != 'admin':
+            self.controller.mostrar_vista("MainView")
+            return
+        self._cargar()
+
+    def __init__(self, parent, controller):
+        super().__init__(parent)
+        self.controller = controller
+        self._setup_ui()
+
+    def _setup_ui(self):
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        button_frame = ttk.Frame(self)
+        button_frame.grid(row=0, column=0, sticky="ew", pady=5)
+
+        ttk.Label(button_frame, text="Ordenar por:").pack(side=tk.LEFT, padx=5)
+        self.orden_combobox = ttk.Combobox(button_frame, values=["total", "promedio", "p95", "max", "llamadas"],
+                                           state="readonly", width=10)
+        self.orden_combobox.set("total")
+        self.orden_combobox.bind("<<ComboboxSelected>>", lambda e: self._cargar())
+        self.orden_combobox.pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Refrescar", command=self._cargar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Reiniciar", command=self._reiniciar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Volver",
+                   command=lambda: self.controller.mostrar_vista("MainView")).pack(side=tk.RIGHT, padx=5)
+        self.info_label = ttk.Label(button_frame)
+        self.info_label.pack(side=tk.RIGHT, padx=10)
+
+        notebook = ttk.Notebook(self)
+        notebook.grid(row=1, column=0, sticky="nsew")
+        self.tree_metodos = self._crear_treeview(notebook)
+        self.tree_sql = self._crear_treeview(notebook)
+        notebook.add(self.tree_metodos.master, text="Métodos")
+        notebook.add(self.tree_sql.master, text="Sentencias SQL")
+
+    def _crear_treeview(self, notebook):
+        frame = ttk.Frame(notebook)
+        frame.grid_columnconfigure(0, weight=1)
+        frame.grid_rowconfigure(0, weight=1)
+        treeview = ttk.Treeview(frame, columns=[c[0] for c in self.COLUMNAS], show="headings")
+        for columna, titulo, ancho, alineacion in self.COLUMNAS:
+            treeview.heading(columna, text=titulo)
+            treeview.column(columna, width=ancho, anchor=alineacion, stretch=columna == "nombre")
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=treeview.yview)
+        treeview.configure(yscrollcommand=scrollbar.set)
+        treeview.grid(row=0, column=0, sticky="nsew")
+        scrollbar.grid(row=0, column=1, sticky="ns")
+        return treeview
+
+    def _cargar(self):
+        monitor = self.controller.db.monitor
+        if monitor is None:
+            self.info_label.config(text="Instrumentación desactivada (Config.INSTRUMENTAR_CONSULTAS)")
+            return
+        self.info_label.config(text=f"Equipo: {monitor.equipo} | Umbral lento: {monitor.umbral_ms} ms")
+        metodos, sentencias = monitor.top(50, self.orden_combobox.get())
+        for treeview, filas in ((self.tree_metodos, metodos), (self.tree_sql, sentencias)):
+            treeview.delete(*treeview.get_children())
+            for nombre, llamadas, promedio, p95, maximo, total, filas_leidas, lentas in filas:
+                treeview.insert("", tk.END, values=(nombre, llamadas, f"{promedio:.1f}", f"{p95:.1f}",
+                                                    f"{maximo:.1f}", f"{total:.0f}", filas_leidas, lentas))
+
+    def _reiniciar(self):
+        if self.controller.db.monitor is not None and messagebox.askyesno(
+                "Confirmar", "¿Descartar las estadísticas acumuladas?"):
+            self.controller.db.monitor.reiniciar()
+            self._cargar()
+
+
 class ReporteResumenRepuestosView(ttk.Frame):
       """Vista para mostrar resumen de repuestos utilizados por mes/año"""
     
@@ -3485,29 +6226,39 @@ class ReporteResumenRepuestosView(ttk.Frame):
       def _generar_reporte(self):
           """Genera el reporte con los filtros aplicados"""
           try:
-              # Limpiar treeview
-              for item in self.treeview.get_children():
-                  self.treeview.delete(item)
-            
               # Obtener parámetros
               anio = int(self.anio_combobox.get())
               mes = None if self.mes_combobox.get() == "Todos" else self._get_month_number(self.mes_combobox.get())
             
-              # Obtener datos
-              repuestos = self.controller.db.obtener_resumen_repuestos(anio, mes)
-            
-              # Mostrar datos
-              meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", 
-                      "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+              # Descartar una consulta anterior que siga en curso
+              if getattr(self, '_tarea_reporte', None):
+                  self._tarea_reporte.cancelar()
             
-              for rep in repuestos:
-                  nombre, cantidad, mes_num, año = rep
-                  mes_nombre = meses[int(mes_num)] if mes_num else "Todos"
-                  self.treeview.insert("", tk.END, values=(nombre, cantidad, mes_nombre, año))
+              # Obtener datos en segundo plano
+              self._tarea_reporte = self.controller.executor.ejecutar(
+                  self.controller.db.obtener_resumen_repuestos, anio, mes,
+                  on_exito=self._mostrar_reporte,
+                  on_error=lambda e: messagebox.showerror(
+                      "Error", f"No se pudo generar el reporte: {str(e)}"))
                 
           except Exception as e:
               messagebox.showerror("Error", f"No se pudo generar el reporte: {str(e)}")
     
+      def _mostrar_reporte(self, repuestos):
+          """Muestra en el treeview el resumen obtenido"""
+          self._tarea_reporte = None
+          children = self.treeview.get_children()
+          if children:
+              self.treeview.delete(*children)
+        
+          meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", 
+                  "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+        
+          for rep in repuestos:
+              nombre, cantidad, mes_num, año = rep
+              mes_nombre = meses[int(mes_num)] if mes_num else "Todos"
+              self.treeview.insert("", tk.END, values=(nombre, cantidad, mes_nombre, año))
+    
       def _get_month_number(self, month_name):
           """Convierte nombre de mes a número"""
           meses = {"Enero": 1, "Febrero": 2, "Marzo": 3, "Abril": 4, "Mayo": 5, "Junio": 6,
@@ -3537,16 +6288,11 @@ class ReporteResumenRepuestosView(ttk.Frame):
                   title="Guardar reporte como Excel")
             
               if filename:
-                  if ExportManager.export_to_excel(
+                  self.controller.ejecutar_exportacion(
+                      "excel", filename, ExportManager.export_to_excel,
                       data, filename, 
                       title=f"Resumen de repuestos - {mes} {anio}",
-                      sheet_name=f"Repuestos {mes[:3]}"):
-                    
-                      messagebox.showinfo("Éxito", f"Reporte exportado correctamente:\n{filename}")
-                      if messagebox.askyesno("Abrir", "¿Desea abrir el archivo Excel?"):
-                          webbrowser.open(filename)
-                  else:
-                      messagebox.showerror("Error", "No se pudo exportar el reporte")
+                      sheet_name=f"Repuestos {mes[:3]}")
                     
           except Exception as e:
               messagebox.showerror("Error", f"No se pudo exportar: {str(e)}")
@@ -3579,27 +6325,13 @@ class ReporteResumenRepuestosView(ttk.Frame):
               )
         
               if filename:
-                  # 4. Mostrar progreso (opcional)
-                  progress = tk.Toplevel()
-                  progress.title("Generando Word...")
-                  tk.Label(progress, text="Exportando a Word...").pack(pady=20)
-                  progress.grab_set()
-                  self.update()
-            
-                  # 5. Llamar al ExportManager
-                  if ExportManager.export_to_word(
+                  # 4. Generar en segundo plano con ventana de progreso
+                  self.controller.ejecutar_exportacion(
+                      "word", filename, ExportManager.export_to_word,
                       data, 
                       filename, 
                       title=titulo,
-                      subtitle=f"Período: {mes} {anio}"
-                  ):
-                      messagebox.showinfo("Éxito", f"Documento guardado:\n{filename}")
-                      if messagebox.askyesno("Abrir", "¿Abrir el documento?"):
-                          webbrowser.open(filename)
-                  else:
-                      messagebox.showerror("Error", "No se pudo generar el documento")
-            
-                  progress.destroy()
+                      subtitle=f"Período: {mes} {anio}")
             
           except Exception as e:
               messagebox.showerror("Error", f"Error al exportar: {str(e)}")       
@@ -3821,6 +6553,8 @@ class TonerView(ttk.Frame):
                     command=self._generar_informe_consumos).pack(side=tk.LEFT, padx=5)
         ttk.Button(controles_frame, text="Generar Informe de Recargas", 
                     command=self._generar_informe_recargas).pack(side=tk.LEFT, padx=5)
+        ttk.Button(controles_frame, text="Pedido Sugerido",
+                    command=self._generar_pedido_sugerido).pack(side=tk.LEFT, padx=5)
     
     def _cargar_stock(self):
         """Muestra el diálogo para cargar stock de toner"""
@@ -3857,8 +6591,7 @@ class TonerView(ttk.Frame):
             return
             
         try:
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
             modelos = self.controller.db.obtener_modelos_toner(id_marca)
             self.mov_modelo_combo['values'] = ["Todos"] + [m[1] for m in modelos]
@@ -3880,13 +6613,11 @@ class TonerView(ttk.Frame):
             
             id_marca = None
             if marca != "Todas":
-                marcas = self.controller.db.obtener_marcas_toner()
-                id_marca = next(m[0] for m in marcas if m[1] == marca)
+                id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
             id_modelo = None
             if modelo != "Todos" and marca != "Todas":
-                modelos = self.controller.db.obtener_modelos_toner(id_marca)
-                id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+                id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
             
             movimientos = self.controller.db.obtener_movimientos_toner(fecha_desde, fecha_hasta, id_marca, id_modelo)
             
@@ -3914,7 +6645,7 @@ class TonerView(ttk.Frame):
             recargas = self.controller.db.obtener_recargas_toner(estado=estado)
              
             for rec in recargas:
-                self.recargas_tree.insert("", tk.END, values=(
+                self.recargas_tree.insert("", tk.END, iid=rec[9], values=(
                     rec[4],  # fecha_envio
                     rec[5] if rec[5] else "N/A",  # fecha_recibo
                     rec[0],  # marca
@@ -3953,12 +6684,9 @@ class TonerView(ttk.Frame):
         def on_ok():
             observaciones = observaciones_text.get("1.0", tk.END).strip()
             
-            # Obtener ID de la recarga (necesitamos modificar la consulta para incluir el ID)
-            # Esto es un ejemplo, necesitarías ajustar según tu implementación
             try:
-                # En una implementación real, deberías tener el ID de la recarga
-                # Aquí asumimos que el primer valor es el ID (necesitarías modificar tu consulta SQL)
-                recarga_id = item['values'][0]
+                # El iid de cada fila del árbol es el id de la recarga
+                recarga_id = int(seleccion[0])
                 
                 self.controller.db.recibir_recarga_toner(
                     recarga_id, 
@@ -4026,11 +6754,9 @@ class TonerView(ttk.Frame):
                     raise ValueError("La cantidad debe ser mayor a cero")
                 
                 # Obtener ID del modelo
-                marcas = self.controller.db.obtener_marcas_toner()
-                id_marca = next(m[0] for m in marcas if m[1] == marca)
+                id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
                 
-                modelos = self.controller.db.obtener_modelos_toner(id_marca)
-                id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+                id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
                 
                 # Registrar movimiento de ingreso
                 self.controller.db.registrar_movimiento_toner(
@@ -4080,8 +6806,7 @@ class TonerView(ttk.Frame):
             return
             
         try:
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
             modelos = self.controller.db.obtener_modelos_toner(id_marca)
             modelo_combo['values'] = [m[1] for m in modelos]
@@ -4098,39 +6823,42 @@ class TonerView(ttk.Frame):
             año = int(self.inf_anio_combo.get())
             mes = None if self.inf_mes_combo.get() == "Todos" else self._get_month_number(self.inf_mes_combo.get())
             
-            # Obtener datos
-            movimientos = self.controller.db.obtener_movimientos_toner(
-                f"{año}-01-01", 
-                f"{año}-12-31", 
-                None, 
-                None
-            )
+            titulo = f"Informe de Consumos de Toner - {self.inf_anio_combo.get()}"
+            subtitulo = f"Mes: {self.inf_mes_combo.get()}" if mes else "Anual"
             
-            if mes:
-                movimientos = [m for m in movimientos if datetime.strptime(m[6], "%Y-%m-%d %H:%M:%S").month == mes]
-            
-            # Procesar datos para el informe
-            data = {
-                "titulo": f"Informe de Consumos de Toner - {self.inf_anio_combo.get()}",
-                "subtitulo": f"Mes: {self.inf_mes_combo.get()}" if mes else "Anual",
-                "encabezados": ["Fecha", "Marca", "Modelo", "Cantidad", "Responsable", "Sector"],
-                "datos": [[m[6][:10], m[0], m[1], m[3], m[4], m[5]] for m in movimientos if m[2] == 'retiro'],
-                "resumen": self._generar_resumen_consumos(movimientos)
-            }
-           
             # Generar nombre de archivo
             fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"Informe_Consumos_Toner_{año}_{self.inf_mes_combo.get()}_{fecha}.docx"
             
-            if ExportManager.export_informe_toner(data, filename):
-                messagebox.showinfo("Éxito", f"Informe generado:\n{filename}")
-                if messagebox.askyesno("Abrir", "¿Desea abrir el documento para imprimir?"):
-                    webbrowser.open(filename)
-            else:
-                messagebox.showerror("Error", "No se pudo generar el informe")
+            # Consulta y generación del documento en segundo plano
+            self.controller.ejecutar_exportacion(
+                "docx", filename, self._construir_informe_consumos,
+                año, mes, titulo, subtitulo, filename)
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
+    
+    def _construir_informe_consumos(self, año, mes, titulo, subtitulo, filename, tarea=None):
+        """Obtiene los movimientos y genera el informe (corre en segundo plano)"""
+        movimientos = self.controller.db.obtener_movimientos_toner(
+            f"{año}-01-01", 
+            f"{año}-12-31", 
+            None, 
+            None
+        )
+        
+        if mes:
+            movimientos = [m for m in movimientos if datetime.strptime(m[6], "%Y-%m-%d %H:%M:%S").month == mes]
+        
+        # Procesar datos para el informe
+        data = {
+            "titulo": titulo,
+            "subtitulo": subtitulo,
+            "encabezados": ["Fecha", "Marca", "Modelo", "Cantidad", "Responsable", "Sector"],
+            "datos": [[m[6][:10], m[0], m[1], m[3], m[4], m[5]] for m in movimientos if m[2] == 'retiro'],
+            "resumen": self._generar_resumen_consumos(movimientos)
+        }
+        return ExportManager.export_informe_toner(data, filename, tarea=tarea)
      
     def _generar_informe_recargas(self):
         """Genera informe de recargas de toner"""
@@ -4138,32 +6866,51 @@ class TonerView(ttk.Frame):
             año = int(self.inf_anio_combo.get())
             mes = None if self.inf_mes_combo.get() == "Todos" else self._get_month_number(self.inf_mes_combo.get())
             
-            # Obtener datos
-            recargas = self.controller.db.obtener_recargas_toner(año, mes)
-            
-            # Procesar datos para el informe
-            data = {
-                "titulo": f"Informe de Recargas de Toner - {self.inf_anio_combo.get()}",
-                "subtitulo": f"Mes: {self.inf_mes_combo.get()}" if mes else "Anual",
-                "encabezados": ["Fecha Envío", "Fecha Recibo", "Marca", "Modelo", "Cantidad", "Empresa", "Estado"],
-                "datos": [[r[4], r[5] if r[5] else "N/A", r[0], r[1], r[2], r[3], r[6]] for r in recargas],
-                "resumen": self._generar_resumen_recargas(recargas)
-            }
+            titulo = f"Informe de Recargas de Toner - {self.inf_anio_combo.get()}"
+            subtitulo = f"Mes: {self.inf_mes_combo.get()}" if mes else "Anual"
             
             # Generar nombre de archivo
             fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"Informe_Recargas_Toner_{año}_{self.inf_mes_combo.get()}_{fecha}.docx"
           
-            if ExportManager.export_informe_toner(data, filename):
-                messagebox.showinfo("Éxito", f"Informe generado:\n{filename}")
-                if messagebox.askyesno("Abrir", "¿Desea abrir el documento para imprimir?"):
-                    webbrowser.open(filename)
-            else:
-                messagebox.showerror("Error", "No se pudo generar el informe")
+            # Consulta y generación del documento en segundo plano
+            self.controller.ejecutar_exportacion(
+                "docx", filename, self._construir_informe_recargas,
+                año, mes, titulo, subtitulo, filename)
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
     
+    def _generar_pedido_sugerido(self):
+        """Exporta a Excel qué comprar y qué enviar a recarga según el pronóstico de consumo"""
+        fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"Pedido_Sugerido_Toner_{fecha}.xlsx"
+        self.controller.ejecutar_exportacion("xlsx", filename, self._construir_pedido_sugerido, filename)
+
+    def _construir_pedido_sugerido(self, filename, tarea=None):
+        """Calcula el pronóstico y escribe el pedido (corre en segundo plano)"""
+        filas = PronosticoToner(self.controller.db).pedido_sugerido()
+        if not filas:
+            log_export.info("Pedido sugerido: ningún modelo por debajo del punto de pedido")
+        return ExportManager.export_to_excel_stream(
+            iter(filas), PronosticoToner.ENCABEZADOS, filename,
+            f"Pedido Sugerido de Toner - {datetime.now():%d/%m/%Y}", "Pedido", tarea=tarea)
+
+    def _construir_informe_recargas(self, año, mes, titulo, subtitulo, filename, tarea=None):
+        """Obtiene las recargas y genera el informe (corre en segundo plano)"""
+        recargas = self.controller.db.obtener_recargas_toner(año, mes)
+        
+        # Procesar datos para el informe
+        data = {
+            "titulo": titulo,
+            "subtitulo": subtitulo,
+            "encabezados": ["Fecha Envío", "Fecha Recibo", "Marca", "Modelo", "Cantidad", "Empresa", "Estado"],
+            "encabezados_resumen": ["Empresa", "Estado", "Cantidad Total"],
+            "datos": [[r[4], r[5] if r[5] else "N/A", r[0], r[1], r[2], r[3], r[6]] for r in recargas],
+            "resumen": self._generar_resumen_recargas(recargas)
+        }
+        return ExportManager.export_informe_toner(data, filename, tarea=tarea)
+    
     def _generar_resumen_consumos(self, movimientos):
         """Genera un resumen de consumos por marca y modelo"""
         resumen = {}
@@ -4293,24 +7040,23 @@ class MarcasTonerView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Actualizar en la base de datos
-                self.controller.db.cursor.execute(
-                    "UPDATE marcas_toner SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, marca_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 
-                    'MODIFICAR_MARCA_TONER', 
-                    'marcas_toner', 
-                    marca_id,
-                    f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}"
-                )
+                with self.controller.db.transaction():
+                    # Actualizar en la base de datos
+                    self.controller.db.cursor.execute(
+                        "UPDATE marcas_toner SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, marca_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 
+                        'MODIFICAR_MARCA_TONER', 
+                        'marcas_toner', 
+                        marca_id,
+                        f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}"
+                    )
+                self.controller.db.invalidar_catalogos('marcas_toner')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca modificada correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar la marca: {str(e)}")
     
     def _eliminar_marca(self):
@@ -4334,23 +7080,22 @@ class MarcasTonerView(ttk.Frame):
                 return
                 
             if messagebox.askyesno("Confirmar", f"¿Eliminar la marca '{nombre}'?"):
-                self.controller.db.cursor.execute(
-                    "DELETE FROM marcas_toner WHERE id = ?", 
-                    (marca_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 
-                    'ELIMINAR_MARCA_TONER', 
-                    'marcas_toner', 
-                    marca_id,
-                    f"Marca eliminada: {nombre}"
-                )
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM marcas_toner WHERE id = ?", 
+                        (marca_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 
+                        'ELIMINAR_MARCA_TONER', 
+                        'marcas_toner', 
+                        marca_id,
+                        f"Marca eliminada: {nombre}"
+                    )
+                self.controller.db.invalidar_catalogos('marcas_toner')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca eliminada correctamente")
         except Exception as e:
-            self.controller.db.conn.rollback()
             messagebox.showerror("Error", f"No se pudo eliminar la marca: {str(e)}")
           
 
@@ -4428,8 +7173,7 @@ class ModelosTonerView(ttk.Frame):
         
         try:
             # Obtener ID de la marca seleccionada
-            marcas = self.controller.db.obtener_marcas_toner()
-            marca_id = next(m[0] for m in marcas if m[1] == marca)
+            marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
         
             # Obtener y mostrar modelos
             modelos = self.controller.db.obtener_modelos_toner(marca_id)
@@ -4451,8 +7195,7 @@ class ModelosTonerView(ttk.Frame):
         if nombre:
             try:
                 # Obtener ID de la marca
-                marcas = self.controller.db.obtener_marcas_toner()
-                marca_id = next(m[0] for m in marcas if m[1] == marca)
+                marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
                 
                 # Agregar el modelo
                 self.controller.db.agregar_modelo_toner(marca_id, nombre, self.controller.current_user['id'])
@@ -4480,35 +7223,33 @@ class ModelosTonerView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Obtener ID de la marca
-                marcas = self.controller.db.obtener_marcas_toner()
-                marca_id = next(m[0] for m in marcas if m[1] == marca_nombre)
+                with self.controller.db.transaction():
+                    # Obtener ID de la marca
+                    marca_id = self.controller.db.id_catalogo('marcas_toner', marca_nombre)
                 
-                # Verificar que no exista ya
-                modelos = self.controller.db.obtener_modelos_toner(marca_id)
-                if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
-                    raise ValueError("Ya existe un modelo con ese nombre para esta marca")
+                    # Verificar que no exista ya
+                    modelos = self.controller.db.obtener_modelos_toner(marca_id)
+                    if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
+                        raise ValueError("Ya existe un modelo con ese nombre para esta marca")
                 
-                # Actualizar
-                self.controller.db.cursor.execute(
-                    "UPDATE modelos_toner SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, modelo_id))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 
-                    'MODIFICAR_MODELO_TONER', 
-                    'modelos_toner', 
-                    modelo_id,
-                    f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}"
-                )
+                    # Actualizar
+                    self.controller.db.cursor.execute(
+                        "UPDATE modelos_toner SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, modelo_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 
+                        'MODIFICAR_MODELO_TONER', 
+                        'modelos_toner', 
+                        modelo_id,
+                        f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}"
+                    )
+                self.controller.db.invalidar_catalogos('modelos_toner')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo modificado correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar el modelo: {str(e)}")
 
     def _eliminar_modelo(self):
@@ -4532,23 +7273,22 @@ class ModelosTonerView(ttk.Frame):
                 return
                 
             if messagebox.askyesno("Confirmar", f"¿Eliminar el modelo '{nombre}'?"):
-                self.controller.db.cursor.execute(
-                    "DELETE FROM modelos_toner WHERE id = ?", 
-                    (modelo_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 
-                    'ELIMINAR_MODELO_TONER', 
-                    'modelos_toner', 
-                    modelo_id,
-                    f"Modelo eliminado: {nombre} (Marca: {marca_nombre})"
-                )
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM modelos_toner WHERE id = ?", 
+                        (modelo_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 
+                        'ELIMINAR_MODELO_TONER', 
+                        'modelos_toner', 
+                        modelo_id,
+                        f"Modelo eliminado: {nombre} (Marca: {marca_nombre})"
+                    )
+                self.controller.db.invalidar_catalogos('modelos_toner')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo eliminado correctamente")
         except Exception as e:
-            self.controller.db.conn.rollback()
             messagebox.showerror("Error", f"No se pudo eliminar el modelo: {str(e)}")
             
 class RetiroTonerView(ttk.Frame):
@@ -4632,8 +7372,7 @@ class RetiroTonerView(ttk.Frame):
             
         try:
             # Obtener ID de la marca seleccionada
-            marcas = self.controller.db.obtener_marcas_toner()
-            marca_id = next(m[0] for m in marcas if m[1] == marca)
+            marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
             
             # Obtener y mostrar modelos
             modelos = self.controller.db.obtener_modelos_toner(marca_id)
@@ -4662,11 +7401,9 @@ class RetiroTonerView(ttk.Frame):
                 raise ValueError("La cantidad debe ser mayor a cero")
             
             # Obtener ID del modelo
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
-            modelos = self.controller.db.obtener_modelos_toner(id_marca)
-            id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+            id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
             
             # Verificar stock disponible
             stock = self.controller.db.obtener_stock_toner_por_modelo(id_modelo)
@@ -4770,8 +7507,7 @@ class RecargaTonerView(ttk.Frame):
             
         try:
             # Obtener ID de la marca seleccionada
-            marcas = self.controller.db.obtener_marcas_toner()
-            marca_id = next(m[0] for m in marcas if m[1] == marca)
+            marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
             
             # Obtener y mostrar modelos
             modelos = self.controller.db.obtener_modelos_toner(marca_id)
@@ -4809,15 +7545,12 @@ class RecargaTonerView(ttk.Frame):
                 raise ValueError("La cantidad debe ser mayor a cero")
             
             # Obtener ID del modelo
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
-            modelos = self.controller.db.obtener_modelos_toner(id_marca)
-            id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+            id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
             
             # Obtener ID de la empresa
-            empresas = self.controller.db.obtener_empresas_recarga()
-            id_empresa = next(e[0] for e in empresas if e[1] == empresa)
+            id_empresa = self.controller.db.id_catalogo('empresas_recarga', empresa)
             
             # Registrar recarga
             self.controller.db.registrar_recarga_toner(
@@ -4894,64 +7627,71 @@ class InformesTonerView(ttk.Frame):
             año = int(self.anio_combo.get())
             mes = None if self.mes_combo.get() == "Todos" else self._get_month_number(self.mes_combo.get())
             
-            # Obtener datos
-            movimientos = self.controller.db.obtener_movimientos_toner_para_informe(año, mes)
-            
-            # Procesar datos para el informe
-            data = {
-                "titulo": f"Informe de Consumos de Toner - {self.anio_combo.get()}",
-                "subtitulo": f"Mes: {self.mes_combo.get()}" if mes else "Anual",
-                "encabezados": ["Fecha", "Marca", "Modelo", "Cantidad", "Responsable", "Sector"],
-                "datos": [[m[0], m[1], m[2], m[3], m[4], m[5]] for m in movimientos],
-                "resumen": self._generar_resumen_consumos(movimientos)
-            }
+            titulo = f"Informe de Consumos de Toner - {self.anio_combo.get()}"
+            subtitulo = f"Mes: {self.mes_combo.get()}" if mes else "Anual"
             
             # Generar nombre de archivo
             fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"Informe_Consumos_Toner_{año}_{self.mes_combo.get()}_{fecha}.docx"
             
-            if ExportManager.export_informe_toner(data, filename):
-                messagebox.showinfo("Éxito", f"Informe generado:\n{filename}")
-                if messagebox.askyesno("Abrir", "¿Desea abrir el documento para imprimir?"):
-                    webbrowser.open(filename)
-            else:
-                messagebox.showerror("Error", "No se pudo generar el informe")
+            # Consulta y generación del documento en segundo plano
+            self.controller.ejecutar_exportacion(
+                "docx", filename, self._construir_informe_consumos,
+                año, mes, titulo, subtitulo, filename)
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
     
+    def _construir_informe_consumos(self, año, mes, titulo, subtitulo, filename, tarea=None):
+        """Obtiene los movimientos y genera el informe (corre en segundo plano)"""
+        movimientos = self.controller.db.obtener_movimientos_toner_para_informe(año, mes)
+        
+        # Procesar datos para el informe
+        data = {
+            "titulo": titulo,
+            "subtitulo": subtitulo,
+            "encabezados": ["Fecha", "Marca", "Modelo", "Cantidad", "Responsable", "Sector"],
+            "datos": [[m[0], m[1], m[2], m[3], m[4], m[5]] for m in movimientos],
+            "resumen": self._generar_resumen_consumos(movimientos)
+        }
+        return ExportManager.export_informe_toner(data, filename, tarea=tarea)
+    
     def _generar_informe_recargas(self):
         """Genera informe de recargas de toner"""
         try:
             año = int(self.anio_combo.get())
             mes = None if self.mes_combo.get() == "Todos" else self._get_month_number(self.mes_combo.get())
             
-            # Obtener datos
-            recargas = self.controller.db.obtener_recargas_toner_para_informe(año, mes)
-            
-            # Procesar datos para el informe
-            data = {
-                "titulo": f"Informe de Recargas de Toner - {self.anio_combo.get()}",
-                "subtitulo": f"Mes: {self.mes_combo.get()}" if mes else "Anual",
-                "encabezados": ["Fecha Envío", "Fecha Recibo", "Marca", "Modelo", "Cantidad", "Empresa", "Estado"],
-                "datos": [[r[0], r[1] if r[1] else "N/A", r[2], r[3], r[4], r[5], r[6]] for r in recargas],
-                "resumen": self._generar_resumen_recargas(recargas)
-            }
+            titulo = f"Informe de Recargas de Toner - {self.anio_combo.get()}"
+            subtitulo = f"Mes: {self.mes_combo.get()}" if mes else "Anual"
             
             # Generar nombre de archivo
             fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"Informe_Recargas_Toner_{año}_{self.mes_combo.get()}_{fecha}.docx"
             
-            if ExportManager.export_informe_toner(data, filename):
-                messagebox.showinfo("Éxito", f"Informe generado:\n{filename}")
-                if messagebox.askyesno("Abrir", "¿Desea abrir el documento para imprimir?"):
-                    webbrowser.open(filename)
-            else:
-                messagebox.showerror("Error", "No se pudo generar el informe")
+            # Consulta y generación del documento en segundo plano
+            self.controller.ejecutar_exportacion(
+                "docx", filename, self._construir_informe_recargas,
+                año, mes, titulo, subtitulo, filename)
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo generar el informe: {str(e)}")
     
+    def _construir_informe_recargas(self, año, mes, titulo, subtitulo, filename, tarea=None):
+        """Obtiene las recargas y genera el informe (corre en segundo plano)"""
+        recargas = self.controller.db.obtener_recargas_toner_para_informe(año, mes)
+        
+        # Procesar datos para el informe
+        data = {
+            "titulo": titulo,
+            "subtitulo": subtitulo,
+            "encabezados": ["Fecha Envío", "Fecha Recibo", "Marca", "Modelo", "Cantidad", "Empresa", "Estado"],
+            "encabezados_resumen": ["Empresa", "Estado", "Cantidad Total"],
+            "datos": [[r[0], r[1] if r[1] else "N/A", r[2], r[3], r[4], r[5], r[6]] for r in recargas],
+            "resumen": self._generar_resumen_recargas(recargas)
+        }
+        return ExportManager.export_informe_toner(data, filename, tarea=tarea)
+    
     def _generar_resumen_consumos(self, movimientos):
         """Genera un resumen de consumos por marca y modelo"""
         resumen = {}
@@ -5070,27 +7810,26 @@ class MarcasTonerView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Primero verificamos que no exista ya una marca con ese nombre
-                marcas = self.controller.db.obtener_marcas()
-                if any(nuevo_nombre.lower() == m[1].lower() for m in marcas):
-                    raise ValueError("Ya existe una marca con ese nombre")
-                
-                # Actualizamos la marca
-                self.controller.db.cursor.execute(
-                    "UPDATE marcas SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, marca_id))
+                with self.controller.db.transaction():
+                    # Primero verificamos que no exista ya una marca con ese nombre
+                    marcas = self.controller.db.obtener_marcas()
+                    if any(nuevo_nombre.lower() == m[1].lower() for m in marcas):
+                        raise ValueError("Ya existe una marca con ese nombre")
                 
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_MARCA', 'marcas', marca_id,
-                    f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}")
+                    # Actualizamos la marca
+                    self.controller.db.cursor.execute(
+                        "UPDATE marcas SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, marca_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_MARCA', 'marcas', marca_id,
+                        f"Modificación de marca: {nombre_actual} -> {nuevo_nombre}")
+                self.controller.db.invalidar_catalogos('marcas')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca modificada correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar la marca: {str(e)}")
     
     def _eliminar_marca(self):
@@ -5116,18 +7855,17 @@ class MarcasTonerView(ttk.Frame):
             
         if messagebox.askyesno("Confirmar", f"¿Está seguro que desea eliminar la marca '{nombre}'?"):
             try:
-                self.controller.db.cursor.execute(
-                    "DELETE FROM marcas WHERE id = ?", (marca_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ELIMINAR_MARCA', 'marcas', marca_id,
-                    f"Marca eliminada: {nombre}")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM marcas WHERE id = ?", (marca_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ELIMINAR_MARCA', 'marcas', marca_id,
+                        f"Marca eliminada: {nombre}")
+                self.controller.db.invalidar_catalogos('marcas')
                 self._cargar_marcas()
                 messagebox.showinfo("Éxito", "Marca eliminada correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo eliminar la marca: {str(e)}")
         
 
@@ -5207,8 +7945,7 @@ class ModelosTonerView(ttk.Frame):
             self.treeview.delete(item)
             
         # Obtener ID de la marca seleccionada
-        marcas = self.controller.db.obtener_marcas()
-        marca_id = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+        marca_id = self.controller.db.id_catalogo('marcas', marca_seleccionada)
         
         # Obtener y mostrar modelos
         modelos = self.controller.db.obtener_modelos(marca_id)
@@ -5226,8 +7963,7 @@ class ModelosTonerView(ttk.Frame):
         if nombre:
             try:
                 # Obtener ID de la marca seleccionada
-                marcas = self.controller.db.obtener_marcas()
-                marca_id = next(m[0] for m in marcas if m[1] == marca_seleccionada)
+                marca_id = self.controller.db.id_catalogo('marcas', marca_seleccionada)
                 
                 # Agregar el modelo
                 self.controller.db.agregar_modelo(marca_id, nombre, self.controller.current_user['id'])
@@ -5252,31 +7988,29 @@ class ModelosTonerView(ttk.Frame):
                                             initialvalue=nombre_actual)
         if nuevo_nombre and nuevo_nombre != nombre_actual:
             try:
-                # Obtener ID de la marca
-                marcas = self.controller.db.obtener_marcas()
-                marca_id = next(m[0] for m in marcas if m[1] == marca_nombre)
-                
-                # Verificar que no exista ya un modelo con ese nombre para esta marca
-                modelos = self.controller.db.obtener_modelos(marca_id)
-                if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
-                    raise ValueError("Ya existe un modelo con ese nombre para esta marca")
+                with self.controller.db.transaction():
+                    # Obtener ID de la marca
+                    marca_id = self.controller.db.id_catalogo('marcas', marca_nombre)
                 
-                # Actualizar el modelo
-                self.controller.db.cursor.execute(
-                    "UPDATE modelos SET nombre = ? WHERE id = ?",
-                    (nuevo_nombre, modelo_id))
+                    # Verificar que no exista ya un modelo con ese nombre para esta marca
+                    modelos = self.controller.db.obtener_modelos(marca_id)
+                    if any(nuevo_nombre.lower() == m[1].lower() for m in modelos):
+                        raise ValueError("Ya existe un modelo con ese nombre para esta marca")
                 
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_MODELO', 'modelos', modelo_id,
-                    f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}")
+                    # Actualizar el modelo
+                    self.controller.db.cursor.execute(
+                        "UPDATE modelos SET nombre = ? WHERE id = ?",
+                        (nuevo_nombre, modelo_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_MODELO', 'modelos', modelo_id,
+                        f"Modificación de modelo: {nombre_actual} -> {nuevo_nombre}")
+                self.controller.db.invalidar_catalogos('modelos')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo modificado correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar el modelo: {str(e)}")
     
     def _eliminar_modelo(self):
@@ -5302,18 +8036,17 @@ class ModelosTonerView(ttk.Frame):
             
         if messagebox.askyesno("Confirmar", f"¿Está seguro que desea eliminar el modelo '{nombre}'?"):
             try:
-                self.controller.db.cursor.execute(
-                    "DELETE FROM modelos WHERE id = ?", (modelo_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ELIMINAR_MODELO', 'modelos', modelo_id,
-                    f"Modelo eliminado: {nombre} (Marca: {marca_nombre})")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM modelos WHERE id = ?", (modelo_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ELIMINAR_MODELO', 'modelos', modelo_id,
+                        f"Modelo eliminado: {nombre} (Marca: {marca_nombre})")
+                self.controller.db.invalidar_catalogos('modelos')
                 self._cargar_modelos()
                 messagebox.showinfo("Éxito", "Modelo eliminado correctamente")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo eliminar el modelo: {str(e)}")
 
 class RetiroTonerView(ttk.Frame):
@@ -5396,8 +8129,7 @@ class RetiroTonerView(ttk.Frame):
             
         try:
             # Obtener ID de la marca seleccionada
-            marcas = self.controller.db.obtener_marcas_toner()
-            marca_id = next(m[0] for m in marcas if m[1] == marca)
+            marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
             
             # Obtener y mostrar modelos
             modelos = self.controller.db.obtener_modelos_toner(marca_id)
@@ -5426,11 +8158,9 @@ class RetiroTonerView(ttk.Frame):
                 raise ValueError("La cantidad debe ser mayor a cero")
             
             # Obtener ID del modelo
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
-            modelos = self.controller.db.obtener_modelos_toner(id_marca)
-            id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+            id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
             
             # Verificar stock disponible
             stock = self.controller.db.obtener_stock_toner_por_modelo(id_modelo)
@@ -5530,8 +8260,7 @@ class RecargaTonerView(ttk.Frame):
             
         try:
             # Obtener ID de la marca seleccionada
-            marcas = self.controller.db.obtener_marcas_toner()
-            marca_id = next(m[0] for m in marcas if m[1] == marca)
+            marca_id = self.controller.db.id_catalogo('marcas_toner', marca)
             
             # Obtener y mostrar modelos
             modelos = self.controller.db.obtener_modelos_toner(marca_id)
@@ -5569,15 +8298,12 @@ class RecargaTonerView(ttk.Frame):
                 raise ValueError("La cantidad debe ser mayor a cero")
             
             # Obtener ID del modelo
-            marcas = self.controller.db.obtener_marcas_toner()
-            id_marca = next(m[0] for m in marcas if m[1] == marca)
+            id_marca = self.controller.db.id_catalogo('marcas_toner', marca)
             
-            modelos = self.controller.db.obtener_modelos_toner(id_marca)
-            id_modelo = next(m[0] for m in modelos if m[1] == modelo)
+            id_modelo = self.controller.db.id_catalogo('modelos_toner', modelo, id_marca)
             
             # Obtener ID de la empresa
-            empresas = self.controller.db.obtener_empresas_recarga()
-            id_empresa = next(e[0] for e in empresas if e[1] == empresa)
+            id_empresa = self.controller.db.id_catalogo('empresas_recarga', empresa)
             
             # Registrar recarga
             self.controller.db.registrar_recarga_toner(
@@ -5719,24 +8445,23 @@ class EmpresasRecargaView(ttk.Frame):
                 return
                 
             try:
-                self.controller.db.cursor.execute(
-                    "INSERT INTO empresas_recarga (nombre, contacto, telefono) VALUES (?, ?, ?)",
-                    (nombre, contacto or None, telefono or None))
-                
-                empresa_id = self.controller.db.cursor.lastrowid
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "INSERT INTO empresas_recarga (nombre, contacto, telefono) VALUES (?, ?, ?)",
+                        (nombre, contacto or None, telefono or None))
                 
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ALTA_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
-                    f"Nueva empresa agregada: {nombre}")
+                    empresa_id = self.controller.db.cursor.lastrowid
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ALTA_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
+                        f"Nueva empresa agregada: {nombre}")
+                self.controller.db.invalidar_catalogos('empresas_recarga')
                 self._cargar_empresas()
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Empresa agregada correctamente")
             except sqlite3.IntegrityError:
                 messagebox.showerror("Error", "Ya existe una empresa con ese nombre")
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo agregar la empresa: {str(e)}")
         
         ttk.Button(button_frame, text="Aceptar", command=on_ok).pack(side=tk.LEFT, padx=5)
@@ -5803,31 +8528,30 @@ class EmpresasRecargaView(ttk.Frame):
                 return
                 
             try:
-                # Verificar si el nombre cambió y si ya existe
-                if nuevo_nombre != nombre_actual:
-                    self.controller.db.cursor.execute(
-                        "SELECT COUNT(*) FROM empresas_recarga WHERE nombre = ?", 
-                        (nuevo_nombre,))
-                    if self.controller.db.cursor.fetchone()[0] > 0:
-                        raise ValueError("Ya existe una empresa con ese nombre")
-                
-                # Actualizar la empresa
-                self.controller.db.cursor.execute(
-                    "UPDATE empresas_recarga SET nombre = ?, contacto = ?, telefono = ? WHERE id = ?",
-                    (nuevo_nombre, nuevo_contacto or None, nuevo_telefono or None, empresa_id))
+                with self.controller.db.transaction():
+                    # Verificar si el nombre cambió y si ya existe
+                    if nuevo_nombre != nombre_actual:
+                        self.controller.db.cursor.execute(
+                            "SELECT COUNT(*) FROM empresas_recarga WHERE nombre = ?", 
+                            (nuevo_nombre,))
+                        if self.controller.db.cursor.fetchone()[0] > 0:
+                            raise ValueError("Ya existe una empresa con ese nombre")
                 
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'MODIFICAR_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
-                    f"Empresa modificada: {nombre_actual} -> {nuevo_nombre}")
+                    # Actualizar la empresa
+                    self.controller.db.cursor.execute(
+                        "UPDATE empresas_recarga SET nombre = ?, contacto = ?, telefono = ? WHERE id = ?",
+                        (nuevo_nombre, nuevo_contacto or None, nuevo_telefono or None, empresa_id))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'MODIFICAR_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
+                        f"Empresa modificada: {nombre_actual} -> {nuevo_nombre}")
+                self.controller.db.invalidar_catalogos('empresas_recarga')
                 self._cargar_empresas()
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Empresa modificada correctamente")
             except ValueError as e:
                 messagebox.showerror("Error", str(e))
             except Exception as e:
-                self.controller.db.conn.rollback()
                 messagebox.showerror("Error", f"No se pudo modificar la empresa: {str(e)}")
         
         ttk.Button(button_frame, text="Aceptar", command=on_ok).pack(side=tk.LEFT, padx=5)
@@ -5864,21 +8588,120 @@ class EmpresasRecargaView(ttk.Frame):
                 return
                 
             if messagebox.askyesno("Confirmar", f"¿Eliminar la empresa '{nombre}'?"):
-                self.controller.db.cursor.execute(
-                    "DELETE FROM empresas_recarga WHERE id = ?", 
-                    (empresa_id,))
-                
-                self.controller.db.registrar_auditoria(
-                    self.controller.current_user['id'], 'ELIMINAR_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
-                    f"Empresa eliminada: {nombre}")
+                with self.controller.db.transaction():
+                    self.controller.db.cursor.execute(
+                        "DELETE FROM empresas_recarga WHERE id = ?", 
+                        (empresa_id,))
                 
-                self.controller.db.conn.commit()
+                    self.controller.db.registrar_auditoria(
+                        self.controller.current_user['id'], 'ELIMINAR_EMPRESA_RECARGA', 'empresas_recarga', empresa_id,
+                        f"Empresa eliminada: {nombre}")
+                self.controller.db.invalidar_catalogos('empresas_recarga')
                 self._cargar_empresas()
                 messagebox.showinfo("Éxito", "Empresa eliminada correctamente")
         except Exception as e:
-            self.controller.db.conn.rollback()
             messagebox.showerror("Error", f"No se pudo eliminar la empresa: {str(e)}")
 
+class RegistroVistas:
+    """Registro de vistas que guarda fábricas y construye cada vista en su primer uso.
+
+    Se comporta como el diccionario de vistas anterior: ``views[nombre]`` y
+    ``views.get(nombre)`` devuelven la vista (construyéndola si hace falta) y
+    ``nombre in views`` indica si la vista está registrada.
+    """
+
+    # Atributos donde las vistas guardan sus tareas en segundo plano
+    _ATRIBUTOS_TAREA = ("_tarea_carga", "_tarea_reporte", "_tarea_conteo", "_busqueda_tarea")
+
+    def __init__(self, contenedor, controller, max_vivas=None, fijas=None):
+        self.contenedor = contenedor
+        self.controller = controller
+        self.max_vivas = max_vivas or Config.MAX_VISTAS_VIVAS
+        self.fijas = set(fijas if fijas is not None else Config.VISTAS_FIJAS)
+        self._fabricas = {}
+        self._vivas = OrderedDict()  # nombre -> vista, de menos a más reciente
+        self.actual = None
+
+    def registrar(self, nombre, fabrica):
+        """Registra la fábrica (clase o callable(parent, controller)) de una vista"""
+        self._fabricas[nombre] = fabrica
+
+    def construida(self, nombre):
+        return nombre in self._vivas
+
+    def __contains__(self, nombre):
+        return nombre in self._fabricas
+
+    def __getitem__(self, nombre):
+        if nombre not in self._fabricas:
+            raise KeyError(nombre)
+        vista = self._vivas.get(nombre)
+        if vista is None:
+            vista = self._construir(nombre)
+        self._vivas.move_to_end(nombre)
+        return vista
+
+    def get(self, nombre, default=None):
+        try:
+            return self[nombre]
+        except KeyError:
+            return default
+
+    def values(self):
+        """Vistas ya construidas"""
+        return list(self._vivas.values())
+
+    def _construir(self, nombre):
+        inicio = time.perf_counter()
+        vista = self._fabricas[nombre](self.contenedor, self.controller)
+        vista.grid(row=0, column=0, sticky="nsew")
+        self._vivas[nombre] = vista
+        log_ui.debug(f"Vista {nombre} construida en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        self._liberar(excepto=nombre)
+        return vista
+
+    def _liberar(self, excepto=None):
+        """Destruye las vistas menos usadas cuando se supera el máximo
+        (nunca las fijas, la actual ni `excepto`, la recién construida)"""
+        for nombre in list(self._vivas):
+            if len(self._vivas) <= self.max_vivas:
+                break
+            if nombre in self.fijas or nombre in (self.actual, excepto):
+                continue
+            vista = self._vivas.pop(nombre)
+            # Sin esto, el resultado de una tarea en curso llegaría a widgets destruidos
+            for atributo in self._ATRIBUTOS_TAREA:
+                tarea = getattr(vista, atributo, None)
+                if tarea is not None:
+                    tarea.cancelar()
+            try:
+                vista.destroy()
+            except tk.TclError as e:
+                log_ui.warning(f"No se pudo destruir la vista {nombre}: {e}")
+            log_ui.debug(f"Vista {nombre} liberada")
+
+    def preconstruir(self, nombres):
+        """Construye las vistas indicadas de a una, en tiempo ocioso"""
+        pendientes = [n for n in nombres if n in self._fabricas and n not in self._vivas]
+        if not pendientes:
+            return
+
+        def siguiente():
+            nombre = pendientes.pop(0)
+            if nombre not in self._vivas:
+                try:
+                    self._construir(nombre)
+                    # Mantener la vista actual al frente
+                    if self.actual in self._vivas:
+                        self._vivas[self.actual].tkraise()
+                except Exception as e:
+                    log_ui.error(f"Error al preconstruir la vista {nombre}: {e}", exc_info=True)
+            if pendientes:
+                self.contenedor.after_idle(siguiente)
+
+        self.contenedor.after_idle(siguiente)
+
+
 class MainController:
     """Controlador principal de la aplicación"""
 
@@ -5895,6 +8718,9 @@ class MainController:
         self.db = Database()
         self.current_user = None
         
+        # Ejecutor de tareas en segundo plano (las vistas lo usan al construirse)
+        self.executor = TaskExecutor(self.root)
+        
         # Configurar ventana principal
         self._configure_window()
         self._configure_styles()
@@ -5905,8 +8731,8 @@ class MainController:
         self.container.grid_rowconfigure(0, weight=1)
         self.container.grid_columnconfigure(0, weight=1)
         
-        # Diccionario de vistas
-        self.views = {}
+        # Registro de vistas (se construyen al mostrarse por primera vez)
+        self.views = RegistroVistas(self.container, self)
         self._register_views()
 
         # Mostrar ventana principal solo después de que el login esté listo
@@ -5922,8 +8748,52 @@ class MainController:
         # Forzar que el LoginView esté al frente
         self.views["LoginView"].tkraise()
 
+        # Medir el arranque y precargar en segundo plano los módulos de exportación
+        self.root.after_idle(self._registrar_arranque)
+        self.root.after(Config.PRELOAD_DELAY_MS,
+                        lambda: self.executor.ejecutar(precargar_modulos))
+        self.root.after(Config.PRELOAD_DELAY_MS, self._mantener_libro_toner)
+        self.root.after(Config.PRELOAD_DELAY_MS, self._backup_programado)
+
+        # Acceso oculto a las estadísticas de consultas (solo administradores)
+        self.root.bind("<Control-Q>", self._mostrar_consultas)
+
+    def _mostrar_consultas(self, event=None):
+        if self.current_user and self.current_user['rol'] == 'admin':
+            self.mostrar_vista("ConsultasView")
+
+    def _mantener_libro_toner(self):
+        """Genera los cierres mensuales de toner y detecta desfasajes del
+        contador en segundo plano; se reprograma periódicamente"""
+        def tarea():
+            self.db.generar_cierres_stock_toner()
+            return self.db.conciliar_stock_toner()
+
+        self.executor.ejecutar(
+            tarea, on_error=lambda e: log_ui.error(f"Error manteniendo el libro de toner: {e}"))
+        self.root.after(Config.LIBRO_TONER_INTERVALO_MS, self._mantener_libro_toner)
+
+    def _backup_programado(self):
+        """Crea una copia en segundo plano si la última tiene más de
+        Config.BACKUP_INTERVALO_HORAS; se vuelve a comprobar cada hora"""
+        def tarea():
+            backups = self.db.listar_backups()
+            if backups and datetime.now() - backups[0][1] < timedelta(hours=Config.BACKUP_INTERVALO_HORAS):
+                return None
+            return self.db.crear_backup()
+
+        self.executor.ejecutar(
+            tarea, on_error=lambda e: log_ui.error(f"Error en la copia de seguridad programada: {e}"))
+        self.root.after(60 * 60 * 1000, self._backup_programado)
+
 
 
+    def _registrar_arranque(self):
+        """Registra en el log los tiempos de importación y de primera pantalla"""
+        ahora = time.perf_counter()
+        log_ui.info(
+            f"Arranque: imports {(FIN_IMPORTS - INICIO_PROCESO) * 1000:.0f} ms, "
+            f"primera pantalla {(ahora - INICIO_PROCESO) * 1000:.0f} ms")
         
     def _configure_window(self):
         """Configura la ventana principal con nuevos estilos"""
@@ -6044,33 +8914,30 @@ class MainController:
                       foreground=Config.PRIMARY_COLOR)
     
     def _register_views(self):
-        """Registra todas las vistas disponibles"""
-        self.views['LoginView'] = LoginView(self.container, self)
-        self.views['MainView'] = MainView(self.container, self)
-        self.views['EquipmentView'] = EquipmentView(self.container, self)
-        self.views['EditarEquipoView'] = EditarEquipoView(self.container, self)  # Nueva vista
-        self.views['ReparacionView'] = ReparacionView(self.container, self)
-        self.views['MarcasView'] = MarcasView(self.container, self)
-        self.views['ModelosView'] = ModelosView(self.container, self)
-        self.views['ReporteEquiposView'] = ReporteEquiposView(self.container, self)
-        self.views['ReporteRepuestosView'] = ReporteRepuestosView(self.container, self)
+        """Registra todas las vistas disponibles (se construyen al primer uso)"""
+        self.views.registrar('LoginView', LoginView)
+        self.views.registrar('MainView', MainView)
+        self.views.registrar('EquipmentView', EquipmentView)
+        self.views.registrar('EditarEquipoView', EditarEquipoView)  # Nueva vista
+        self.views.registrar('ReparacionView', ReparacionView)
+        self.views.registrar('MarcasView', MarcasView)
+        self.views.registrar('ModelosView', ModelosView)
+        self.views.registrar('ReporteEquiposView', ReporteEquiposView)
+        self.views.registrar('ReporteRepuestosView', ReporteRepuestosView)
 
-        self.views['ReporteResumenRepuestosView'] = ReporteResumenRepuestosView(self.container, self)
+        self.views.registrar('ReporteResumenRepuestosView', ReporteResumenRepuestosView)
 
-        self.views['UsuariosView'] = UsuariosView(self.container, self)
+        self.views.registrar('UsuariosView', UsuariosView)
+        self.views.registrar('ConsultasView', ConsultasView)
 
 
         # Nuevas vistas para toner
-        self.views['TonerView'] = TonerView(self.container, self)
-        self.views['MarcasTonerView'] = MarcasTonerView(self.container, self)
-        self.views['ModelosTonerView'] = ModelosTonerView(self.container, self)
-        self.views['RetiroTonerView'] = RetiroTonerView(self.container, self)
-        self.views['RecargaTonerView'] = RecargaTonerView(self.container, self)
-        self.views['InformesTonerView'] = InformesTonerView(self.container, self)
-        
-        # Configurar todas las vistas en el contenedor
-        for view in self.views.values():
-            view.grid(row=0, column=0, sticky="nsew")
+        self.views.registrar('TonerView', TonerView)
+        self.views.registrar('MarcasTonerView', MarcasTonerView)
+        self.views.registrar('ModelosTonerView', ModelosTonerView)
+        self.views.registrar('RetiroTonerView', RetiroTonerView)
+        self.views.registrar('RecargaTonerView', RecargaTonerView)
+        self.views.registrar('InformesTonerView', InformesTonerView)
     
     def mostrar_vista(self, view_name, *args, **kwargs):
         """Muestra una vista con verificación de autenticación"""
@@ -6081,12 +8948,16 @@ class MainController:
     
         view = self.views.get(view_name)
         if view:
+            self.views.actual = view_name
             # Si la vista necesita inicialización
             if hasattr(view, 'initialize'):
                 if not args and not kwargs:
                     view.initialize()  # Llamar sin argumentos para actualizar
                 else:
                     view.initialize(*args, **kwargs)
+                # initialize pudo redirigir a otra vista (sesión o rol)
+                if self.views.actual != view_name:
+                    return
         
             # Mostrar la vista
             view.tkraise()
@@ -6113,6 +8984,8 @@ class MainController:
         }
         self.mostrar_vista("MainView")
 
+        # Preparar en tiempo ocioso las vistas que probablemente se abran después
+        self.views.preconstruir(Config.VISTAS_PRECONSTRUIR)
 
         # Actualizar la barra de estado con el usuario
         if "MainView" in self.views:
@@ -6130,34 +9003,506 @@ class MainController:
         try:
             resultado = self.db.autenticar_usuario(username, password)
             if resultado:
-                logging.info(f"Usuario autenticado: {username}")
+                log_ui.info(f"Usuario autenticado: {username}")
                 return resultado
         
             messagebox.showerror("Error", "Credenciales inválidas")
             return None
         except Exception as e:
-            logging.error(f"Error en autenticación: {e}")
+            log_ui.error(f"Error en autenticación: {e}")
             messagebox.showerror("Error", f"Error al autenticar: {str(e)}")
             return None
 
 
     
+    def ejecutar_exportacion(self, formato, archivo, export_func, *args, **kwargs):
+        """Ejecuta una exportación en segundo plano con ventana de progreso.
+
+        Se llama export_func(*args, tarea=tarea, **kwargs), que debe devolver
+        True si generó el archivo y llamar a tarea.comprobar() mientras recorre
+        las filas: Cancelar en el diálogo detiene la exportación antes de que
+        el archivo se escriba.
+        """
+        dialogo = DialogoProgreso(self.root, "Exportando...",
+                                  f"Generando archivo {formato.upper()}...")
+
+        def al_terminar(success):
+            dialogo.cerrar()
+            if success:
+                messagebox.showinfo("Éxito", f"Reporte exportado correctamente a:\n{archivo}")
+                if messagebox.askyesno("Abrir", f"¿Desea abrir el archivo {formato.upper()}?"):
+                    try:
+                        webbrowser.open(archivo)
+                    except Exception as e:
+                        log_ui.warning(f"No se pudo abrir el archivo: {str(e)}")
+            else:
+                messagebox.showerror("Error", f"No se pudo exportar el reporte a {formato.upper()}")
+
+        def al_fallar(error):
+            dialogo.cerrar()
+            if isinstance(error, PermissionError):
+                messagebox.showerror("Error de permisos", 
+                                   "No tiene permisos para guardar en la ubicación seleccionada.\n"
+                                   "Por favor, elija otra ubicación o cierre el archivo si está abierto.")
+            else:
+                messagebox.showerror("Error", 
+                                   f"No se pudo completar la exportación:\n{str(error)}\n"
+                                   "Consulte el archivo de logs para más detalles.")
+
+        tarea = self.executor.ejecutar(
+            lambda tarea, *a, **kw: export_func(*a, tarea=tarea, **kw), *args,
+            con_tarea=True, on_exito=al_terminar, on_error=al_fallar,
+            on_progreso=dialogo.actualizar, **kwargs)
+        dialogo.tarea = tarea
+        return tarea
+
     def cerrar_aplicacion(self):
         """Cierra la aplicación con confirmación"""
         if messagebox.askokcancel("Salir", "¿Está seguro que desea salir del sistema?"):
             # Registrar en logs
             if self.current_user:
-                logging.info(f"Usuario {self.current_user['username']} cerró la aplicación")
+                log_ui.info(f"Usuario {self.current_user['username']} cerró la aplicación")
             else:
-                logging.info("Aplicación cerrada sin sesión activa")
+                log_ui.info("Aplicación cerrada sin sesión activa")
         
-            # Cerrar conexión a BD
-            if hasattr(self, 'db') and hasattr(self.db, 'conn'):
-                self.db.conn.close()
+            # Detener tareas en segundo plano
+            if hasattr(self, 'executor'):
+                self.executor.cerrar()
+        
+            # Cerrar conexiones a BD
+            if hasattr(self, 'db'):
+                self.db.cerrar()
         
             # Destruir ventana
             self.root.destroy()
         
+class ResultadoImportacion:
+    """Resumen de una importación: filas leídas, insertadas y errores por fila"""
+
+    def __init__(self, simulacion=False):
+        self.simulacion = simulacion
+        self.leidas = 0
+        self.insertadas = 0
+        self.creados = []   # (catálogo, nombre) creados o que se crearían
+        self.errores = []   # (fila, serie, mensaje)
+
+    def error(self, fila, serie, mensaje):
+        self.errores.append((fila, serie, mensaje))
+
+    def resumen(self):
+        verbo = "se insertarían" if self.simulacion else "insertadas"
+        lineas = [f"Filas leídas: {self.leidas}",
+                  f"Filas válidas ({verbo}): {self.insertadas}",
+                  f"Filas con errores: {len(self.errores)}"]
+        if self.creados:
+            lineas.append("Catálogos " + ("a crear" if self.simulacion else "creados") + ": " +
+                          ", ".join(f"{nombre} ({catalogo})" for catalogo, nombre in self.creados))
+        return "\n".join(lineas)
+
+    def guardar_errores(self, archivo):
+        """Guarda el detalle de errores por fila en un CSV"""
+        with open(archivo, "w", newline="", encoding="utf-8-sig") as f:
+            escritor = csv.writer(f, delimiter=";")
+            escritor.writerow(["Fila", "Serie", "Error"])
+            escritor.writerows(self.errores)
+
+
+class PronosticoToner:
+    """Pronóstico de consumo de toner y pedido sugerido por modelo.
+
+    Los retiros de todos los modelos se leen en una consulta (agregados por
+    día) y se vuelcan en una matriz modelos x días de numpy; las tasas se
+    calculan sobre la matriz completa, sin recorrer modelos en Python:
+
+      - media móvil: consumo diario promedio de los últimos
+        Config.PRONOSTICO_VENTANA_DIAS días;
+      - estacional: consumo del mismo período del año anterior, escalado por
+        la tendencia (últimos N días contra los mismos N del año anterior);
+        si no hay historia de un año se usa solo la media móvil.
+
+    Con la tasa diaria y su desvío se obtienen los días de cobertura, el punto
+    de pedido (demora + stock de seguridad) y la cantidad sugerida para
+    volver al stock objetivo. Los modelos que ya se enviaron a recarga se
+    sugieren para recarga, el resto para compra. numpy y pandas se importan
+    al primer uso.
+    """
+
+    ENCABEZADOS = ["Marca", "Modelo", "Stock", "En recarga", "Consumo mensual",
+                   "Días de cobertura", "Punto de pedido", "Sugerido", "Acción", "Empresa"]
+
+    def __init__(self, db):
+        self.db = db
+
+    def calcular(self, hoy=None):
+        """DataFrame con una fila por modelo: stock, tasas, cobertura, punto
+        de pedido, cantidad sugerida y acción ("Comprar" o "Enviar a recarga")"""
+        import numpy as np
+        import pandas as pd
+
+        hoy = hoy or datetime.now().date()
+        ventana = Config.PRONOSTICO_VENTANA_DIAS
+        demora = Config.PRONOSTICO_DEMORA_DIAS
+        horizonte = min(demora + Config.PRONOSTICO_COBERTURA_DIAS, 365)
+        dias = 365 + ventana  # historia: un año más la ventana
+        desde = (hoy - timedelta(days=dias)).isoformat()
+
+        modelos = pd.DataFrame(self.db.obtener_modelos_para_pedido(), columns=[
+            "id_modelo", "marca", "modelo", "stock", "en_recarga", "envios", "empresa"])
+        if modelos.empty:
+            return modelos
+        modelos["empresa"] = modelos["empresa"].fillna("")
+        fila_de = pd.Series(np.arange(len(modelos)), index=modelos["id_modelo"])
+
+        # Matriz modelos x días con los retiros acumulados
+        consumo = np.zeros((len(modelos), dias))
+        filas = np.array(self.db.obtener_consumos_diarios_toner(desde), dtype=float).reshape(-1, 3)
+        filas = filas[(filas[:, 1] >= 0) & (filas[:, 1] < dias) & np.isin(filas[:, 0], fila_de.index)]
+        np.add.at(consumo, (fila_de.loc[filas[:, 0].astype(int)].to_numpy(), filas[:, 1].astype(int)),
+                  filas[:, 2])
+
+        reciente = consumo[:, dias - ventana:]
+        media_movil = reciente.mean(axis=1)
+        desvio = reciente.std(axis=1)
+
+        # Mismo período del año anterior: [0, ventana) antes y [ventana, ventana + horizonte) después
+        base_anterior = consumo[:, :ventana].sum(axis=1)
+        tendencia = np.clip(np.divide(reciente.sum(axis=1), base_anterior,
+                                      out=np.ones(len(modelos)), where=base_anterior > 0), 0.5, 2.0)
+        estacional = consumo[:, ventana:ventana + horizonte].mean(axis=1) * tendencia
+        tasa = np.where(base_anterior > 0, (media_movil + estacional) / 2, media_movil)
+
+        disponible = modelos["stock"].to_numpy() + modelos["en_recarga"].to_numpy()
+        punto_pedido = tasa * demora + Config.PRONOSTICO_NIVEL_SERVICIO_Z * desvio * np.sqrt(demora)
+        objetivo = punto_pedido + tasa * Config.PRONOSTICO_COBERTURA_DIAS
+        sugerido = np.where((tasa > 0) & (disponible <= punto_pedido),
+                            np.ceil(objetivo - disponible), 0).clip(min=0)
+
+        modelos["tasa_diaria"] = tasa
+        modelos["media_movil"] = media_movil
+        modelos["estacional"] = np.where(base_anterior > 0, estacional, np.nan)
+        modelos["dias_cobertura"] = np.divide(modelos["stock"].to_numpy(), tasa,
+                                              out=np.full(len(modelos), np.inf), where=tasa > 0)
+        modelos["punto_pedido"] = np.ceil(punto_pedido)
+        modelos["sugerido"] = sugerido.astype(int)
+        modelos["accion"] = np.where(sugerido == 0, "",
+                                     np.where(modelos["envios"] > 0, "Enviar a recarga", "Comprar"))
+        return modelos
+
+    def pedido_sugerido(self, hoy=None):
+        """Filas del informe "Pedido sugerido" (ENCABEZADOS): los modelos con
+        cantidad sugerida, primero los de menor cobertura"""
+        modelos = self.calcular(hoy)
+        if modelos.empty:
+            return []
+        pedido = modelos[modelos["sugerido"] > 0].sort_values(["accion", "dias_cobertura"])
+        return [
+            [fila.marca, fila.modelo, int(fila.stock), int(fila.en_recarga),
+             round(fila.tasa_diaria * 30, 1), round(fila.dias_cobertura),
+             int(fila.punto_pedido), int(fila.sugerido), fila.accion, fila.empresa]
+            for fila in pedido.itertuples(index=False)
+        ]
+
+
+class ImportManager:
+    """Importación masiva de equipos y repuestos desde CSV o XLSX.
+
+    El archivo se recorre por lotes de Config.IMPORT_BATCH_SIZE filas: cada
+    lote se valida (catálogos resueltos contra mapas precargados, series
+    duplicadas con una consulta por conjuntos) y las filas válidas se insertan
+    con executemany en una transacción. Con simulacion=True solo se valida.
+    """
+
+    # campo -> encabezados aceptados (normalizados: minúsculas y sin acentos)
+    COLUMNAS_EQUIPOS = {
+        'pj': ('pj',),
+        'tipo': ('tipo', 'tipo de equipo', 'tipo equipo'),
+        'serie': ('serie', 'numero de serie', 'nro de serie', 'nro serie', 'n de serie'),
+        'marca': ('marca',),
+        'modelo': ('modelo',),
+        'ubicacion': ('ubicacion',),
+        'fecha_ingreso': ('fecha ingreso', 'fecha de ingreso', 'ingreso', 'fecha'),
+        'falla': ('falla',),
+        'estado': ('estado',),
+        'observaciones': ('observaciones', 'obs'),
+    }
+    OBLIGATORIAS_EQUIPOS = ('pj', 'tipo', 'serie', 'marca', 'modelo', 'falla')
+
+    COLUMNAS_REPUESTOS = {
+        'serie': COLUMNAS_EQUIPOS['serie'],
+        'nombre': ('nombre', 'repuesto'),
+        'cantidad': ('cantidad', 'cant'),
+        'costo': ('costo', 'costo unitario', 'precio'),
+    }
+    OBLIGATORIAS_REPUESTOS = ('serie', 'nombre', 'cantidad')
+
+    ESTADOS = ("En reparación", "Reparado", "Irreparable")
+    FORMATOS_FECHA = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y")
+
+    def __init__(self, db, usuario_id):
+        self.db = db
+        self.usuario_id = usuario_id
+
+    @staticmethod
+    def _normalizar(texto):
+        """Minúsculas, sin acentos y con espacios simples (para encabezados y catálogos)"""
+        texto = unicodedata.normalize("NFKD", str(texto or ""))
+        texto = "".join(c for c in texto if not unicodedata.combining(c))
+        return " ".join(re.sub(r"[_°º.]", " ", texto).lower().split())
+
+    @staticmethod
+    def _celda(valor):
+        if valor is None:
+            return ""
+        if isinstance(valor, datetime):
+            return valor.strftime("%Y-%m-%d")
+        if isinstance(valor, float) and valor.is_integer():
+            return str(int(valor))
+        return str(valor).strip()
+
+    @classmethod
+    def leer_filas(cls, archivo):
+        """Recorre el archivo y devuelve (encabezados, iterador de (nro_fila, valores))"""
+        if archivo.lower().endswith((".xlsx", ".xlsm")):
+            import openpyxl
+            libro = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+            filas = libro.active.iter_rows(values_only=True)
+
+            def generar():
+                try:
+                    for numero, fila in enumerate(filas, start=2):
+                        yield numero, [cls._celda(v) for v in fila]
+                finally:
+                    libro.close()
+        else:
+            f = open(archivo, newline="", encoding="utf-8-sig")
+            # Separador: el más frecuente en la línea de encabezados (Excel en
+            # español suele guardar con ';')
+            primera = f.readline()
+            f.seek(0)
+            separador = max(",;\t", key=primera.count)
+            filas = csv.reader(f, delimiter=separador)
+
+            def generar():
+                try:
+                    for numero, fila in enumerate(filas, start=2):
+                        yield numero, [cls._celda(v) for v in fila]
+                finally:
+                    f.close()
+
+        lector = generar()
+        try:
+            _, encabezados = next(lector)
+        except StopIteration:
+            raise ValueError("El archivo está vacío")
+        return encabezados, lector
+
+    @classmethod
+    def _mapear_columnas(cls, encabezados, columnas, obligatorias):
+        """Devuelve {campo: índice de columna}; falla si falta una obligatoria"""
+        normalizados = [cls._normalizar(e) for e in encabezados]
+        indices = {}
+        for campo, alias in columnas.items():
+            for nombre in alias:
+                if nombre in normalizados:
+                    indices[campo] = normalizados.index(nombre)
+                    break
+        faltantes = [c for c in obligatorias if c not in indices]
+        if faltantes:
+            raise ValueError("Faltan columnas obligatorias: " + ", ".join(faltantes))
+        return indices
+
+    @staticmethod
+    def _lotes(lector, indices, tam_lote):
+        """Agrupa las filas no vacías en lotes de dicts campo -> valor"""
+        lote = []
+        for numero, valores in lector:
+            if not any(valores):
+                continue
+            lote.append((numero, {campo: valores[i] if i < len(valores) else ""
+                                  for campo, i in indices.items()}))
+            if len(lote) >= tam_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    @classmethod
+    def _fecha(cls, texto):
+        if not texto:
+            return datetime.now().strftime("%Y-%m-%d")
+        for formato in cls.FORMATOS_FECHA:
+            try:
+                return datetime.strptime(texto[:10], formato).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        raise ValueError(f"Fecha inválida: {texto}")
+
+    def _resolver(self, catalogo, nombre, resultado, crear, id_marca=None):
+        """ID de catálogo por nombre (sin distinguir mayúsculas ni acentos)"""
+        clave = (catalogo, id_marca)
+        if clave not in self._mapas:
+            self._mapas[clave] = {self._normalizar(n): i for n, i
+                                  in self.db._catalogo(catalogo, id_marca)[1].items()}
+        mapa = self._mapas[clave]
+        normalizado = self._normalizar(nombre)
+        if normalizado in mapa:
+            return mapa[normalizado]
+        if not crear:
+            raise LookupError(f"{catalogo}: '{nombre}' no existe")
+
+        if resultado.simulacion:
+            nuevo_id = -len(resultado.creados) - 1   # provisorio, no se inserta
+        elif catalogo == 'tipos_equipo':
+            nuevo_id = self.db.agregar_tipo_equipo(nombre, self.usuario_id)
+        elif catalogo == 'marcas':
+            nuevo_id = self.db.agregar_marca(nombre, self.usuario_id)
+        else:
+            nuevo_id = self.db.agregar_modelo(id_marca, nombre, self.usuario_id)
+        resultado.creados.append((catalogo, nombre))
+        mapa[normalizado] = nuevo_id
+        return nuevo_id
+
+    def importar_equipos(self, archivo, simulacion=False, crear_catalogos=False,
+                         tam_lote=None, tarea=None):
+        """Importa equipos; devuelve un ResultadoImportacion"""
+        resultado = ResultadoImportacion(simulacion)
+        encabezados, lector = self.leer_filas(archivo)
+        indices = self._mapear_columnas(encabezados, self.COLUMNAS_EQUIPOS,
+                                        self.OBLIGATORIAS_EQUIPOS)
+        self._mapas = {}
+        series_vistas = set()
+
+        for lote in self._lotes(lector, indices, tam_lote or Config.IMPORT_BATCH_SIZE):
+            if tarea:
+                tarea.comprobar()
+            resultado.leidas += len(lote)
+            existentes = self.db.equipos_por_serie([v.get('serie', '') for _, v in lote])
+
+            validas = []
+            for numero, v in lote:
+                serie = v.get('serie', '')
+                try:
+                    faltantes = [c for c in self.OBLIGATORIAS_EQUIPOS if not v.get(c)]
+                    if faltantes:
+                        raise ValueError("Faltan datos: " + ", ".join(faltantes))
+                    if serie in existentes:
+                        raise ValueError(f"La serie ya existe (equipo ID {existentes[serie][0]})")
+                    if serie in series_vistas:
+                        raise ValueError("Serie repetida en el archivo")
+                    estado = v.get('estado') or "En reparación"
+                    if estado not in self.ESTADOS:
+                        raise ValueError(f"Estado inválido: {estado}")
+                    fecha_ingreso = self._fecha(v.get('fecha_ingreso'))
+
+                    # Los catálogos se resuelven (y con crear_catalogos se crean)
+                    # solo cuando el resto de la fila ya es válido
+                    tipo_id = self._resolver('tipos_equipo', v['tipo'], resultado, crear_catalogos)
+                    marca_id = self._resolver('marcas', v['marca'], resultado, crear_catalogos)
+                    modelo_id = self._resolver('modelos', v['modelo'], resultado, crear_catalogos,
+                                               marca_id)
+                    validas.append((numero, (v['pj'], tipo_id, serie, marca_id, modelo_id,
+                                    v.get('ubicacion') or None, fecha_ingreso,
+                                    None, v['falla'], estado, v.get('observaciones') or None)))
+                    series_vistas.add(serie)
+                except (ValueError, LookupError) as e:
+                    resultado.error(numero, serie, str(e))
+
+            if validas and not simulacion:
+                try:
+                    self._insertar_equipos([fila for _, fila in validas])
+                except sqlite3.IntegrityError:
+                    # Alguna serie se ingresó mientras tanto: aislar las filas en conflicto
+                    validas = self._insertar_equipos_por_fila(validas, resultado)
+            resultado.insertadas += len(validas)
+            if tarea:
+                tarea.progreso(resultado.leidas, None,
+                               f"{resultado.leidas} filas procesadas, {len(resultado.errores)} con errores")
+
+        log_export.info(f"Importación de equipos {'(simulación) ' if simulacion else ''}"
+                     f"desde {archivo}: {resultado.insertadas} de {resultado.leidas} filas")
+        return resultado
+
+    def _insertar_equipos(self, filas):
+        with self.db.transaction():
+            self.db.cursor.executemany(
+                '''INSERT INTO equipos
+                (pj, id_tipo_equipo, serie, id_marca, id_modelo, ubicacion,
+                 fecha_ingreso, fecha_salida, falla, estado, observaciones)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', filas)
+            ids = self.db.equipos_por_serie([f[2] for f in filas])
+            self.db.registrar_auditoria_lote(
+                (self.usuario_id, 'ALTA_EQUIPO', 'equipos', ids[f[2]][0],
+                 f"Equipo importado: {f[2]} (PJ: {f[0]})") for f in filas)
+
+    def _insertar_equipos_por_fila(self, validas, resultado):
+        """Inserta fila por fila (un savepoint cada una) y devuelve las insertadas"""
+        insertadas = []
+        with self.db.transaction():
+            for numero, fila in validas:
+                try:
+                    self._insertar_equipos([fila])
+                    insertadas.append((numero, fila))
+                except sqlite3.IntegrityError as e:
+                    resultado.error(numero, fila[2], f"No se pudo insertar: {e}")
+        return insertadas
+
+    def importar_repuestos(self, archivo, simulacion=False, tam_lote=None, tarea=None):
+        """Importa repuestos de equipos identificados por serie"""
+        resultado = ResultadoImportacion(simulacion)
+        encabezados, lector = self.leer_filas(archivo)
+        indices = self._mapear_columnas(encabezados, self.COLUMNAS_REPUESTOS,
+                                        self.OBLIGATORIAS_REPUESTOS)
+
+        for lote in self._lotes(lector, indices, tam_lote or Config.IMPORT_BATCH_SIZE):
+            if tarea:
+                tarea.comprobar()
+            resultado.leidas += len(lote)
+            equipos = self.db.equipos_por_serie([v.get('serie', '') for _, v in lote])
+
+            validas = []
+            for numero, v in lote:
+                serie = v.get('serie', '')
+                try:
+                    faltantes = [c for c in self.OBLIGATORIAS_REPUESTOS if not v.get(c)]
+                    if faltantes:
+                        raise ValueError("Faltan datos: " + ", ".join(faltantes))
+                    if serie not in equipos:
+                        raise ValueError("No existe un equipo con esa serie")
+                    equipo_id, estado = equipos[serie]
+                    if estado == "Reparado":
+                        raise ValueError("No se pueden agregar repuestos a equipos ya reparados")
+                    cantidad = float(v['cantidad'].replace(",", "."))
+                    if not cantidad.is_integer():
+                        raise ValueError("La cantidad debe ser un número entero")
+                    cantidad = int(cantidad)
+                    costo = float(v['costo'].replace(",", ".")) if v.get('costo') else None
+                    if cantidad <= 0:
+                        raise ValueError("La cantidad debe ser mayor a 0")
+                    if costo is not None and costo < 0:
+                        raise ValueError("El costo no puede ser negativo")
+                    validas.append((equipo_id, v['nombre'], cantidad, costo))
+                except ValueError as e:
+                    resultado.error(numero, serie, str(e))
+
+            if validas and not simulacion:
+                with self.db.transaction():
+                    self.db.cursor.executemany(
+                        "INSERT INTO repuestos (id_equipo, nombre, cantidad, costo) VALUES (?, ?, ?, ?)",
+                        validas)
+                    self.db.registrar_auditoria_lote(
+                        (self.usuario_id, 'IMPORTAR_REPUESTO', 'equipos', equipo_id,
+                         f"Repuesto importado: {nombre} (Cant: {cantidad}, Costo: {costo})")
+                        for equipo_id, nombre, cantidad, costo in validas)
+            resultado.insertadas += len(validas)
+            if tarea:
+                tarea.progreso(resultado.leidas, None,
+                               f"{resultado.leidas} filas procesadas, {len(resultado.errores)} con errores")
+
+        log_export.info(f"Importación de repuestos {'(simulación) ' if simulacion else ''}"
+                     f"desde {archivo}: {resultado.insertadas} de {resultado.leidas} filas")
+        return resultado
+
+
 class ExportManager:
     """Manejador de exportación a diferentes formatos"""
 
@@ -6180,11 +9525,98 @@ class ExportManager:
         # Limitar longitud
         return sanitized[:31]
 
+    # Caracteres de control que no admite el XML de Word
+    _XML_INVALIDO = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+    @staticmethod
+    def _tabla_word(doc, encabezados, filas, style='Light Shading Accent 1', autofit=None, tarea=None):
+        """Agrega a doc una tabla con encabezados en negrita y filas centradas.
+
+        En lugar de table.add_row().cells por cada fila (que recorre el XML de
+        la tabla en cada acceso), se da formato a una fila plantilla, se clona
+        su XML para cada fila de datos y todas se anexan a la tabla de una vez.
+        Con tarea, cada fila es un punto de cancelación.
+        """
+        import copy
+        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT as WD_ALIGN
+        from docx.oxml import OxmlElement
+        from docx.oxml.ns import qn
+
+        table = doc.add_table(rows=2, cols=len(encabezados))
+        table.style = style
+        if autofit is not None:
+            table.autofit = autofit
+
+        # Encabezados (pocas celdas: se usa la API normal)
+        for cell, header in zip(table.rows[0].cells, encabezados):
+            cell.text = str(header)
+            cell.paragraphs[0].runs[0].font.bold = True
+            cell.paragraphs[0].alignment = WD_ALIGN.CENTER
+
+        # Fila plantilla con el formato de las celdas de datos
+        for cell in table.rows[1].cells:
+            cell.paragraphs[0].alignment = WD_ALIGN.CENTER
+        plantilla = table.rows[1]._tr
+        tbl = plantilla.getparent()
+        tbl.remove(plantilla)
+
+        tag_tc, tag_p, tag_space = qn('w:tc'), qn('w:p'), qn('xml:space')
+        nuevas = []
+        for fila in filas:
+            if tarea is not None:
+                tarea.comprobar()
+            tr = copy.deepcopy(plantilla)
+            for tc, valor in zip(tr.iterchildren(tag_tc), fila):
+                texto = "" if valor is None else ExportManager._XML_INVALIDO.sub("", str(valor))
+                if not texto:
+                    continue
+                run = OxmlElement('w:r')
+                t = OxmlElement('w:t')
+                t.text = texto
+                t.set(tag_space, 'preserve')
+                run.append(t)
+                tc.find(tag_p).append(run)
+            nuevas.append(tr)
+
+        tbl.extend(nuevas)
+        return table
+
     @staticmethod
-    def export_to_pdf(data, filename, title="Reporte"):
-        """Exporta datos a un archivo PDF"""
+    def _anchos_columnas_pdf(headers, rows, ancho_disponible):
+        """Calcula anchos fijos proporcionales al largo del texto (muestra de filas)"""
+        muestra = rows[:Config.PDF_OPTIONS['sample_rows']]
+        largos = []
+        for i, header in enumerate(headers):
+            largo = max([len(str(header))] +
+                        [len(str(row[i])) for row in muestra if i < len(row)])
+            largos.append(min(max(largo, 4), 40))
+        total = sum(largos)
+        return [ancho_disponible * largo / total for largo in largos]
+
+    @staticmethod
+    def export_to_pdf(data, filename, title="Reporte", horizontal=False, tarea=None):
+        """Exporta datos a un archivo PDF.
+
+        Las filas se dividen en tablas de tamaño fijo (chunk_rows) que repiten
+        el encabezado, con anchos de columna y altos de fila precalculados, de
+        modo que reportlab no mide una única tabla gigante. El texto que no
+        entra en su columna se parte en varias líneas (la fila crece), nunca
+        se recorta. horizontal=True usa la página apaisada (p. ej. para el
+        reporte de equipos de 9 columnas).
+        """
+        from reportlab.lib.pagesizes import landscape
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib.utils import simpleSplit
+        from reportlab.lib import colors
+
         try:
-            doc = SimpleDocTemplate(filename, pagesize=Config.PDF_OPTIONS['pagesize'])
+            opciones = Config.PDF_OPTIONS
+            pagesize = landscape(opciones['pagesize']) if horizontal else opciones['pagesize']
+            margen_izq, margen_der, margen_sup, margen_inf = opciones['margins']
+            doc = SimpleDocTemplate(filename, pagesize=pagesize,
+                                    leftMargin=margen_izq, rightMargin=margen_der,
+                                    topMargin=margen_sup, bottomMargin=margen_inf)
             elements = []
             
             styles = getSampleStyleSheet()
@@ -6201,37 +9633,81 @@ class ExportManager:
                     headers = data[0]
                     rows = data[1:]
                 
-                table_data = [headers] + rows
-                t = Table(table_data)
+                font_size = opciones['font_size']
+                col_widths = ExportManager._anchos_columnas_pdf(
+                    headers, rows, pagesize[0] - margen_izq - margen_der)
                 
-                # Estilo de tabla
-                t.setStyle(TableStyle([
+                # Estilo compartido por todas las tablas
+                estilo = TableStyle([
                     ('BACKGROUND', (0,0), (-1,0), colors.grey),
                     ('TEXTCOLOR', (0,0), (-1,0), colors.whitesmoke),
                     ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
                     ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0,0), (-1,0), 12),
-                    ('BOTTOMPADDING', (0,0), (-1,0), 12),
-                    ('BACKGROUND', (0,1), (-1,-1), colors.beige),
-                    ('GRID', (0,0), (-1,-1), 1, colors.black)
-                ]))
+                    ('FONTSIZE', (0,0), (-1,0), opciones['header_font_size']),
+                    ('LEADING', (0,0), (-1,0), opciones['header_font_size'] + 2),
+                    ('FONTSIZE', (0,1), (-1,-1), font_size),
+                    ('LEADING', (0,1), (-1,-1), font_size + 2),
+                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.beige]),
+                    ('GRID', (0,0), (-1,-1), 0.5, colors.black)
+                ])
                 
-                elements.append(t)
-            
-            doc.build(elements)
+                # Ancho útil de cada columna (Table usa 6 pt de relleno por lado)
+                utiles = [ancho - 12 for ancho in col_widths]
+                partidos = {}  # (columna, texto) -> texto en líneas; los valores se repiten mucho
+                
+                def fila_pdf(valores, fuente, tamaño):
+                    """Celdas de la fila (el texto largo partido en líneas) y su alto"""
+                    celdas, lineas = [], 1
+                    for col, valor in enumerate(valores):
+                        texto = "" if valor is None else str(valor)
+                        clave = (col, texto)
+                        if clave not in partidos:
+                            partes = simpleSplit(texto, fuente, tamaño, utiles[col]) if texto else []
+                            partidos[clave] = ("\n".join(partes), max(len(partes), 1))
+                        texto, n = partidos[clave]
+                        celdas.append(texto)
+                        lineas = max(lineas, n)
+                    return celdas, lineas * (tamaño + 2) + 6  # relleno superior e inferior
+                
+                encabezado, alto_encabezado = fila_pdf(
+                    headers, 'Helvetica-Bold', opciones['header_font_size'])
+                chunk = opciones['chunk_rows']
+                for inicio in range(0, max(len(rows), 1), chunk):
+                    if tarea is not None:
+                        tarea.comprobar()
+                    table_data, altos = [encabezado], [alto_encabezado]
+                    for row in rows[inicio:inicio + chunk]:
+                        celdas, alto = fila_pdf(row, 'Helvetica', font_size)
+                        table_data.append(celdas)
+                        altos.append(alto)
+                    t = Table(table_data, colWidths=col_widths, rowHeights=altos, repeatRows=1)
+                    t.setStyle(estilo)
+                    elements.append(t)
+            
+            if tarea is not None:
+                # reportlab escribe el archivo al final de build
+                doc.build(elements, onFirstPage=lambda c, d: tarea.comprobar(),
+                          onLaterPages=lambda c, d: tarea.comprobar())
+            else:
+                doc.build(elements)
             return True
+        except TareaCancelada:
+            log_export.info(f"Exportación a PDF cancelada: {filename}")
+            raise
         except Exception as e:
-            logging.error(f"Error exportando a PDF: {e}")
+            log_export.error(f"Error exportando a PDF: {e}")
             return False
     
     @staticmethod
 
-    def export_to_word(data, filename, title="Reporte", subtitle=""):
+    def export_to_word(data, filename, title="Reporte", subtitle="", tarea=None):
         """Exporta datos a Word con formato profesional para el Poder Judicial"""
         try:
             from docx import Document
             from docx.shared import Inches, Pt
             from docx.enum.text import WD_PARAGRAPH_ALIGNMENT as WD_ALIGN
+            from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
             import os
 
             # Crear documento
@@ -6299,22 +9775,8 @@ class ExportManager:
 
             # --- Tabla de datos ---
             if data and len(data) > 1:
-                table = doc.add_table(rows=1, cols=len(data[0]))
-                table.style = 'Light Shading Accent 1'  # Estilo profesional
-            
-                # Encabezados
-                hdr_cells = table.rows[0].cells
-                for i, header in enumerate(data[0]):
-                    hdr_cells[i].text = str(header)
-                    hdr_cells[i].paragraphs[0].runs[0].font.bold = True
-                    hdr_cells[i].paragraphs[0].alignment = WD_ALIGN.CENTER
-
-                # Datos
-                for row in data[1:]:
-                    row_cells = table.add_row().cells
-                    for i, cell_value in enumerate(row):
-                        row_cells[i].text = str(cell_value)
-                        row_cells[i].paragraphs[0].alignment = WD_ALIGN.CENTER
+                # Estilo profesional; filas generadas en bloque
+                ExportManager._tabla_word(doc, data[0], data[1:], tarea=tarea)
 
             # --- Pie de página ---
             doc.add_page_break()  # Opcional: nueva página para el pie
@@ -6324,41 +9786,46 @@ class ExportManager:
             footer_para.alignment = WD_ALIGN.RIGHT
 
             # Guardar
+            if tarea is not None:
+                tarea.comprobar()
             doc.save(filename)
             return True
 
+        except TareaCancelada:
+            log_export.info(f"Exportación a Word cancelada: {filename}")
+            raise
         except Exception as e:
-            logging.error(f"Error al exportar a Word: {str(e)}", exc_info=True)
+            log_export.error(f"Error al exportar a Word: {str(e)}", exc_info=True)
             return False
 
    
         
     @staticmethod
-    def export_to_excel(data, filename, title="Reporte", sheet_name="Datos"):
+    def export_to_excel(data, filename, title="Reporte", sheet_name="Datos", tarea=None):
         """Exporta datos a Excel con manejo robusto de errores"""
         try:
             # Validaciones iniciales
             if not data:
-                logging.error("Intento de exportar datos vacíos a Excel")
+                log_export.error("Intento de exportar datos vacíos a Excel")
                 return False
 
             # Sanitizar nombre de hoja
             sheet_name = ExportManager._sanitize_sheet_name(sheet_name)
             if not sheet_name.strip():
                 sheet_name = "Datos"
-                logging.warning("Usando nombre de hoja por defecto")
+                log_export.warning("Usando nombre de hoja por defecto")
 
-            # Convertir datos a DataFrame
-            if isinstance(data[0], dict):
-                df = pd.DataFrame(data)
-            else:
+            # Listas de filas: escribir por streaming sin armar un DataFrame
+            if not isinstance(data[0], dict):
                 if len(data) < 2:
-                    logging.error("Solo encabezados sin datos")
+                    log_export.error("Solo encabezados sin datos")
                     return False
-            
-                headers = data[0]
-                rows = data[1:]
-                df = pd.DataFrame(rows, columns=headers)
+                return ExportManager.export_to_excel_stream(
+                    iter(data[1:]), data[0], filename, title, sheet_name, tarea=tarea)
+
+            # Convertir datos a DataFrame
+            import pandas as pd
+            df = pd.DataFrame(data)
 
             # Crear escritor Excel
             writer = pd.ExcelWriter(
@@ -6405,12 +9872,86 @@ class ExportManager:
                 )) + 2
                 worksheet.set_column(i, i, min(max_len, 50))
 
-            # Guardar
+            # Guardar (xlsxwriter escribe el archivo al cerrar)
+            if tarea is not None:
+                tarea.comprobar()
             writer.close()
             return True
 
+        except TareaCancelada:
+            log_export.info(f"Exportación a Excel cancelada: {filename}")
+            raise
+        except Exception as e:
+            log_export.error(f"Error exportando a Excel: {e}")
+            return False
+
+    @staticmethod
+    def export_to_excel_stream(rows, headers, filename, title="Reporte", sheet_name="Datos", tarea=None):
+        """Exporta a Excel escribiendo fila por fila desde un iterador (p. ej. un cursor).
+
+        Usa el modo constant_memory de xlsxwriter, por lo que la memoria no
+        depende de la cantidad de filas; los anchos de columna se calculan
+        mientras se escribe. Con tarea, cada fila es un punto de cancelación
+        y el libro no llega a cerrarse (ni a escribirse).
+        """
+        import xlsxwriter
+
+        try:
+            sheet_name = ExportManager._sanitize_sheet_name(sheet_name)
+            if not sheet_name.strip():
+                sheet_name = "Datos"
+                log_export.warning("Usando nombre de hoja por defecto")
+
+            workbook = xlsxwriter.Workbook(filename, {'constant_memory': True})
+            worksheet = workbook.add_worksheet(sheet_name)
+
+            title_format = workbook.add_format({
+                'bold': True,
+                'size': 14,
+                'align': 'center',
+                'valign': 'vcenter'
+            })
+            header_format = workbook.add_format({'bold': True, 'border': 1})
+            date_format = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+
+            # En constant_memory las filas deben escribirse en orden:
+            # título (fila 0), encabezados (fila 1) y luego los datos
+            if len(headers) > 1:
+                worksheet.merge_range(0, 0, 0, len(headers) - 1, title, title_format)
+            else:
+                worksheet.write(0, 0, title, title_format)
+            worksheet.write_row(1, 0, headers, header_format)
+
+            anchos = [len(str(h)) for h in headers]
+            fila = 2
+            for row in rows:
+                if tarea is not None:
+                    tarea.comprobar()
+                for col, valor in enumerate(row):
+                    if valor is None:
+                        continue
+                    if isinstance(valor, datetime):
+                        worksheet.write_datetime(fila, col, valor, date_format)
+                        largo = 10
+                    else:
+                        worksheet.write(fila, col, valor)
+                        largo = len(str(valor))
+                    if col < len(anchos) and largo > anchos[col]:
+                        anchos[col] = largo
+                fila += 1
+
+            for col, ancho in enumerate(anchos):
+                worksheet.set_column(col, col, min(ancho + 2, Config.EXCEL_MAX_COL_WIDTH))
+
+            workbook.close()
+            log_export.info(f"Excel exportado por streaming: {fila - 2} filas en {filename}")
+            return True
+
+        except TareaCancelada:
+            log_export.info(f"Exportación a Excel cancelada: {filename}")
+            raise
         except Exception as e:
-            logging.error(f"Error exportando a Excel: {e}")
+            log_export.error(f"Error exportando a Excel (streaming): {e}")
             return False
 
 
@@ -6450,7 +9991,7 @@ class ExportManager:
                     header.add_run().add_picture(logo_path, width=Inches(0.7))
                     header.add_run().add_break()
             except Exception as e:
-                logging.warning(f"No se pudo agregar logo: {e}")
+                log_export.warning(f"No se pudo agregar logo: {e}")
             
             # Títulos institucionales
             titles = doc.add_paragraph()
@@ -6539,344 +10080,124 @@ class ExportManager:
             return True
             
         except Exception as e:
-            logging.error(f"Error al generar informe técnico: {str(e)}", exc_info=True)
+            log_export.error(f"Error al generar informe técnico: {str(e)}", exc_info=True)
             return False
 
+    @staticmethod
+    def export_informe_toner(data, filename, tarea=None):
+        """Exporta un informe de toner a Word con formato profesional.
 
-
-@staticmethod
-def export_informe_toner(data, filename):
-    """Exporta un informe de toner a Word con formato profesional"""
-    try:
-        from docx import Document
-        from docx.shared import Inches, Pt
-        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT as WD_ALIGN
-        from docx.enum.table import WD_TABLE_ALIGNMENT
-        
-        # Crear documento
-        doc = Document()
-        
-        # Configurar márgenes
-        section = doc.sections[0]
-        section.top_margin = Inches(0.5)
-        section.bottom_margin = Inches(0.5)
-        section.left_margin = Inches(0.5)
-        section.right_margin = Inches(0.5)
-        
-        # Encabezado con logo institucional
-        header = doc.add_paragraph()
-        header.alignment = WD_ALIGN.CENTER
-        
-        # Intentar agregar logo (si existe)
+        data trae titulo, subtitulo, encabezados, datos y resumen (filas de tres
+        columnas, con encabezados_resumen opcionales); con tarea, las filas de
+        las tablas son puntos de cancelación y el archivo no llega a guardarse.
+        """
         try:
-            logo_path = None
-            possible_paths = ['logo_pj.png', 'media/logo_pj.png']
-            for path in possible_paths:
-                if os.path.exists(path):
-                    logo_path = path
-                    break
-            
-            if logo_path:
-                header.add_run().add_picture(logo_path, width=Inches(0.7))
-                header.add_run().add_break()
-        except Exception as e:
-            logging.warning(f"No se pudo agregar logo: {e}")
-        
-        # Títulos institucionales
-        titles = doc.add_paragraph()
-        titles.alignment = WD_ALIGN.CENTER
-        
-        # Línea 1 - PODER JUDICIAL
-        line1 = titles.add_run("PODER JUDICIAL DE LA PROVINCIA DE JUJUY\n")
-        line1.font.size = Pt(14)
-        line1.font.bold = True
-        
-        # Línea 2 - DEPARTAMENTO
-        line2 = titles.add_run("DEPARTAMENTO DE SISTEMAS Y TECNOLOGÍA DE LA INFORMACIÓN\n")
-        line2.font.size = Pt(12)
-        line2.font.bold = True
-        
-        # Línea 3 - Dirección
-        line3 = titles.add_run("Argañaraz esq. Independencia -- San Salvador de Jujuy\n\n")
-        line3.font.size = Pt(10)
-        line3.font.bold = False
-        
-        # Título del informe
-        title = doc.add_paragraph(data['titulo'])
-        title.alignment = WD_ALIGN.CENTER
-        title.runs[0].font.size = Pt(14)
-        title.runs[0].font.bold = True
-        
-        # Subtítulo
-        if data.get('subtitulo'):
-            subtitle = doc.add_paragraph(data['subtitulo'])
-            subtitle.alignment = WD_ALIGN.CENTER
-            subtitle.runs[0].italic = True
-            doc.add_paragraph()
-        
-        # Fecha de generación
-        fecha_gen = doc.add_paragraph()
-        fecha_gen.alignment = WD_ALIGN.RIGHT
-        fecha_gen.add_run(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-        
-        # Tabla de datos principales
-        if data['datos']:
-            doc.add_paragraph("\nDatos Detallados:", style='Heading 2')
-            
-            table = doc.add_table(rows=1, cols=len(data['encabezados']), style='Light Shading Accent 1')
-            table.autofit = True
-            
-            # Encabezados
-            hdr_cells = table.rows[0].cells
-            for i, header in enumerate(data['encabezados']):
-                hdr_cells[i].text = header
-                hdr_cells[i].paragraphs[0].runs[0].font.bold = True
-                hdr_cells[i].paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-            
-            # Datos
-            for row in data['datos']:
-                row_cells = table.add_row().cells
-                for i, value in enumerate(row):
-                    row_cells[i].text = str(value)
-                    row_cells[i].paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        # Resumen
-        if data.get('resumen'):
-            doc.add_paragraph("\nResumen:", style='Heading 2')
-            
-            if isinstance(data['resumen'][0], tuple) and len(data['resumen'][0]) == 3:
-                # Resumen de consumos (marca, modelo, cantidad)
-                resumen_table = doc.add_table(rows=1, cols=3, style='Light Shading Accent 1')
-                resumen_table.autofit = True
-                
-                # Encabezados
-                hdr_cells = resumen_table.rows[0].cells
-                hdr_cells[0].text = "Marca"
-                hdr_cells[1].text = "Modelo"
-                hdr_cells[2].text = "Cantidad Total"
-                
-                for cell in hdr_cells:
-                    cell.paragraphs[0].runs[0].font.bold = True
-                    cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-                
-                # Datos
-                for item in data['resumen']:
-                    row_cells = resumen_table.add_row().cells
-                    row_cells[0].text = item[0]
-                    row_cells[1].text = item[1]
-                    row_cells[2].text = str(item[2])
-                    
-                    for cell in row_cells:
-                        cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-            
-            elif isinstance(data['resumen'][0], tuple) and len(data['resumen'][0]) == 3:
-                # Resumen de recargas (empresa, estado, cantidad)
-                resumen_table = doc.add_table(rows=1, cols=3, style='Light Shading Accent 1')
-                resumen_table.autofit = True
-                
-                # Encabezados
-                hdr_cells = resumen_table.rows[0].cells
-                hdr_cells[0].text = "Empresa"
-                hdr_cells[1].text = "Estado"
-                hdr_cells[2].text = "Cantidad Total"
-                
-                for cell in hdr_cells:
-                    cell.paragraphs[0].runs[0].font.bold = True
-                    cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-                
-                # Datos
-                for item in data['resumen']:
-                    row_cells = resumen_table.add_row().cells
-                    row_cells[0].text = item[0]
-                    row_cells[1].text = item[1]
-                    row_cells[2].text = str(item[2])
-                    
-                    for cell in row_cells:
-                        cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        # Pie de página
-        doc.add_page_break()
-        footer = doc.sections[0].footer
-        footer_para = footer.paragraphs[0]
-        footer_para.text = f"Documento generado automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}"
-        footer_para.alignment = WD_ALIGN.RIGHT
-        
-        # Guardar
-        doc.save(filename)
-        return True
-    except Exception as e:
-        logging.error(f"Error al exportar informe de toner: {str(e)}", exc_info=True)
-        return False
+            from docx import Document
+            from docx.shared import Inches, Pt
+            from docx.enum.text import WD_PARAGRAPH_ALIGNMENT as WD_ALIGN
+            from docx.enum.table import WD_TABLE_ALIGNMENT
 
+            # Crear documento
+            doc = Document()
 
-@staticmethod
-def export_informe_toner(data, filename):
-    """Exporta un informe de toner a Word con formato profesional"""
-    try:
-        from docx import Document
-        from docx.shared import Inches, Pt
-        from docx.enum.text import WD_PARAGRAPH_ALIGNMENT as WD_ALIGN
-        from docx.enum.table import WD_TABLE_ALIGNMENT
-        
-        # Crear documento
-        doc = Document()
-        
-        # Configurar márgenes
-        section = doc.sections[0]
-        section.top_margin = Inches(0.5)
-        section.bottom_margin = Inches(0.5)
-        section.left_margin = Inches(0.5)
-        section.right_margin = Inches(0.5)
-        
-        # Encabezado con logo institucional
-        header = doc.add_paragraph()
-        header.alignment = WD_ALIGN.CENTER
-        
-        # Intentar agregar logo (si existe)
-        try:
-            logo_path = None
-            possible_paths = ['logo_pj.png', 'media/logo_pj.png']
-            for path in possible_paths:
-                if os.path.exists(path):
-                    logo_path = path
-                    break
-            
-            if logo_path:
-                header.add_run().add_picture(logo_path, width=Inches(0.7))
-                header.add_run().add_break()
-        except Exception as e:
-            logging.warning(f"No se pudo agregar logo: {e}")
-        
-        # Títulos institucionales
-        titles = doc.add_paragraph()
-        titles.alignment = WD_ALIGN.CENTER
-        
-        # Línea 1 - PODER JUDICIAL
-        line1 = titles.add_run("PODER JUDICIAL DE LA PROVINCIA DE JUJUY\n")
-        line1.font.size = Pt(14)
-        line1.font.bold = True
-        
-        # Línea 2 - DEPARTAMENTO
-        line2 = titles.add_run("DEPARTAMENTO DE SISTEMAS Y TECNOLOGÍA DE LA INFORMACIÓN\n")
-        line2.font.size = Pt(12)
-        line2.font.bold = True
-        
-        # Línea 3 - Dirección
-        line3 = titles.add_run("Argañaraz esq. Independencia -- San Salvador de Jujuy\n\n")
-        line3.font.size = Pt(10)
-        line3.font.bold = False
-        
-        # Título del informe
-        title = doc.add_paragraph(data['titulo'])
-        title.alignment = WD_ALIGN.CENTER
-        title.runs[0].font.size = Pt(14)
-        title.runs[0].font.bold = True
-        
-        # Subtítulo
-        if data.get('subtitulo'):
-            subtitle = doc.add_paragraph(data['subtitulo'])
-            subtitle.alignment = WD_ALIGN.CENTER
-            subtitle.runs[0].italic = True
-            doc.add_paragraph()
-        
-        # Fecha de generación
-        fecha_gen = doc.add_paragraph()
-        fecha_gen.alignment = WD_ALIGN.RIGHT
-        fecha_gen.add_run(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
-        
-        # Tabla de datos principales
-        if data['datos']:
-            doc.add_paragraph("\nDatos Detallados:", style='Heading 2')
-            
-            table = doc.add_table(rows=1, cols=len(data['encabezados']), style='Light Shading Accent 1')
-            table.autofit = True
-            
-            # Encabezados
-            hdr_cells = table.rows[0].cells
-            for i, header in enumerate(data['encabezados']):
-                hdr_cells[i].text = header
-                hdr_cells[i].paragraphs[0].runs[0].font.bold = True
-                hdr_cells[i].paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-            
-            # Datos
-            for row in data['datos']:
-                row_cells = table.add_row().cells
-                for i, value in enumerate(row):
-                    row_cells[i].text = str(value)
-                    row_cells[i].paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        # Resumen
-        if data.get('resumen'):
-            doc.add_paragraph("\nResumen:", style='Heading 2')
-            
-            if isinstance(data['resumen'][0], tuple) and len(data['resumen'][0]) == 3:
-                # Resumen de consumos (marca, modelo, cantidad)
-                resumen_table = doc.add_table(rows=1, cols=3, style='Light Shading Accent 1')
-                resumen_table.autofit = True
-                
-                # Encabezados
-                hdr_cells = resumen_table.rows[0].cells
-                hdr_cells[0].text = "Marca"
-                hdr_cells[1].text = "Modelo"
-                hdr_cells[2].text = "Cantidad Total"
-                
-                for cell in hdr_cells:
-                    cell.paragraphs[0].runs[0].font.bold = True
-                    cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-                
-                # Datos
-                for item in data['resumen']:
-                    row_cells = resumen_table.add_row().cells
-                    row_cells[0].text = item[0]
-                    row_cells[1].text = item[1]
-                    row_cells[2].text = str(item[2])
-                    
-                    for cell in row_cells:
-                        cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-            
-            elif isinstance(data['resumen'][0], tuple) and len(data['resumen'][0]) == 3:
-                # Resumen de recargas (empresa, estado, cantidad)
-                resumen_table = doc.add_table(rows=1, cols=3, style='Light Shading Accent 1')
-                resumen_table.autofit = True
-                
-                # Encabezados
-                hdr_cells = resumen_table.rows[0].cells
-                hdr_cells[0].text = "Empresa"
-                hdr_cells[1].text = "Estado"
-                hdr_cells[2].text = "Cantidad Total"
-                
-                for cell in hdr_cells:
-                    cell.paragraphs[0].runs[0].font.bold = True
-                    cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-                
-                # Datos
-                for item in data['resumen']:
-                    row_cells = resumen_table.add_row().cells
-                    row_cells[0].text = item[0]
-                    row_cells[1].text = item[1]
-                    row_cells[2].text = str(item[2])
-                    
-                    for cell in row_cells:
-                        cell.paragraphs[0].alignment = WD_TABLE_ALIGNMENT.CENTER
-        
-        # Pie de página
-        doc.add_page_break()
-        footer = doc.sections[0].footer
-        footer_para = footer.paragraphs[0]
-        footer_para.text = f"Documento generado automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}"
-        footer_para.alignment = WD_ALIGN.RIGHT
-        
-        # Guardar
-        doc.save(filename)
-        return True
-    except Exception as e:
-        logging.error(f"Error al exportar informe de toner: {str(e)}", exc_info=True)
-        return False   
+            # Configurar márgenes
+            section = doc.sections[0]
+            section.top_margin = Inches(0.5)
+            section.bottom_margin = Inches(0.5)
+            section.left_margin = Inches(0.5)
+            section.right_margin = Inches(0.5)
 
+            # Encabezado con logo institucional
+            header = doc.add_paragraph()
+            header.alignment = WD_ALIGN.CENTER
 
-        
+            # Intentar agregar logo (si existe)
+            try:
+                logo_path = None
+                possible_paths = ['logo_pj.png', 'media/logo_pj.png']
+                for path in possible_paths:
+                    if os.path.exists(path):
+                        logo_path = path
+                        break
+
+                if logo_path:
+                    header.add_run().add_picture(logo_path, width=Inches(0.7))
+                    header.add_run().add_break()
+            except Exception as e:
+                log_export.warning(f"No se pudo agregar logo: {e}")
+
+            # Títulos institucionales
+            titles = doc.add_paragraph()
+            titles.alignment = WD_ALIGN.CENTER
+
+            # Línea 1 - PODER JUDICIAL
+            line1 = titles.add_run("PODER JUDICIAL DE LA PROVINCIA DE JUJUY\n")
+            line1.font.size = Pt(14)
+            line1.font.bold = True
+
+            # Línea 2 - DEPARTAMENTO
+            line2 = titles.add_run("DEPARTAMENTO DE SISTEMAS Y TECNOLOGÍA DE LA INFORMACIÓN\n")
+            line2.font.size = Pt(12)
+            line2.font.bold = True
+
+            # Línea 3 - Dirección
+            line3 = titles.add_run("Argañaraz esq. Independencia -- San Salvador de Jujuy\n\n")
+            line3.font.size = Pt(10)
+            line3.font.bold = False
+
+            # Título del informe
+            title = doc.add_paragraph(data['titulo'])
+            title.alignment = WD_ALIGN.CENTER
+            title.runs[0].font.size = Pt(14)
+            title.runs[0].font.bold = True
+
+            # Subtítulo
+            if data.get('subtitulo'):
+                subtitle = doc.add_paragraph(data['subtitulo'])
+                subtitle.alignment = WD_ALIGN.CENTER
+                subtitle.runs[0].italic = True
+                doc.add_paragraph()
+
+            # Fecha de generación
+            fecha_gen = doc.add_paragraph()
+            fecha_gen.alignment = WD_ALIGN.RIGHT
+            fecha_gen.add_run(f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
+
+            # Tabla de datos principales
+            if data['datos']:
+                doc.add_paragraph("\nDatos Detallados:", style='Heading 2')
+
+                ExportManager._tabla_word(doc, data['encabezados'], data['datos'], autofit=True,
+                                          tarea=tarea)
+
+            # Resumen
+            if data.get('resumen'):
+                doc.add_paragraph("\nResumen:", style='Heading 2')
+
+                # Consumos: (marca, modelo, cantidad); recargas: (empresa, estado, cantidad)
+                ExportManager._tabla_word(
+                    doc, data.get('encabezados_resumen', ["Marca", "Modelo", "Cantidad Total"]),
+                    data['resumen'], autofit=True, tarea=tarea)
+
+            # Pie de página
+            doc.add_page_break()
+            footer = doc.sections[0].footer
+            footer_para = footer.paragraphs[0]
+            footer_para.text = f"Documento generado automáticamente el {datetime.now().strftime('%d/%m/%Y a las %H:%M')}"
+            footer_para.alignment = WD_ALIGN.RIGHT
+
+            # Guardar
+            if tarea is not None:
+                tarea.comprobar()
+            doc.save(filename)
+            return True
+        except TareaCancelada:
+            log_export.info(f"Informe de toner cancelado: {filename}")
+            raise
+        except Exception as e:
+            log_export.error(f"Error al exportar informe de toner: {str(e)}", exc_info=True)
+            return False
 
-    
 
 if __name__ == "__main__":
     try:
@@ -6884,7 +10205,7 @@ if __name__ == "__main__":
         app = MainController(root)
         root.mainloop()
     except Exception as e:
-        logging.critical(f"Error crítico: {e}", exc_info=True)
+        log_ui.critical(f"Error crítico: {e}", exc_info=True)
         messagebox.showerror("Error", f"Error crítico: {str(e)}")
   
 